@@ -0,0 +1,226 @@
+import json
+import time
+import queue
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+import sys
+import yaml
+import numpy as np
+from pathlib import Path
+from sqlalchemy import create_engine
+from sqlalchemy.sql import text
+from models import Base
+from migrate import migrate
+from llm import LLM
+from fake_llm import FakeOpenAI
+from cli import NoteCLI
+from cache import content_hash
+from catalog import NoteCatalog
+from importer import Importer
+from database_client import DbClient
+from watcher import NoteHandler, Watcher
+
+# Benchmarks startup imports, import throughput, watcher event-to-database
+# latency, link search and tab completion on synthetic vaults. Runs against a scratch
+# database next to the configured one, with the fake OpenAI client, so no
+# API key is needed and runs are repeatable.
+# Usage: python bench.py [--sizes 1000 10000 100000] [--output bench.json]
+
+def make_vocabulary(rng: random.Random, size: int) -> list[str]:
+    syllables = [c + v for c in 'bcdfghklmnprstvz' for v in 'aeiou']
+    words = set()
+    while len(words) < size:
+        words.add(''.join(rng.choices(syllables, k=rng.randint(1, 4))))
+    return sorted(words)
+
+def generate_vault(root: Path, n_notes: int, seed: int = 0, folders: int = 20,
+                   links_per_note: int = 3, n_tags: int = 50) -> list[str]:
+    """Writes n_notes markdown notes with headings, wiki links and tags.
+
+    Word frequencies follow a Zipf distribution like natural text. Returns
+    the note names.
+    """
+    rng = random.Random(seed)
+    words = make_vocabulary(rng, 5000)
+    rng.shuffle(words)
+    weights = np.cumsum(1.0 / np.arange(1, len(words) + 1)).tolist()
+    names = [f'{rng.choice(words)}-{rng.choice(words)}-{i}' for i in range(n_notes)]
+    tags = [f'tag-{word}' for word in rng.sample(words, n_tags)]
+
+    for i, name in enumerate(names):
+        folder = root / f'folder-{i % folders}'
+        folder.mkdir(parents=True, exist_ok=True)
+        sections = []
+        for _ in range(rng.randint(1, 4)):
+            body = ' '.join(rng.choices(words, cum_weights=weights, k=rng.randint(40, 300)))
+            sections.append(f'## {rng.choice(words).title()}\n\n{body}')
+        links = ' '.join(f'[[{names[j]}]]' for j in rng.sample(range(n_notes), min(links_per_note, n_notes)))
+        note_tags = ' '.join(f'#{tag}' for tag in rng.sample(tags, 2))
+        content = f'# {name}\n\n{note_tags}\n\n' + '\n\n'.join(sections) + f'\n\nSee also {links}\n'
+        (folder / f'{name}.md').write_text(content, encoding='utf-8')
+    return names
+
+def reset_database(postgres: dict, database: str, quantization: str = None):
+    user, password, host = postgres['user'], postgres['password'], postgres['host']
+    admin = create_engine(f'postgresql://{user}:{password}@{host}/postgres', isolation_level='AUTOCOMMIT')
+    with admin.connect() as conn:
+        conn.execute(text(f'DROP DATABASE IF EXISTS {database}'))
+        conn.execute(text(f'CREATE DATABASE {database}'))
+    admin.dispose()
+
+    engine = create_engine(f'postgresql://{user}:{password}@{host}/{database}')
+    with engine.begin() as conn:
+        conn.execute(text('CREATE EXTENSION IF NOT EXISTS vector'))
+    Base.metadata.create_all(engine)
+    migrate(engine, quantization)
+    engine.dispose()
+
+def summarize(seconds: list[float]) -> dict:
+    if not seconds:
+        return {'count': 0}
+    ms = np.asarray(seconds) * 1000
+    return {'count': len(ms), 'p50_ms': float(np.percentile(ms, 50)), 'p95_ms': float(np.percentile(ms, 95)),
+            'p99_ms': float(np.percentile(ms, 99)), 'max_ms': float(ms.max())}
+
+def bench_import(db_client: DbClient, llm: LLM, root: Path, n_notes: int) -> dict:
+    start = time.perf_counter()
+    Importer(db_client, llm, queue.Queue()).run(str(root))
+    elapsed = time.perf_counter() - start
+    return {'seconds': elapsed, 'notes_per_second': n_notes / elapsed}
+
+def bench_watcher(db_client: DbClient, llm: LLM, root: Path, catalog: NoteCatalog,
+                  samples: int, timeout: float, batch_window: float) -> dict:
+    # Edits existing notes one at a time and waits until the new content hash
+    # is in the database, which covers debounce, batching, embedding and writes
+    handler = NoteHandler(db_client, llm, queue.Queue(), catalog, batch_window)
+    watcher = Watcher(handler, str(root))
+    watcher_thread = threading.Thread(target=watcher.run)
+    watcher_thread.daemon = True
+    watcher_thread.start()
+    time.sleep(1)
+
+    paths = sorted(root.rglob('*.md'))
+    latencies, missed = [], 0
+    for i, path in enumerate(random.Random(1).sample(paths, min(samples, len(paths)))):
+        content = path.read_text(encoding='utf-8') + f'\nEdited by benchmark run {i}.\n'
+        expected = content_hash(content)
+        start = time.perf_counter()
+        path.write_text(content, encoding='utf-8')
+        while db_client.get_content_hashes([str(path)]).get(str(path)) != expected:
+            if time.perf_counter() - start > timeout:
+                missed += 1
+                break
+            time.sleep(0.005)
+        else:
+            latencies.append(time.perf_counter() - start)
+
+    watcher.stop()
+    handler.close()
+    return {**summarize(latencies), 'missed': missed}
+
+def bench_link(db_client: DbClient, names: list[str], samples: int, n: int = 10) -> dict:
+    # The Postgres path of the link command: name lookup, then chunk search
+    latencies = []
+    for name in random.Random(2).sample(names, min(samples, len(names))):
+        start = time.perf_counter()
+        notes = db_client.get_notes_by_name(name)
+        if notes:
+            db_client.search_similar_to_note(notes[0].id, n)
+        latencies.append(time.perf_counter() - start)
+    return summarize(latencies)
+
+def bench_completion(cli: NoteCLI, names: list[str], samples: int) -> dict:
+    # Drives completion the way readline does, one state at a time until None
+    rng = random.Random(3)
+    latencies = []
+    for _ in range(samples):
+        name = rng.choice(names)
+        prefix = name[:rng.randint(1, min(4, len(name)))]
+        start = time.perf_counter()
+        state = 0
+        while cli.complete_note_name(prefix, state) is not None:
+            state += 1
+        latencies.append(time.perf_counter() - start)
+    return summarize(latencies)
+
+def bench_startup(runs: int = 5, top: int = 10) -> dict:
+    # Import profile of main.py in fresh interpreters; the prompt only
+    # appears after these imports, everything heavy should load later
+    wall, profile = [], {}
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import main'],
+                                cwd=Path(__file__).parent, capture_output=True, text=True)
+        wall.append(time.perf_counter() - start)
+        for line in result.stderr.splitlines():
+            # "import time: self [us] | cumulative | package", nested imports are
+            # indented two spaces per level; keep main and what it imports directly
+            parts = line.removeprefix('import time:').split('|')
+            if (len(parts) == 3 and parts[1].strip().isdigit()
+                    and len(parts[2]) - len(parts[2].lstrip()) <= 3):
+                profile.setdefault(parts[2].strip(), []).append(int(parts[1]) / 1000)
+    slowest = sorted(((float(np.median(ms)), module) for module, ms in profile.items()), reverse=True)
+    return {**summarize(wall),
+            'imports': [{'module': module, 'cumulative_ms': ms} for ms, module in slowest[:top]]}
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return ''
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark neonota on synthetic vaults')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--database', help='scratch database, dropped and recreated for every size')
+    parser.add_argument('--output', default='bench.json')
+    parser.add_argument('--samples', type=int, default=200, help='queries per latency benchmark')
+    parser.add_argument('--watch-samples', type=int, default=20)
+    parser.add_argument('--watch-timeout', type=float, default=10.0)
+    parser.add_argument('--latency', type=float, default=0.0, help='simulated seconds per API request')
+    parser.add_argument('--keep', action='store_true', help='keep the generated vaults')
+    args = parser.parse_args()
+
+    with open('config.yaml', 'r') as f:
+        config = yaml.safe_load(f)
+    postgres = config['postgres']
+    database = args.database or f"{postgres['database']}_bench"
+    quantization = config.get('storage', {}).get('quantization')
+    batch_window = config.get('watcher', {}).get('batch_window', 0.5)
+
+    results = {'commit': git_commit(), 'timestamp': time.time(), 'python': platform.python_version(),
+               'quantization': quantization, 'latency': args.latency, 'startup': bench_startup(), 'sizes': {}}
+    print(json.dumps({'startup': results['startup']}, indent=2))
+    for size in args.sizes:
+        root = Path(tempfile.mkdtemp(prefix=f'neonota-bench-{size}-'))
+        try:
+            print(f'Generating {size} notes in {root}')
+            names = generate_vault(root, size)
+            reset_database(postgres, database, quantization)
+
+            db_client = DbClient(postgres['host'], database, postgres['user'], postgres['password'], quantization)
+            llm = LLM('fake-chat', 'fake-embedding', db_client, llm_client=FakeOpenAI(args.latency))
+            catalog = NoteCatalog()
+            result = {'import': bench_import(db_client, llm, root, size)}
+            catalog.load(db_client.get_all_filepaths())
+            cli = NoteCLI(db_client, llm, queue.Queue(), catalog)
+            result['link'] = bench_link(db_client, names, args.samples)
+            result['completion'] = bench_completion(cli, names, args.samples)
+            result['watcher'] = bench_watcher(db_client, llm, root, catalog, args.watch_samples,
+                                              args.watch_timeout, batch_window)
+            db_client.close()
+        finally:
+            if not args.keep:
+                shutil.rmtree(root, ignore_errors=True)
+
+        results['sizes'][str(size)] = result
+        print(json.dumps({str(size): result}, indent=2))
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f'Wrote {args.output}')
@@ -0,0 +1,179 @@
+import time
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+from pathlib import Path
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+def open_db(path: Path) -> sqlite3.Connection:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(path), check_same_thread=False)
+    conn.execute('PRAGMA journal_mode=WAL')
+    return conn
+
+class EmbeddingCache:
+    """Persistent embedding cache keyed by (embed model, content hash).
+
+    Entries are evicted least-recently-used first once the cache holds more
+    than max_entries rows.
+    """
+
+    def __init__(self, path: str, max_entries: int = 100_000):
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.conn = open_db(self.path)
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS embeddings ('
+            'model TEXT NOT NULL, '
+            'hash TEXT NOT NULL, '
+            'embedding BLOB NOT NULL, '
+            'last_used REAL NOT NULL, '
+            'PRIMARY KEY (model, hash))'
+        )
+        self.conn.execute('CREATE INDEX IF NOT EXISTS embeddings_last_used_idx ON embeddings (last_used)')
+        self.conn.commit()
+        self.size = self.conn.execute('SELECT count(*) FROM embeddings').fetchone()[0]
+
+    def get_many(self, model: str, hashes: list[str]) -> dict[str, list[float]]:
+        found = {}
+        with self.lock:
+            # Stay below sqlite's bound parameter limit
+            for i in range(0, len(hashes), 500):
+                chunk = hashes[i:i + 500]
+                placeholders = ','.join('?' * len(chunk))
+                rows = self.conn.execute(
+                    f'SELECT hash, embedding FROM embeddings WHERE model = ? AND hash IN ({placeholders})',
+                    [model, *chunk]
+                ).fetchall()
+                for h, blob in rows:
+                    found[h] = np.frombuffer(blob, dtype=np.float32).tolist()
+            self.hits += len(found)
+            self.misses += len(set(hashes)) - len(found)
+
+            if found:
+                now = time.time()
+                self.conn.executemany(
+                    'UPDATE embeddings SET last_used = ? WHERE model = ? AND hash = ?',
+                    [(now, model, h) for h in found]
+                )
+                self.conn.commit()
+        return found
+
+    def put_many(self, model: str, items: dict[str, list[float]]):
+        if not items:
+            return
+        now = time.time()
+        with self.lock:
+            cur = self.conn.executemany(
+                'INSERT OR REPLACE INTO embeddings (model, hash, embedding, last_used) VALUES (?, ?, ?, ?)',
+                [(model, h, np.asarray(e, dtype=np.float32).tobytes(), now) for h, e in items.items()]
+            )
+            self.size += cur.rowcount
+            if self.size > self.max_entries:
+                self.evict()
+            self.conn.commit()
+
+    def evict(self):
+        # Drop down to 90% of capacity so eviction does not run on every put
+        self.size = self.conn.execute('SELECT count(*) FROM embeddings').fetchone()[0]
+        excess = self.size - int(self.max_entries * 0.9)
+        if excess > 0:
+            self.conn.execute(
+                'DELETE FROM embeddings WHERE rowid IN '
+                '(SELECT rowid FROM embeddings ORDER BY last_used LIMIT ?)',
+                (excess,)
+            )
+            self.size -= excess
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+class ResponseCache:
+    """Persistent chat response cache.
+
+    Keyed by (chat model, system prompt hash, user content hash). Entries are
+    evicted least-recently-used first once the stored responses exceed
+    max_bytes.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 50 * 1024 * 1024):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.conn = open_db(self.path)
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS responses ('
+            'model TEXT NOT NULL, '
+            'system_hash TEXT NOT NULL, '
+            'user_hash TEXT NOT NULL, '
+            'response TEXT NOT NULL, '
+            'size INTEGER NOT NULL, '
+            'last_used REAL NOT NULL, '
+            'PRIMARY KEY (model, system_hash, user_hash))'
+        )
+        self.conn.execute('CREATE INDEX IF NOT EXISTS responses_last_used_idx ON responses (last_used)')
+        self.conn.commit()
+        self.size = self.conn.execute('SELECT coalesce(sum(size), 0) FROM responses').fetchone()[0]
+
+    @staticmethod
+    def key(model: str, system_prompt: str, user_prompt: str) -> tuple:
+        return model, content_hash(system_prompt), content_hash(user_prompt)
+
+    def get(self, model: str, system_prompt: str, user_prompt: str):
+        key = self.key(model, system_prompt, user_prompt)
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT response FROM responses WHERE model = ? AND system_hash = ? AND user_hash = ?', key
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.conn.execute(
+                'UPDATE responses SET last_used = ? WHERE model = ? AND system_hash = ? AND user_hash = ?',
+                (time.time(), *key)
+            )
+            self.conn.commit()
+            return row[0]
+
+    def put(self, model: str, system_prompt: str, user_prompt: str, response: str):
+        key = self.key(model, system_prompt, user_prompt)
+        size = len(response.encode('utf-8'))
+        with self.lock:
+            old = self.conn.execute(
+                'SELECT size FROM responses WHERE model = ? AND system_hash = ? AND user_hash = ?', key
+            ).fetchone()
+            self.conn.execute(
+                'INSERT OR REPLACE INTO responses '
+                '(model, system_hash, user_hash, response, size, last_used) VALUES (?, ?, ?, ?, ?, ?)',
+                (*key, response, size, time.time())
+            )
+            self.size += size - (old[0] if old else 0)
+            if self.size > self.max_bytes:
+                self.evict()
+            self.conn.commit()
+
+    def evict(self):
+        # Walk from the least recently used entry until under 90% of capacity
+        target = int(self.max_bytes * 0.9)
+        rows = self.conn.execute('SELECT rowid, size FROM responses ORDER BY last_used').fetchall()
+        doomed = []
+        for rowid, size in rows:
+            if self.size <= target:
+                break
+            doomed.append((rowid,))
+            self.size -= size
+        self.conn.executemany('DELETE FROM responses WHERE rowid = ?', doomed)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,73 @@
+import re
+import threading
+from bisect import bisect_left, insort
+from pathlib import Path
+
+def note_name(path: str) -> str:
+    return Path(path).name.removesuffix('.md')
+
+class NoteCatalog:
+    """In-process index of note names and paths.
+
+    Names and paths are kept in sorted lists so prefix lookups are a pair of
+    bisects. Loaded once from the database and kept current by the watcher.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.paths = []
+        self.path_set = set()
+        self.names = []
+        self.loaded = False
+
+    def load(self, paths):
+        paths = set(paths)
+        with self.lock:
+            self.path_set = paths | self.path_set
+            self.paths = sorted(self.path_set)
+            self.names = sorted(note_name(p) for p in self.path_set)
+            self.loaded = True
+
+    def add(self, path: str):
+        with self.lock:
+            if path in self.path_set:
+                return
+            self.path_set.add(path)
+            insort(self.paths, path)
+            insort(self.names, note_name(path))
+
+    def remove(self, path: str):
+        with self.lock:
+            if path not in self.path_set:
+                return
+            self.path_set.discard(path)
+            del self.paths[bisect_left(self.paths, path)]
+            del self.names[bisect_left(self.names, note_name(path))]
+
+    def has_path(self, path: str) -> bool:
+        return path in self.path_set
+
+    @staticmethod
+    def prefix_range(items: list, prefix: str) -> list:
+        start = bisect_left(items, prefix)
+        # \uffff sorts after any character a name can continue with
+        end = bisect_left(items, prefix + '\uffff', start)
+        return items[start:end]
+
+    def complete_name(self, prefix: str) -> list:
+        with self.lock:
+            # Notes in different folders can share a name
+            return list(dict.fromkeys(self.prefix_range(self.names, prefix)))
+
+    def complete_path(self, prefix: str) -> list:
+        with self.lock:
+            return self.prefix_range(self.paths, prefix)
+
+    def match_names(self, pattern: str) -> list:
+        regex = re.compile(pattern)
+        with self.lock:
+            names = list(dict.fromkeys(self.names))
+        return [name for name in names if regex.search(name)]
+
+    def __len__(self):
+        return len(self.path_set)
@@ -0,0 +1,66 @@
+import re
+from cache import content_hash
+
+# Well below the embedding model's input limit (~4 characters per token)
+MAX_CHUNK_CHARS = 4000
+
+HEADING_PATTERN = re.compile(r'^#{1,6}\s', re.MULTILINE)
+PARAGRAPH_PATTERN = re.compile(r'\n\s*\n')
+
+def split_sections(content: str) -> list[str]:
+    starts = [m.start() for m in HEADING_PATTERN.finditer(content)]
+    if not starts or starts[0] != 0:
+        starts.insert(0, 0)
+    return [content[a:b] for a, b in zip(starts, starts[1:] + [len(content)])]
+
+def split_long(section: str, max_chars: int) -> list[str]:
+    # Pack paragraphs into pieces of at most max_chars, hard splitting any
+    # single paragraph that is longer than that on its own
+    pieces, current = [], ''
+    for paragraph in PARAGRAPH_PATTERN.split(section):
+        if current and len(paragraph) > max_chars:
+            # What came before goes out before the pieces that follow it
+            pieces.append(current)
+            current = ''
+        while len(paragraph) > max_chars:
+            pieces.append(paragraph[:max_chars])
+            paragraph = paragraph[max_chars:]
+        if current and len(current) + len(paragraph) + 2 > max_chars:
+            pieces.append(current)
+            current = ''
+        current = f'{current}\n\n{paragraph}' if current else paragraph
+    if current:
+        pieces.append(current)
+    return pieces
+
+def split_chunks(content: str, max_chars: int = MAX_CHUNK_CHARS) -> list[str]:
+    """Split markdown on headings, then on paragraphs for long sections."""
+    chunks = []
+    for section in split_sections(content):
+        if len(section) > max_chars:
+            chunks.extend(split_long(section, max_chars))
+        else:
+            chunks.append(section)
+    return [chunk.strip() for chunk in chunks if chunk.strip()]
+
+def chunk_rows(content: str) -> list[dict]:
+    return [
+        {'position': i, 'content': chunk, 'content_hash': content_hash(chunk)}
+        for i, chunk in enumerate(split_chunks(content))
+    ]
+
+def embed_new_chunks(llm, chunks: dict, known: dict, model: str = None) -> dict:
+    """Embed the chunks whose hash is not stored for their note yet.
+
+    chunks maps path -> chunk_rows(), known maps path -> set of hashes stored
+    for model. Returns content hash -> embedding.
+    """
+    texts = {}
+    for path, rows in chunks.items():
+        stored = known.get(path, set())
+        for chunk in rows:
+            if chunk['content_hash'] not in stored:
+                texts.setdefault(chunk['content_hash'], chunk['content'])
+    if not texts:
+        return {}
+    return dict(zip(texts.keys(), llm.embed_many(list(texts.values()), model)))
@@ -1,3 +1,4 @@
+import os
 import re
 import cmd
 from pathlib import Path
@@ -7,15 +8,26 @@ import queue
 import readline
 import threading
 import subprocess
+from metrics import REGISTRY
 
 class NoteCLI(cmd.Cmd):
     prompt = 'note> '
 
-    def __init__(self, db_client, llm, message_queue):
+    def __init__(self, db_client, llm, message_queue, catalog, local_index=None, graph=None,
+                 uncached_commands=(), vault_roots=None):
         super().__init__()
         self.db_client = db_client
         self.llm = llm
         self.message_queue = message_queue
+        self.catalog = catalog
+        self.local_index = local_index
+        self.graph = graph
+        # Commands that always call the LLM instead of reusing cached responses
+        self.uncached_commands = set(uncached_commands)
+        # Vault name -> root folder; searches cover vault_ids, or every vault when None
+        self.vault_roots = vault_roots or {}
+        self.vault_ids = None
+        self.completion_matches = []
         self.should_run = True
         self.prompt_delay = 0.5
 
@@ -32,14 +44,18 @@ class NoteCLI(cmd.Cmd):
         self.should_run = False
         return True
 
-    # TODO: Add regex mathcing for note names
     def do_list_notes(self, arg):
-        notes = self.db_client.get_all_names()
-        for note in notes:
-            print(note)
+        pattern = arg.strip().strip('"')
+        try:
+            names = self.catalog.match_names(pattern) if pattern else self.get_note_names()
+        except re.error as e:
+            print(f'Invalid pattern: {e}')
+            return
+        for name in names:
+            print(name)
 
     def help_list_notes(self):
-        print('Get a list of all the note names in the database')
+        print('Get a list of all the note names, optionally filtered by a regex')
 
     def do_link(self, arg):
         try:
@@ -52,13 +68,23 @@ class NoteCLI(cmd.Cmd):
             name = args[0].strip('"')
             n = int(args[1])
 
-            note = self.db_client.get_note_by_name(name)
-            if not note:
-                print(f'Note named {name} not found.')
+            # The local index answers without touching Postgres at all, but
+            # holds every vault, so scoped names and searches go to Postgres
+            if self.local_index is not None and self.vault_ids is None and ':' not in name:
+                hits = self.local_index.search_similar_to_name(name, n)
+                if hits is not None:
+                    for hit in hits:
+                        print(f'{hit.name}  ({hit.score:.3f})')
+                    return
+
+            name, vault_ids = self.scoped_name(name)
+            note = self.resolve_note(name, vault_ids)
+            if note is None:
+                return
 
-            similar_notes = self.db_client.get_similar_notes(note.embedding, n)
-            for similar_note in similar_notes:
-                print(similar_note.name)
+            hits = self.db_client.search_similar_to_note(note.id, n, vault_ids=vault_ids)
+            for hit in hits:
+                print(f'{hit.name}  ({hit.score:.3f})')
 
         except ValueError:
             print('Usage: link <string> <integer>')
@@ -66,16 +92,153 @@ class NoteCLI(cmd.Cmd):
     def help_link(self):
         print('find x most similar notes')
 
+    def scoped_name(self, name: str) -> tuple:
+        # 'vault:name' looks in that vault only, else the vault command's scope
+        # applies. Vaults are only read for such a name, so plain names keep
+        # working from the local index while Postgres is down.
+        vault, sep, rest = name.partition(':')
+        if sep:
+            vaults = self.db_client.get_vaults()
+            if vault in vaults:
+                return rest, [vaults[vault]]
+        return name, self.vault_ids
+
+    def resolve_note(self, name: str, vault_ids=None):
+        """The one note name refers to in vault_ids, else prints why not and returns None.
+
+        A name shared by several notes can be narrowed down by its folders,
+        as in projects/index, or by the note's full path.
+        """
+        folder, _, base = name.rpartition('/')
+        notes = self.db_client.get_notes_by_name(base, vault_ids)
+        if folder:
+            suffix = name if name.endswith('.md') else f'{name}.md'
+            notes = [note for note in notes
+                     if note.path == suffix or note.path.endswith('/' + suffix.lstrip('/'))]
+        if not notes:
+            print(f'Note named {name} not found.')
+            return None
+        if len(notes) > 1:
+            vault_names = {vault_id: vault for vault, vault_id in self.db_client.get_vaults().items()}
+            choices = ', '.join(self.qualified_name(note, vault_names) for note in notes)
+            print(f'{name} matches more than one note, use one of {choices}')
+            return None
+        return notes[0]
+
+    def qualified_name(self, note, vault_names: dict) -> str:
+        # vault:folder/name, relative to the vault root when it is configured
+        vault = vault_names.get(note.vault_id, str(note.vault_id))
+        path = Path(note.path.removesuffix('.md'))
+        root = self.vault_roots.get(vault)
+        if root is not None and path.is_relative_to(root):
+            path = path.relative_to(root)
+        return f'{vault}:{path}'
+
+    def do_search(self, arg):
+        words = arg.split()
+        hybrid = '--hybrid' in words
+        query = ' '.join(word for word in words if word != '--hybrid')
+        if not query:
+            print('Usage: search [--hybrid] <query>')
+            return
+
+        # Keyword search runs entirely in Postgres; only --hybrid embeds the
+        # query, with the model the stored chunks are searched by
+        active = self.db_client.active_model() if hybrid else None
+        query_embedding = self.llm.embed_many([query], active[0])[0] if active else None
+        for hit in self.db_client.search_text(query, 10, query_embedding, vault_ids=self.vault_ids):
+            print(f'{hit.name}  ({hit.score:.3f})')
+
+    def help_search(self):
+        print('Full-text search over note contents; --hybrid fuses in semantic similarity')
+
+    def do_vault(self, arg):
+        names = arg.split()
+        vaults = self.db_client.get_vaults()
+        if not names:
+            in_scope = set(vaults.values()) if self.vault_ids is None else set(self.vault_ids)
+            for name, vault_id in sorted(vaults.items()):
+                marker = '*' if vault_id in in_scope else ' '
+                print(f"{marker} {name}  {self.vault_roots.get(name, '')}")
+            return
+
+        if names == ['--all']:
+            self.vault_ids = None
+            print('Searching every vault')
+            return
+
+        unknown = [name for name in names if name not in vaults]
+        if unknown:
+            print(f"Unknown vault: {', '.join(unknown)}")
+            return
+        self.vault_ids = [vaults[name] for name in names]
+        print(f"Searching {', '.join(names)}")
+
+    def help_vault(self):
+        print('List vaults, or limit link and search to the named vaults (--all to reset). '
+              'Commands that take a note name also accept vault:name, and folder/name '
+              'for a name several notes share')
+
+    def find_graph_note(self, name):
+        if self.graph is None or not self.graph.loaded:
+            print('Link graph is still loading.')
+            return None
+        note = self.resolve_note(*self.scoped_name(name))
+        return note.id if note is not None else None
+
+    def do_backlinks(self, arg):
+        args = re.findall(r'(?:"[^"]*"|[^"\s]+)', arg)
+        if len(args) != 1:
+            print('Usage: backlinks <string>')
+            return
+
+        note_id = self.find_graph_note(args[0].strip('"'))
+        if note_id is None:
+            return
+        for linked_id in self.graph.backlinks(note_id):
+            print(self.graph.names[linked_id])
+
+    def help_backlinks(self):
+        print('List the notes that link to a note')
+
+    def do_neighbors(self, arg):
+        try:
+            args = re.findall(r'(?:"[^"]*"|[^"\s]+)', arg)
+            if len(args) not in (1, 2):
+                print('Usage: neighbors <string> <integer>')
+                return
+
+            depth = int(args[1]) if len(args) == 2 else 1
+            note_id = self.find_graph_note(args[0].strip('"'))
+            if note_id is None:
+                return
+            for linked_id, distance in self.graph.neighbors(note_id, depth):
+                print(f'{distance}  {self.graph.names[linked_id]}')
+
+        except ValueError:
+            print('Usage: neighbors <string> <integer>')
+
+    def help_neighbors(self):
+        print('List notes within <depth> links of a note, in either direction')
+
+    def do_orphans(self, arg):
+        if self.graph is None or not self.graph.loaded:
+            print('Link graph is still loading.')
+            return
+        for note_id in self.graph.orphans():
+            print(self.graph.names[note_id])
+
+    def help_orphans(self):
+        print('List notes with no incoming or outgoing links')
+
     def do_open(self, arg):
         args = re.findall(r'(?:"[^"]*"|[^"\s]+)', arg)
         if len(args) != 1:
             print('Usage: open <string>')
             return
 
-        name = args[0].strip('"')
-        note = self.db_client.get_note_by_name(name)
-        if not note:
-            print('Could not retrieve note: {name}')
+        note = self.resolve_note(*self.scoped_name(args[0].strip('"')))
+        if note is None:
             return
 
         path = Path(note.path)
@@ -92,16 +255,22 @@ class NoteCLI(cmd.Cmd):
     def help_open(self):
         print("Open a specified markdown file in Neovim in a new terminal pane")
 
+    def use_cache(self, command, args):
+        # --fresh skips the response cache for a single call
+        if '--fresh' in args:
+            args.remove('--fresh')
+            return False
+        return command not in self.uncached_commands
+
     def do_crit(self, arg):
         args = re.findall(r'(?:"[^"]*"|[^"\s]+)', arg)
+        use_cache = self.use_cache('crit', args)
         if len(args) != 1:
-            print('Usage: crit <string>')
+            print('Usage: crit <string> [--fresh]')
             return
 
-        name = args[0].strip('"')
-        note = self.db_client.get_note_by_name(name)
-        if not note:
-            print('Could not retrieve note: {name}')
+        note = self.resolve_note(*self.scoped_name(args[0].strip('"')))
+        if note is None:
             return
 
         path = Path(note.path)
@@ -113,11 +282,9 @@ class NoteCLI(cmd.Cmd):
                          'Be as critical as possible. Your response should outline information you '
                          'believe is correct, the information that is incorrect, and suggestions on how '
                          'to improve the correctness of the text.')
-        result = self.llm.chat(system_prompt, note.content)
-        print(str(result))
         llm_note = path.with_stem(f'{path.stem}.llm')
-        with open(llm_note, 'w') as f:
-            f.write(str(result))
+        if not self.stream_to_file(system_prompt, note.content, llm_note, use_cache):
+            return
 
         try:
             subprocess.run(['nvim', llm_note], check=True)
@@ -125,19 +292,37 @@ class NoteCLI(cmd.Cmd):
         except subprocess.CalledProcessError as e:
             print(f"Error opening file: {e}")
 
+    def stream_to_file(self, system_prompt, content, path, use_cache=True):
+        # Print the response as it arrives and write it to a temporary file
+        # next to the sidecar. It only replaces the sidecar once complete, so
+        # a failed call leaves the previous response in place
+        path = Path(path)
+        tmp = path.with_name(path.name + '.tmp')
+        try:
+            with open(tmp, 'w') as f:
+                for part in self.llm.chat_stream(system_prompt, content, use_cache):
+                    print(part, end='', flush=True)
+                    f.write(part)
+            print()
+            os.replace(tmp, path)
+            return True
+        except Exception as e:
+            print(f'\nCouldn\'t get a response: {e}')
+            tmp.unlink(missing_ok=True)
+            return False
+
     def help_crit(self, arg):
         print('Get an LLMs critical opinion on your note')
 
     def do_crit_diff(self, arg):
         args = re.findall(r'(?:"[^"]*"|[^"\s]+)', arg)
+        use_cache = self.use_cache('crit_diff', args)
         if len(args) != 1:
-            print('Usage: crit <string>')
+            print('Usage: crit_diff <string> [--fresh]')
             return
 
-        name = args[0].strip('"')
-        note = self.db_client.get_note_by_name(name)
-        if not note:
-            print('Could not retrieve note: {name}')
+        note = self.resolve_note(*self.scoped_name(args[0].strip('"')))
+        if note is None:
             return
 
         path = Path(note.path)
@@ -151,11 +336,9 @@ class NoteCLI(cmd.Cmd):
                          'Focus on the information presented rather than grammar, punctuation and wording. '
                          'Return an improved version of the original note while remaining as close '
                          'as possible to the style and structure of the original.')
-        result = self.llm.chat(system_prompt, note.content)
-        print(str(result))
         llm_note = path.with_stem(f'{path.stem}.llm_diff')
-        with open(llm_note, 'w') as f:
-            f.write(str(result))
+        if not self.stream_to_file(system_prompt, note.content, llm_note, use_cache):
+            return
 
         try:
             subprocess.run(['nvim', '-d', note.path, llm_note], check=True)
@@ -167,32 +350,157 @@ class NoteCLI(cmd.Cmd):
         print('Get an LLMs critical opinion on your note and return a corrected version in neovims diff view')
 
     def do_ask(self, arg):
-        question = ' '.join(arg.split(' '))
-        result = self.llm.chat('', question)
-        print(str(result))
+        words = arg.split(' ')
+        use_cache = self.use_cache('ask', words)
+        question = ' '.join(words)
+        try:
+            for part in self.llm.chat_stream('', question, use_cache):
+                print(part, end='', flush=True)
+        except Exception as e:
+            print(f'\nCouldn\'t get a response: {e}')
+            return
+        print()
 
     def help_ask(self):
         print("Ask the LLM a question without injecting any context")
 
+    def do_cache_stats(self, arg):
+        for label, cache in (('embeddings', self.llm.embed_cache), ('responses', self.llm.response_cache)):
+            if cache is None:
+                print(f'{label}: disabled')
+                continue
+            total = cache.hits + cache.misses
+            rate = cache.hits / total if total else 0.0
+            print(f'{label}: {cache.hits} hits, {cache.misses} misses ({rate:.0%} hit rate)')
+
+    def help_cache_stats(self):
+        print('Show hit and miss counts for the embedding and LLM response caches')
+
+    def do_stats(self, arg):
+        print(REGISTRY.report())
+
+    def help_stats(self):
+        print('Show latency percentiles (seconds), sizes and counters for ingest, OpenAI and database calls')
+
     def do_set_root(self, arg):
-        if len(arg.split(' ')) != 1:
-            print('Usage: set_root <string>')
-            return 
+        args = arg.split()
+        if len(args) not in (1, 2):
+            print('Usage: set_root <string> [vault]')
+            return
 
-        if not Path(arg).is_dir():
+        root = args[0]
+        if not Path(root).is_dir():
             print('Directory not found!')
             return
 
         with open('config.yaml', 'r') as file:
             config = yaml.safe_load(file)
 
-        config['dir']['root'] = arg 
+        if 'vaults' in config:
+            vaults = config['vaults']
+            if len(args) == 1 and len(vaults) != 1:
+                print('Several vaults are configured: set_root <string> <vault>')
+                return
+            name = args[1] if len(args) == 2 else vaults[0]['name']
+            for vault in vaults:
+                if vault['name'] == name:
+                    vault['root'] = root
+                    break
+            else:
+                vaults.append({'name': name, 'root': root})
+        else:
+            config.setdefault('dir', {})['root'] = root
 
         with open('config.yaml', 'w') as file:
             yaml.dump(config, file, default_flow_style=False)
 
     def help_set_root(self):
-        print('Set the note root folder')
+        print('Set the note root folder, or the root of the named vault (added if new)')
+
+    def do_import(self, arg):
+        root = arg.strip().strip('"')
+        if not root:
+            if self.vault_roots:
+                root = next(iter(self.vault_roots.values()))
+            else:
+                from importer import config_vault_roots
+                with open('config.yaml', 'r') as file:
+                    root = next(iter(config_vault_roots(yaml.safe_load(file)).values()))
+
+        if not Path(root).is_dir():
+            print('Directory not found!')
+            return
+
+        import_thread = threading.Thread(target=self.run_import, args=(root,))
+        import_thread.daemon = True
+        import_thread.start()
+        print(f'Importing notes from {root} in the background')
+
+    def vault_for(self, root: str) -> int:
+        from importer import vault_for
+        return vault_for(self.db_client, self.vault_roots, root)
+
+    def run_import(self, root):
+        from importer import Importer
+        importer = Importer(self.db_client, self.llm, self.message_queue, vault_id=self.vault_for(root))
+        importer.run(root)
+        self.catalog.load(self.db_client.get_all_filepaths())
+        self.rebuild_local_index()
+        if self.graph is not None:
+            self.graph.load(self.db_client.get_note_index(), self.db_client.get_all_links())
+
+    def help_import(self):
+        print('Import every markdown file under a folder (defaults to the note root)')
+
+    def do_reindex(self, arg):
+        reindex_thread = threading.Thread(target=self.run_reindex)
+        reindex_thread.daemon = True
+        reindex_thread.start()
+        print(f'Embedding notes with {self.llm.embed_model} in the background')
+
+    def run_reindex(self):
+        from reindex import Reindexer
+        reindexer = Reindexer(self.db_client, self.llm, self.message_queue)
+        try:
+            reindexer.run()
+            if reindexer.embedded or reindexer.switched:
+                self.rebuild_local_index()
+        except Exception as e:
+            # e.g. an unknown model name, or a dimension no index can hold;
+            # this runs in the background, so it must not end in a traceback
+            self.message_queue.put(f'Reindex stopped: {e}')
+
+    def rebuild_local_index(self):
+        # The active model decides the vectors' size, which a switch changes
+        active = self.db_client.active_model()
+        if self.local_index is not None and active is not None:
+            self.local_index.build(self.db_client.iter_note_embeddings(), active[1])
+
+    def help_reindex(self):
+        print('Embed chunks that have no embedding under the configured model, then switch searches '
+              'to it if it is new; the old model serves until then and is kept afterwards. '
+              'Safe to interrupt and run again')
+
+    def do_models(self, arg):
+        for model, (dim, active) in sorted(self.db_client.get_models().items()):
+            print(f"{'*' if active else ' '} {model}  ({dim} dimensions)")
+
+    def help_models(self):
+        print('List the embedding models chunks are stored with; * marks the one searches use')
+
+    def do_drop_model(self, arg):
+        if len(arg.split()) != 1:
+            print('Usage: drop_model <model>')
+            return
+        try:
+            self.db_client.drop_model(arg.strip())
+        except ValueError as e:
+            print(e)
+            return
+        print(f'Dropped {arg.strip()} and its embeddings')
+
+    def help_drop_model(self):
+        print('Delete an embedding model that searches no longer use, with its embeddings and indexes')
 
     def do_new(self, arg):
         NotImplemented()
@@ -201,10 +509,46 @@ class NoteCLI(cmd.Cmd):
         print('Create a new markdown directory in the root folder')
 
     def do_add_tags(self, arg):
-        NotImplemented()
+        args = re.findall(r'(?:"[^"]*"|[^"\s]+)', arg)
+        if len(args) != 1:
+            print('Usage: add_tags <string> | add_tags --all')
+            return
+
+        if args[0] == '--all':
+            tag_thread = threading.Thread(target=self.run_tag_vault)
+            tag_thread.daemon = True
+            tag_thread.start()
+            print('Tagging untagged notes in the background')
+            return
+
+        name = args[0].strip('"')
+        note = self.resolve_note(*self.scoped_name(name))
+        if note is None:
+            return
+        embedding = self.db_client.get_note_embedding(note.id)
+        if embedding is None:
+            print(f'Note {name} has not been embedded yet.')
+            return
+
+        from tagging import TagSuggester
+        suggester = TagSuggester(self.db_client, self.llm)
+        suggestions = suggester.tag_notes([note.id], [embedding])
+        tags, source = suggestions.get(note.id, ([], None))
+        if tags:
+            print(f"Added tags ({'neighbouring notes' if source == 'knn' else 'LLM'}): {', '.join(tags)}")
+        else:
+            print('No tags found.')
+
+    def run_tag_vault(self):
+        from tagging import TagSuggester
+        suggester = TagSuggester(self.db_client, self.llm)
+        tagged = suggester.tag_vault(self.message_queue)
+        self.message_queue.put(f'Finished tagging {tagged} notes, '
+                               f'{suggester.llm_tagged} needed the LLM')
 
     def help_add_tags(self):
-        print('Use llm to add tags to the note. The llm will check if a relevant tag exists in the db first')
+        print('Tag a note (or --all untagged notes) from the tags of similar notes, '
+              'asking the llm only when similar notes disagree')
 
     def do_dream(self, arg):
         desc = ' '.join(arg.split(' '))
@@ -255,7 +599,7 @@ class NoteCLI(cmd.Cmd):
 
 
     def get_note_names(self):
-        return [str(note).rstrip('.md') for note in self.db_client.get_all_names()]
+        return self.catalog.complete_name('')
 
     def complete(self, text, state):
         line = readline.get_line_buffer().split()
@@ -266,22 +610,23 @@ class NoteCLI(cmd.Cmd):
 
         # If we're completing arguments for a command
         cmd = line[0]
-        cmds = ['link', 'open', 'crit', 'crit_diff']
+        cmds = ['link', 'open', 'crit', 'crit_diff', 'backlinks', 'neighbors', 'add_tags']
         if cmd in cmds: 
             if len(line) == 2:
                 return self.complete_note_name(text, state)
 
-        if cmd == 'set_root':
+        if cmd in ['set_root', 'import']:
             if len(line) == 2:
                 return self.complete_path(text, state)
 
         return None
 
     def complete_note_name(self, text, state):
-        names = self.get_note_names()
-        matches = [n for n in names if n.startswith(text)]
-        if state < len(matches):
-            return f'"{matches[state]}"'
+        # readline calls this once per state, so only look up on the first
+        if state == 0:
+            self.completion_matches = self.catalog.complete_name(text.lstrip('"'))
+        if state < len(self.completion_matches):
+            return f'"{self.completion_matches[state]}"'
         else:
             return None
 
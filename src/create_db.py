@@ -1,8 +1,9 @@
 import yaml
-from sqlalchemy import create_engine, Index
+from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.sql import text
-from models import Base, Note
+from models import Base
+from migrate import migrate
 
 with open('config.yaml', 'r') as f:
     config = yaml.safe_load(f)
@@ -13,6 +14,7 @@ password = config['postgres']['password']
 host = config['postgres']['host']
 database = config['postgres']['database']
 port = "5432"
+quantization = config.get('storage', {}).get('quantization')
 
 # Connect to default 'postgres' database first
 default_engine = create_engine(f"postgresql://{user}:{password}@{host}:{port}/postgres")
@@ -34,16 +36,8 @@ session.commit()
 
 # Create the tables
 Base.metadata.create_all(engine)
+migrate(engine, quantization)
 
-# Create an approximate index for faster similarity search
-index = Index(
-    'notes_embedding_idx',
-    Note.embedding,
-    postgresql_using='hnsw',
-    postgresql_with={'m': 16, 'ef_construction': 64},
-    postgresql_ops={'embedding': 'vector_cosine_ops'}
-)
-index.create(engine)
-
-print(f"Tables 'notes', 'note_links', 'tags', 'note_tags', and pgvector extension created successfully.")
+print(f"Tables 'notes', 'note_chunks', 'note_embeddings', 'embedding_models', 'note_links', 'note_link_targets', 'tags', 'note_tags', "
+      f"and pgvector extension created successfully.")
 session.close()
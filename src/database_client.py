@@ -1,21 +1,80 @@
+import time
 import numpy as np
-from typing import List, Union
-from sqlalchemy import create_engine, func, select 
-from sqlalchemy.orm import sessionmaker, class_mapper
+from typing import Iterable, List, Union
+from sqlalchemy import create_engine, event, func, select, update, delete, exists, bindparam, true, literal, literal_column, union_all
+from sqlalchemy.orm import sessionmaker, class_mapper, aliased, undefer
 from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.sql import text
 from sqlalchemy.sql.expression import cast
 from sqlalchemy.types import Float, ARRAY
-from models import Note, Tag, note_links, note_tags
+from pgvector.sqlalchemy import Vector, HALFVEC, BIT, avg
+from models import Note, NoteChunk, NoteEmbedding, EmbeddingModel, Tag, Vault, note_links, note_tags, TEXT_SEARCH_CONFIG, NAME_LENGTH
+from migrate import create_embedding_index, drop_embedding_indexes, index_mode
 from contextlib import contextmanager
+from metrics import REGISTRY
 
 def cosine_similarity(a, b):
     return np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b))
 
+class NoteHit:
+    """Lightweight similarity search result."""
+    __slots__ = ('id', 'name', 'path', 'score')
+
+    def __init__(self, id: int, name: str, path: str, score: float):
+        self.id = id
+        self.name = name
+        self.path = path
+        self.score = score
+
+    def __repr__(self):
+        return f"<NoteHit(name='{self.name}', score={self.score:.3f})>"
+
+# Columns a caller may set when writing a note; the rest are generated
+NOTE_WRITE_COLUMNS = ('vault_id', 'path', 'name', 'extension', 'content', 'mtime', 'size', 'content_hash')
+
+# pgvector's hnsw.ef_search when the session does not set it
+HNSW_EF_SEARCH_DEFAULT = 40
+
+class NoteSummary:
+    """Note identity without content or embedding."""
+    __slots__ = ('id', 'name', 'path')
+
+    def __init__(self, id: int, name: str, path: str):
+        self.id = id
+        self.name = name
+        self.path = path
+
+    def __repr__(self):
+        return f"<NoteSummary(name='{self.name}')>"
+
 class DbClient:
-    def __init__(self, host: str, database: str, user: str, password: str):
+    def __init__(self, host: str, database: str, user: str, password: str,
+                 quantization: str = None, rerank_factor: int = None):
         connection_string = f'postgresql://{user}:{password}@{host}/{database}'
         self.engine = create_engine(connection_string)
         self.Session = sessionmaker(bind=self.engine)
+        event.listen(self.engine, 'before_cursor_execute', self.before_execute)
+        event.listen(self.engine, 'after_cursor_execute', self.after_execute)
+        # Must match the note_embeddings indexes built by migrate.set_quantization
+        self.quantization = quantization
+        # Binary codes lose much more than halfvec, so re-rank a bigger pool
+        self.rerank_factor = rerank_factor or {'halfvec': 4, 'binary': 10}.get(quantization, 1)
+        # Vault name -> id, read on first use and refreshed by ensure_vault
+        self.vaults = None
+        # Embedding model -> (dim, active), read on first use and refreshed
+        # by register_model, switch_model and drop_model
+        self.models = None
+
+    @staticmethod
+    def before_execute(conn, cursor, statement, parameters, context, executemany):
+        # A connection runs one statement at a time, so one slot is enough
+        conn.info['query_start'] = time.perf_counter()
+
+    @staticmethod
+    def after_execute(conn, cursor, statement, parameters, context, executemany):
+        start = conn.info.pop('query_start', None)
+        if start is not None:
+            REGISTRY.observe('db_query_seconds', time.perf_counter() - start)
 
     @contextmanager
     def session_scope(self):
@@ -29,6 +88,105 @@ class DbClient:
         finally:
             session.close()
 
+    def ensure_vault(self, name: str, root: str = None) -> int:
+        """Register a vault (or update its root) and make sure its embedding indexes exist."""
+        models = self.get_models()
+        with self.session_scope() as session:
+            stmt = insert(Vault).values(name=name, root=root)
+            vault_id = session.scalar(stmt.on_conflict_do_update(
+                index_elements=[Vault.name], set_={'root': func.coalesce(stmt.excluded.root, Vault.root)}
+            ).returning(Vault.id))
+            for model, (dim, _) in models.items():
+                create_embedding_index(session.connection(), model, dim, vault_id, self.quantization)
+        self.vaults = None
+        return vault_id
+
+    def get_vaults(self) -> dict:
+        if self.vaults is None:
+            with self.session_scope() as session:
+                self.vaults = dict(session.execute(select(Vault.name, Vault.id)).all())
+        return self.vaults
+
+    def vault_scope(self, vault_ids: Union[List[int], None]) -> List[int]:
+        # None means every vault
+        return sorted(self.get_vaults().values()) if vault_ids is None else list(vault_ids)
+
+    def get_models(self) -> dict:
+        if self.models is None:
+            with self.session_scope() as session:
+                rows = session.execute(select(EmbeddingModel.model, EmbeddingModel.dim, EmbeddingModel.active))
+                self.models = {model: (dim, active) for model, dim, active in rows}
+        return self.models
+
+    def active_model(self) -> Union[tuple, None]:
+        """(model, dim) of the model searches use, None before anything is embedded."""
+        for model, (dim, active) in self.get_models().items():
+            if active:
+                return model, dim
+        return None
+
+    def write_models(self, default: str) -> List[str]:
+        """Models new chunks are embedded with, the active one first.
+
+        Models still being backfilled are written too, so they are complete
+        when they are switched to. With no model yet, default becomes active
+        on its first write.
+        """
+        models = self.get_models()
+        if not models:
+            return [default]
+        return sorted(models, key=lambda model: not models[model][1])
+
+    def register_model(self, model: str, dim: int):
+        """Add an embedding model and its indexes; the first one becomes active.
+
+        Raises ValueError for a dimension no hnsw index can hold.
+        """
+        index_mode(self.quantization, dim)
+        with self.session_scope() as session:
+            no_active = ~exists().where(EmbeddingModel.active)
+            # Also a no-op if another writer made a different model active first
+            session.execute(insert(EmbeddingModel).values(model=model, dim=dim, active=no_active)
+                            .on_conflict_do_nothing())
+            for vault_id in self.vault_scope(None):
+                create_embedding_index(session.connection(), model, dim, vault_id, self.quantization)
+        self.models = None
+
+    def registered_embeddings(self, embeddings: dict) -> dict:
+        """embeddings ({model: {content hash: vector}}) limited to registered models.
+
+        On a database with no model yet, the given ones are registered first
+        and the first becomes active. Otherwise unknown models are dropped,
+        such as one that was retired while a batch was being embedded.
+        """
+        if not self.get_models():
+            for model, vectors in embeddings.items():
+                if vectors:
+                    self.register_model(model, len(next(iter(vectors.values()))))
+        models = self.get_models()
+        return {model: vectors for model, vectors in embeddings.items() if model in models}
+
+    def switch_model(self, model: str):
+        """Make model the one searches use, in one transaction."""
+        with self.session_scope() as session:
+            session.execute(update(EmbeddingModel).where(EmbeddingModel.active).values(active=False))
+            switched = session.scalar(update(EmbeddingModel).where(EmbeddingModel.model == model)
+                                      .values(active=True).returning(EmbeddingModel.model))
+            if switched is None:
+                raise ValueError(f"Embedding model {model} is not registered")
+        self.models = None
+
+    def drop_model(self, model: str):
+        """Delete an inactive model with its embeddings and indexes."""
+        with self.session_scope() as session:
+            dropped = session.scalar(delete(EmbeddingModel)
+                                     .where(EmbeddingModel.model == model, ~EmbeddingModel.active)
+                                     .returning(EmbeddingModel.model))
+            if dropped is None:
+                raise ValueError(f"Embedding model {model} is active or not registered")
+            drop_embedding_indexes(session.connection(), model, self.vault_scope(None))
+        self.models = None
+
     def get_note_by_path(self, path: str) -> Union[Note, None]:
         with self.session_scope() as session:
             stmt = select(Note).where(Note.path == path)
@@ -37,88 +195,585 @@ class DbClient:
                 return session.expunge(result)
             return None
 
-    def get_note_by_name(self, name: str) -> Union[Note, None]:
+    def get_notes_by_name(self, name: str, vault_ids: List[int] = None) -> List[Note]:
+        # Names are only unique within a vault, so this may return several
         with self.session_scope() as session:
             if not name.endswith('.md'):
                 name += '.md'
-            stmt = select(Note).where(Note.name == name)
-            result = session.execute(stmt).scalar_one_or_none()
-            if result:
+            stmt = select(Note).where(Note.name == name).options(undefer(Note.content)).order_by(Note.vault_id)
+            if vault_ids is not None:
+                stmt = stmt.where(Note.vault_id.in_(vault_ids))
+            notes = []
+            for result in session.execute(stmt).scalars():
                 # Make a copy of the note's data before expunging
-                note_copy = Note(
-                    name=result.name, 
-                    path=result.path, 
-                    content=result.content, 
-                    embedding=result.embedding
-                )
+                notes.append(Note(
+                    id=result.id,
+                    vault_id=result.vault_id,
+                    name=result.name,
+                    path=result.path,
+                    content=result.content
+                ))
                 session.expunge(result)
-                return note_copy
+            return notes
+
+    def iter_notes(self, tag_name: str = None, batch_size: int = 1000):
+        # yield_per streams rows through a server-side cursor
+        with self.session_scope() as session:
+            stmt = select(Note.id, Note.name, Note.path).execution_options(yield_per=batch_size)
+            if tag_name is not None:
+                stmt = stmt.where(Note.tags.any(Tag.name == tag_name))
+            for row in session.execute(stmt):
+                yield NoteSummary(*row)
+
+    def get_all_notes(self) -> List[NoteSummary]:
+        return list(self.iter_notes())
+
+    def get_all_names(self, batch_size: int = 1000):
+        with self.session_scope() as session:
+            yield from session.scalars(select(Note.name).execution_options(yield_per=batch_size))
+
+    def get_all_filepaths(self, batch_size: int = 1000):
+        with self.session_scope() as session:
+            yield from session.scalars(select(Note.path).execution_options(yield_per=batch_size))
+
+    def get_content_hashes(self, paths: List[str]) -> dict:
+        # Rows written before content_hash existed fall back to hashing the
+        # stored content, which matches cache.content_hash
+        with self.session_scope() as session:
+            digest = func.coalesce(
+                Note.content_hash,
+                func.encode(func.sha256(func.convert_to(Note.content, 'UTF8')), 'hex')
+            )
+            rows = session.execute(select(Note.path, digest).where(Note.path.in_(paths))).all()
+            return {path: h for path, h in rows}
+
+    def get_file_states(self, vault_id: int = None) -> dict:
+        with self.session_scope() as session:
+            stmt = select(Note.path, Note.mtime, Note.size)
+            if vault_id is not None:
+                stmt = stmt.where(Note.vault_id == vault_id)
+            rows = session.execute(stmt).all()
+            return {path: (mtime, size) for path, mtime, size in rows}
+
+    def update_file_states(self, states: List[dict]):
+        # states: [{'path': ..., 'mtime': ..., 'size': ...}]
+        if not states:
+            return
+        with self.session_scope() as session:
+            notes = Note.__table__
+            session.connection().execute(
+                update(notes).where(notes.c.path == bindparam('b_path')).values(
+                    mtime=bindparam('b_mtime'), size=bindparam('b_size')
+                ),
+                [{'b_path': s['path'], 'b_mtime': s['mtime'], 'b_size': s['size']} for s in states]
+            )
+
+    def move_to_vault(self, paths: List[str], vault_id: int) -> List[int]:
+        """Put notes in vault_id, with the vault copies on their chunks and embeddings.
+
+        Only notes in another vault are written, so this is one cheap
+        statement when nothing moved. Returns the moved note ids.
+        """
+        with self.session_scope() as session:
+            moved = session.scalars(
+                update(Note).where(Note.path.in_(paths), Note.vault_id != vault_id)
+                .values(vault_id=vault_id).returning(Note.id),
+                execution_options={'synchronize_session': False}
+            ).all()
+            if moved:
+                for table in (NoteChunk.__table__, NoteEmbedding.__table__):
+                    session.execute(update(table).where(table.c.note_id.in_(moved)).values(vault_id=vault_id))
+            return moved
+
+    def delete_notes_by_path(self, paths: List[str]) -> List[int]:
+        if not paths:
+            return []
+        with self.session_scope() as session:
+            ids = select(Note.id).where(Note.path.in_(paths)).scalar_subquery()
+            session.execute(delete(note_links).where(
+                note_links.c.from_note_id.in_(ids) | note_links.c.to_note_id.in_(ids)
+            ))
+            session.execute(delete(note_tags).where(note_tags.c.note_id.in_(ids)))
+            return session.scalars(delete(Note).where(Note.path.in_(paths)).returning(Note.id)).all()
+
+    def note_means(self):
+        """(note_id, embedding) subquery of note-level embeddings, or None.
+
+        A note's embedding is the mean of its chunk embeddings under the
+        active model. It is computed on read, so switching models never
+        rewrites the notes table.
+        """
+        active = self.active_model()
+        if active is None:
             return None
+        return (select(NoteChunk.note_id, avg(NoteEmbedding.embedding).label('embedding'))
+                .join(NoteEmbedding, (NoteEmbedding.note_id == NoteChunk.note_id)
+                      & (NoteEmbedding.content_hash == NoteChunk.content_hash))
+                .where(NoteEmbedding.model == active[0])
+                .group_by(NoteChunk.note_id).subquery())
 
-    def get_all_notes(self):
+    def get_note_embedding(self, note_id: int) -> Union[List[float], None]:
+        means = self.note_means()
+        if means is None:
+            return None
         with self.session_scope() as session:
-            return list(session.query(Note).all())
+            return session.scalar(select(means.c.embedding).where(means.c.note_id == note_id))
 
-    def get_all_names(self):
+    def iter_note_embeddings(self, note_ids: List[int] = None, batch_size: int = 1000):
+        """Yield (id, name, path, content hash, embedding) for notes with an embedding, or the given ones."""
+        means = self.note_means()
+        if means is None:
+            return
         with self.session_scope() as session:
-            return session.scalars(select(Note.name)).all()
+            stmt = (select(Note.id, Note.name, Note.path, Note.content_hash, means.c.embedding)
+                    .join(means, means.c.note_id == Note.id)
+                    .execution_options(yield_per=batch_size))
+            if note_ids is not None:
+                stmt = stmt.where(Note.id.in_(note_ids))
+            for row in session.execute(stmt):
+                yield tuple(row)
 
-    def get_all_filepaths(self):
+    def get_embedded_notes(self) -> List[tuple]:
+        """(id, path, content hash) of the notes iter_note_embeddings() yields, without the vectors."""
+        active = self.active_model()
+        if active is None:
+            return []
         with self.session_scope() as session:
-            return list(session.scalars(select(Note.path)).all())
+            return session.execute(
+                select(Note.id, Note.path, Note.content_hash)
+                .where(exists().where((NoteEmbedding.note_id == Note.id) & (NoteEmbedding.model == active[0])))
+            ).all()
 
-    def get_notes_by_tag(self, tag_name):
+    def get_note_index(self):
         with self.session_scope() as session:
-            return session.query(Note).filter(Note.tags.any(Tag.name == tag_name)).all()
+            return session.execute(select(Note.id, Note.name, Note.path)).all()
 
-    def upsert_note(self, note: Note):
+    def get_all_links(self):
         with self.session_scope() as session:
-            try:
-                # Check if a note with this path already exists
-                existing_note = session.query(Note).filter(Note.path == note.path).first()
+            return session.execute(select(note_links.c.from_note_id, note_links.c.to_note_id)).all()
 
-                if existing_note:
-                    # Update existing note
-                    for key, value in note.__dict__.items():
-                        if key != '_sa_instance_state':
-                            setattr(existing_note, key, value)
+    def sync_links(self, path: str, targets: List[str]) -> tuple:
+        """Make a note's outgoing links and link targets match the names in targets.
+
+        Names resolve to notes in the note's own vault only. Only the
+        difference against the stored links is written, in one statement.
+        Returns (note id, added target ids, removed target ids).
+        """
+        with self.session_scope() as session:
+            row = session.execute(text(
+                'WITH src AS (SELECT id, vault_id FROM notes WHERE path = :path), '
+                'dropped AS ('
+                '  DELETE FROM note_link_targets t USING src '
+                '  WHERE t.from_note_id = src.id AND t.target <> ALL(CAST(:targets AS text[]))), '
+                'named AS ('
+                '  INSERT INTO note_link_targets (from_note_id, target) '
+                '  SELECT src.id, unnest(CAST(:targets AS text[])) FROM src '
+                '  ON CONFLICT DO NOTHING), '
+                'wanted AS ('
+                '  SELECT DISTINCT dst.id FROM notes dst, src '
+                '  WHERE dst.name = ANY(CAST(:targets AS text[])) AND dst.vault_id = src.vault_id '
+                '  AND dst.id <> src.id), '
+                'removed AS ('
+                '  DELETE FROM note_links l USING src '
+                '  WHERE l.from_note_id = src.id AND l.to_note_id NOT IN (SELECT id FROM wanted) '
+                '  RETURNING l.to_note_id), '
+                'added AS ('
+                '  INSERT INTO note_links (from_note_id, to_note_id) '
+                '  SELECT src.id, wanted.id FROM src, wanted '
+                '  ON CONFLICT DO NOTHING '
+                '  RETURNING to_note_id) '
+                'SELECT (SELECT id FROM src), '
+                'ARRAY(SELECT to_note_id FROM added), '
+                'ARRAY(SELECT to_note_id FROM removed)'
+            ), {'path': path, 'targets': [t for t in set(targets) if len(t) <= NAME_LENGTH]}).one()
+            return row[0], list(row[1]), list(row[2])
+
+    def link_incoming(self, paths: List[str]) -> List[tuple]:
+        """Link existing notes that already name one of the newly created notes at paths.
+
+        Resolved from the stored link targets, in one indexed join for the
+        whole batch, and only within the new note's vault. Returns the
+        added (from id, to id) pairs.
+        """
+        if not paths:
+            return []
+        with self.session_scope() as session:
+            return session.execute(text(
+                'INSERT INTO note_links (from_note_id, to_note_id) '
+                'SELECT t.from_note_id, dst.id FROM notes dst '
+                'JOIN note_link_targets t ON t.target = dst.name '
+                'JOIN notes src ON src.id = t.from_note_id AND src.vault_id = dst.vault_id '
+                'WHERE dst.path = ANY(CAST(:paths AS text[])) AND src.id <> dst.id '
+                'ON CONFLICT DO NOTHING '
+                'RETURNING from_note_id, to_note_id'
+            ), {'paths': list(paths)}).all()
+
+    def get_tag_names(self) -> List[str]:
+        with self.session_scope() as session:
+            return session.scalars(select(Tag.name)).all()
+
+    def get_tagged_embeddings(self):
+        means = self.note_means()
+        if means is None:
+            return []
+        with self.session_scope() as session:
+            names = (select(note_tags.c.note_id, func.array_agg(Tag.name).label('names'))
+                     .join(Tag, Tag.id == note_tags.c.tag_id)
+                     .group_by(note_tags.c.note_id).subquery())
+            return session.execute(
+                select(means.c.note_id, means.c.embedding, names.c.names)
+                .join(names, names.c.note_id == means.c.note_id)
+            ).all()
+
+    def iter_untagged_embeddings(self, batch_size: int = 1000):
+        means = self.note_means()
+        if means is None:
+            return
+        with self.session_scope() as session:
+            stmt = (select(Note.id, means.c.embedding)
+                    .join(means, means.c.note_id == Note.id)
+                    .where(~Note.tags.any())
+                    .order_by(Note.id)
+                    .execution_options(yield_per=batch_size))
+            for row in session.execute(stmt):
+                yield tuple(row)
+
+    @staticmethod
+    def missing_embedding(model: str):
+        return ~exists().where(NoteEmbedding.note_id == NoteChunk.note_id, NoteEmbedding.model == model,
+                               NoteEmbedding.content_hash == NoteChunk.content_hash)
+
+    def count_missing_embeddings(self, model: str) -> int:
+        with self.session_scope() as session:
+            return session.scalar(select(func.count()).select_from(NoteChunk)
+                                  .where(self.missing_embedding(model)))
+
+    def get_missing_chunks(self, model: str, after_id: int = 0, limit: int = 256) -> List[tuple]:
+        """(id, note_id, vault_id, content_hash, content) of chunks with no
+        embedding under model, in id order after after_id."""
+        with self.session_scope() as session:
+            return [tuple(row) for row in session.execute(
+                select(NoteChunk.id, NoteChunk.note_id, NoteChunk.vault_id, NoteChunk.content_hash,
+                       NoteChunk.content)
+                .where(self.missing_embedding(model), NoteChunk.id > after_id)
+                .order_by(NoteChunk.id).limit(limit)
+            )]
+
+    def add_chunk_embeddings(self, model: str, rows: List[dict]):
+        """Store embeddings for one model from {note_id, vault_id, content_hash, embedding} rows.
+
+        Rows whose (note, model, hash) is already stored are skipped.
+        """
+        if not rows:
+            return
+        if model not in self.get_models():
+            self.register_model(model, len(rows[0]['embedding']))
+        with self.session_scope() as session:
+            session.execute(insert(NoteEmbedding).on_conflict_do_nothing(),
+                            [{**row, 'model': model} for row in rows])
+
+    def get_contents(self, note_ids: List[int]) -> dict:
+        with self.session_scope() as session:
+            return dict(session.execute(select(Note.id, Note.content).where(Note.id.in_(note_ids))).all())
+
+    def add_note_tags(self, pairs: List[tuple]):
+        """Tag notes in bulk from (note id, tag name) pairs, creating missing tags."""
+        if not pairs:
+            return
+        names = sorted({name for _, name in pairs})
+        with self.session_scope() as session:
+            session.execute(insert(Tag).values([{'name': name} for name in names])
+                            .on_conflict_do_nothing(index_elements=['name']))
+            tag_ids = dict(session.execute(select(Tag.name, Tag.id).where(Tag.name.in_(names))).all())
+            session.execute(
+                insert(note_tags).values([{'note_id': note_id, 'tag_id': tag_ids[name]}
+                                          for note_id, name in set(pairs)])
+                .on_conflict_do_nothing()
+            )
+
+    def get_notes_by_tag(self, tag_name: str) -> List[NoteSummary]:
+        return list(self.iter_notes(tag_name))
+
+    def upsert_notes(self, rows: Iterable[dict], batch_size: int = 500) -> dict:
+        """INSERT ... ON CONFLICT (path) DO UPDATE for many notes.
+
+        Each batch is one statement. Rows with the same set of keys share a
+        statement, and only the given columns are overwritten on conflict.
+        Returns {path: id}.
+        """
+        groups = {}
+        for row in rows:
+            groups.setdefault(tuple(sorted(row)), []).append(row)
+
+        ids = {}
+        with self.session_scope() as session:
+            for keys, group in groups.items():
+                for start in range(0, len(group), batch_size):
+                    stmt = insert(Note).values(group[start:start + batch_size])
+                    stmt = stmt.on_conflict_do_update(
+                        index_elements=[Note.path],
+                        set_={key: stmt.excluded[key] for key in keys if key != 'path'},
+                    ).returning(Note.path, Note.id)
+                    ids.update(session.execute(stmt).all())
+        return ids
+
+    def upsert_note(self, note: Note) -> Note:
+        row = {key: getattr(note, key) for key in NOTE_WRITE_COLUMNS if key in note.__dict__}
+        note.id = self.upsert_notes([row])[note.path]
+        return note
+
+    def get_chunk_hashes(self, paths: List[str], model: str) -> dict:
+        # Hashes of each note's chunks that have an embedding under model
+        with self.session_scope() as session:
+            rows = session.execute(
+                select(Note.path, NoteEmbedding.content_hash)
+                .join(NoteEmbedding, NoteEmbedding.note_id == Note.id)
+                .where(Note.path.in_(paths), NoteEmbedding.model == model)
+            ).all()
+            hashes = {}
+            for path, h in rows:
+                hashes.setdefault(path, set()).add(h)
+            return hashes
+
+    def sync_chunks(self, path: str, chunks: List[dict], embeddings: dict):
+        """Bring a note's chunks in line with chunking.chunk_rows() output.
+
+        embeddings maps model -> {content hash: vector} and only needs the
+        hashes that model has not stored for this note yet; stored ones are
+        kept, and embeddings of hashes the note no longer has are removed.
+        Returns (note id, note-level embedding) when the note's chunks
+        changed, else None.
+        """
+        embeddings = self.registered_embeddings(embeddings)
+        active = self.active_model()
+        with self.session_scope() as session:
+            note = session.execute(select(Note.id, Note.vault_id).where(Note.path == path)).one_or_none()
+            if note is None:
+                raise ValueError(f"Note with path {path} not found")
+            note_id, vault_id = note
+
+            existing = {}
+            rows = session.execute(
+                select(NoteChunk.id, NoteChunk.content_hash, NoteChunk.position)
+                .where(NoteChunk.note_id == note_id)
+            ).all()
+            for chunk_id, h, position in rows:
+                existing.setdefault(h, []).append((chunk_id, position))
+
+            moved, new_rows = [], []
+            for chunk in chunks:
+                matches = existing.get(chunk['content_hash'])
+                if matches:
+                    chunk_id, position = matches.pop()
+                    if position != chunk['position']:
+                        moved.append({'b_id': chunk_id, 'b_position': chunk['position']})
                 else:
-                    # Add new note
-                    session.add(note)
+                    new_rows.append({**chunk, 'note_id': note_id, 'vault_id': vault_id})
+            stale = [chunk_id for matches in existing.values() for chunk_id, _ in matches]
 
-                session.commit()
-                return note
-            except Exception as e:
-                session.rollback()
-                print(f"Error in upsert_note: {str(e)}")
-                raise
+            if stale:
+                session.execute(delete(NoteChunk).where(NoteChunk.id.in_(stale)))
+            if moved:
+                chunk_table = NoteChunk.__table__
+                session.connection().execute(
+                    update(chunk_table).where(chunk_table.c.id == bindparam('b_id'))
+                    .values(position=bindparam('b_position')),
+                    moved
+                )
+            if new_rows:
+                session.execute(insert(NoteChunk), new_rows)
+
+            hashes = {chunk['content_hash'] for chunk in chunks}
+            vectors = [{'note_id': note_id, 'model': model, 'content_hash': h, 'vault_id': vault_id,
+                        'embedding': stored[h]}
+                       for model, stored in embeddings.items() for h in hashes if h in stored]
+            if vectors:
+                # Hashes already stored for a model are skipped, not rewritten
+                session.execute(insert(NoteEmbedding).on_conflict_do_nothing(), vectors)
+            session.execute(delete(NoteEmbedding).where(NoteEmbedding.note_id == note_id,
+                                                        NoteEmbedding.content_hash.not_in(list(hashes))))
+
+            if (stale or new_rows) and active is not None:
+                mean = session.scalar(
+                    select(avg(NoteEmbedding.embedding))
+                    .join(NoteChunk, (NoteChunk.note_id == NoteEmbedding.note_id)
+                          & (NoteChunk.content_hash == NoteEmbedding.content_hash))
+                    .where(NoteEmbedding.note_id == note_id, NoteEmbedding.model == active[0])
+                )
+                if mean is not None:
+                    return note_id, mean
+            return None
+
+    def set_ef_search(self, session, ef_search: Union[int, None], n: int):
+        # hnsw returns at most ef_search rows per index scan, so it must cover
+        # the candidate pool. SET LOCAL scopes it to this transaction. A
+        # requested value is always set, so it can also go below the default.
+        if ef_search is None and n <= HNSW_EF_SEARCH_DEFAULT:
+            return
+        ef_search = max(ef_search or 0, n)
+        session.execute(select(func.set_config('hnsw.ef_search', str(ef_search), True)))
+
+    def candidate_distance(self, embedding, query, dim: int):
+        # The expression the hnsw index is built on, so the planner can use it
+        mode = index_mode(self.quantization, dim)
+        if mode == 'halfvec':
+            return cast(embedding, HALFVEC(dim)).cosine_distance(cast(query, HALFVEC(dim)))
+        if mode == 'binary':
+            return (cast(func.binary_quantize(embedding), BIT(dim))
+                    .hamming_distance(cast(func.binary_quantize(query), BIT(dim))))
+        return cast(embedding, Vector(dim)).cosine_distance(query)
+
+    def candidate_pool(self, n: int) -> int:
+        # Quantized candidates are re-ranked on the full vectors, so fetch more
+        return n * self.rerank_factor
+
+    def chunk_candidates(self, columns: list, candidate, limit: int, model: str,
+                         vault_ids: Union[List[int], None], *where):
+        """Nearest chunk embeddings of model by candidate, limit per vault, as one statement.
+
+        Each vault is scanned on its own with the model and vault id inlined,
+        so the planner matches that pair's partial hnsw index. Callers take
+        .subquery() or .lateral() of the result.
+        """
+        scans = [select(*columns)
+                 .where(NoteEmbedding.model == literal(model, literal_execute=True),
+                        NoteEmbedding.vault_id == literal_column(str(int(vault_id))), *where)
+                 .order_by(candidate).limit(limit)
+                 for vault_id in self.vault_scope(vault_ids)]
+        if len(scans) == 1:
+            return scans[0]
+        return union_all(*scans)
 
-    def add_embedding(self, note_id: int, embedding: List[float]):
+    @staticmethod
+    def filter_hits(stmt, tags: Union[List[str], None], folder: Union[str, None],
+                    vault_ids: Union[List[int], None] = None):
+        if vault_ids is not None:
+            stmt = stmt.where(Note.vault_id.in_(vault_ids))
+        if tags:
+            stmt = stmt.where(Note.tags.any(Tag.name.in_(tags)))
+        if folder:
+            stmt = stmt.where(Note.path.startswith(folder.rstrip('/') + '/'))
+        return stmt
+
+    def search_similar(self, query_embedding: List[float], n: int = 5,
+                       exclude_note_id: int = None, ef_search: int = None,
+                       tags: List[str] = None, folder: str = None,
+                       candidates: int = 4, exact: bool = False,
+                       vault_ids: List[int] = None) -> List[NoteHit]:
+        """Nearest notes to an embedding, scored by their closest chunk.
+
+        Orders candidates by the same expression as the active model's hnsw
+        indexes and scores them by exact cosine distance, so query_embedding
+        must come from the active model. Filters are applied to the candidate
+        pool, which grows when filtering.
+        """
+        active = self.active_model()
+        if active is None:
+            return []
+        model, dim = active
+        if tags or folder:
+            candidates *= 10
+        limit = self.candidate_pool(n * candidates)
         with self.session_scope() as session:
-            note = session.query(Note).filter(Note.id == note_id).first()
-            if note:
-                note.embedding = embedding
-                session.commit()
-            else:
-                raise ValueError(f"Note with id {note_id} not found")
+            if exact:
+                # Force a sequential scan for ground truth comparisons
+                session.execute(select(func.set_config('enable_indexscan', 'off', True)))
+            self.set_ef_search(session, ef_search, limit)
+            query = cast(literal(query_embedding, Vector(dim)), Vector(dim))
+            # Candidates come from the index, scores from the full vectors
+            distance = NoteEmbedding.embedding.cosine_distance(query)
+            candidate = distance if exact else self.candidate_distance(NoteEmbedding.embedding, query, dim)
+            excluded = [NoteEmbedding.note_id != exclude_note_id] if exclude_note_id is not None else []
+            hits = self.chunk_candidates([NoteEmbedding.note_id, distance.label('distance')],
+                                         candidate, limit, model, vault_ids, *excluded).subquery()
+            best = (select(hits.c.note_id, func.min(hits.c.distance).label('distance'))
+                    .group_by(hits.c.note_id).subquery())
+            stmt = (select(Note.id, Note.name, Note.path, (1 - best.c.distance).label('score'))
+                    .join(best, best.c.note_id == Note.id))
+            stmt = self.filter_hits(stmt, tags, folder, vault_ids).order_by(best.c.distance).limit(n)
+            return [NoteHit(*row) for row in session.execute(stmt)]
 
-    def get_similar_notes(self, query_embedding: List[float], n: int = 5):
+    def search_text(self, query: str, n: int = 10, query_embedding: List[float] = None,
+                    tags: List[str] = None, folder: str = None, pool: int = 50,
+                    rrf_k: int = 60, vault_ids: List[int] = None) -> List[NoteHit]:
+        """Full-text search, optionally fused with vector similarity.
+
+        Without query_embedding this is a plain ranked tsvector match. With
+        it, the keyword and chunk similarity rankings are combined by
+        reciprocal-rank fusion, score = sum(1 / (rrf_k + rank)), in a single
+        statement. query_embedding must come from the active model.
+        """
+        active = self.active_model()
         with self.session_scope() as session:
-            results = session.scalars(select(Note).order_by(
-                Note.embedding.l2_distance(query_embedding)
-            ).limit(n)).all()
-            for result in results:
-                session.expunge(result)
-            return results
+            tsquery = func.websearch_to_tsquery(TEXT_SEARCH_CONFIG, query)
+            text_rank = func.ts_rank_cd(Note.content_tsv, tsquery)
+            if query_embedding is None or active is None:
+                stmt = (select(Note.id, Note.name, Note.path, text_rank.label('score'))
+                        .where(Note.content_tsv.op('@@')(tsquery)))
+                stmt = self.filter_hits(stmt, tags, folder, vault_ids).order_by(text_rank.desc()).limit(n)
+                return [NoteHit(*row) for row in session.execute(stmt)]
+
+            keyword = (select(Note.id.label('id'),
+                              func.row_number().over(order_by=text_rank.desc()).label('rank'))
+                       .where(Note.content_tsv.op('@@')(tsquery)))
+            keyword = self.filter_hits(keyword, None, None, vault_ids)
+            keyword = keyword.order_by(text_rank.desc()).limit(pool).cte('keyword')
 
+            model, dim = active
+            limit = self.candidate_pool(pool)
+            self.set_ef_search(session, None, limit)
+            vector = cast(literal(query_embedding, Vector(dim)), Vector(dim))
+            hits = self.chunk_candidates(
+                [NoteEmbedding.note_id, NoteEmbedding.embedding.cosine_distance(vector).label('distance')],
+                self.candidate_distance(NoteEmbedding.embedding, vector, dim), limit, model, vault_ids
+            ).subquery()
+            best = func.min(hits.c.distance)
+            semantic = (select(hits.c.note_id.label('id'),
+                               func.row_number().over(order_by=best).label('rank'))
+                        .group_by(hits.c.note_id).cte('semantic'))
 
-    def bulk_add_embeddings(self, note_ids: List[int], embeddings: List[List[float]]):
+            ranks = union_all(select(keyword.c.id, keyword.c.rank),
+                              select(semantic.c.id, semantic.c.rank)).subquery()
+            fused = (select(ranks.c.id, func.sum(1.0 / (rrf_k + ranks.c.rank)).label('score'))
+                     .group_by(ranks.c.id).subquery())
+            stmt = (select(Note.id, Note.name, Note.path, fused.c.score)
+                    .join(fused, fused.c.id == Note.id))
+            stmt = self.filter_hits(stmt, tags, folder, vault_ids).order_by(fused.c.score.desc()).limit(n)
+            return [NoteHit(*row) for row in session.execute(stmt)]
+
+    def search_similar_to_note(self, note_id: int, n: int = 5, ef_search: int = None,
+                               tags: List[str] = None, folder: str = None,
+                               per_chunk: int = 10, vault_ids: List[int] = None) -> List[NoteHit]:
+        """Nearest notes to a stored note, excluding the note itself.
+
+        Every chunk of the note queries the active model's index on its own
+        and a note scores by its closest chunk to any of them. A model that
+        is still being backfilled is never read, so this keeps serving from
+        the old model until switch_model.
+        """
+        active = self.active_model()
+        if active is None:
+            return []
+        model, dim = active
+        if tags or folder:
+            per_chunk *= 10
+        per_chunk = self.candidate_pool(per_chunk)
         with self.session_scope() as session:
-            for note_id, embedding in zip(note_ids, embeddings):
-                note = session.query(Note).filter(Note.id == note_id).first()
-                if note:
-                    note.embedding = embedding
-            session.commit()
+            self.set_ef_search(session, ef_search, per_chunk)
+            query_chunk = aliased(NoteEmbedding)
+            candidate = self.candidate_distance(NoteEmbedding.embedding, query_chunk.embedding, dim)
+            distance = NoteEmbedding.embedding.cosine_distance(query_chunk.embedding)
+            hits = self.chunk_candidates([NoteEmbedding.note_id, distance.label('distance')], candidate,
+                                         per_chunk, model, vault_ids,
+                                         NoteEmbedding.note_id != query_chunk.note_id).lateral()
+            best = (select(hits.c.note_id, func.min(hits.c.distance).label('distance'))
+                    .select_from(query_chunk).join(hits, true())
+                    .where(query_chunk.note_id == note_id, query_chunk.model == model)
+                    .group_by(hits.c.note_id).subquery())
+            stmt = (select(Note.id, Note.name, Note.path, (1 - best.c.distance).label('score'))
+                    .join(best, best.c.note_id == Note.id))
+            stmt = self.filter_hits(stmt, tags, folder, vault_ids).order_by(best.c.distance).limit(n)
+            return [NoteHit(*row) for row in session.execute(stmt)]
 
     def delete_note(self, note_id: int):
         with self.session_scope() as session:
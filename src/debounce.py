@@ -0,0 +1,91 @@
+import heapq
+import threading
+import time
+from pathlib import Path
+from typing import Callable
+from metrics import REGISTRY
+
+class Debouncer:
+    """Trailing-edge, per-path coalescing of file events.
+
+    Every event for a path pushes its deadline back to now + delay, and the
+    path fires once no event has arrived for delay seconds, so a burst of
+    saves becomes a single callback that reads the final content. A path
+    written without pause still fires max_wait seconds after its first event.
+
+    Pending paths are kept in a dict and a heap with one entry per path, and
+    both are cleared when a path fires, so memory is bounded by the number
+    of paths with events in flight.
+    """
+
+    def __init__(self, fire: Callable[[Path], None], delay: float = 0.25, max_wait: float = 5.0):
+        self.fire = fire
+        self.delay = delay
+        self.max_wait = max_wait
+        self.pending = {}
+        self.heap = []
+        self.cond = threading.Condition()
+        self.closed = False
+        self.thread = threading.Thread(target=self.run, name='debounce')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def __len__(self):
+        return len(self.pending)
+
+    def touch(self, path: Path):
+        now = time.monotonic()
+        key = str(path)
+        with self.cond:
+            entry = self.pending.get(key)
+            first_seen = entry[1] if entry is not None else now
+            deadline = min(now + self.delay, first_seen + self.max_wait)
+            self.pending[key] = (deadline, first_seen, path)
+            if entry is not None:
+                # The heap entry is pushed back lazily when it comes due
+                REGISTRY.incr('debounce_coalesced')
+                return
+            heapq.heappush(self.heap, (deadline, key))
+            if self.heap[0][1] == key:
+                self.cond.notify()
+
+    def due(self) -> list[Path]:
+        # Called with the lock held; returns the paths whose quiet period is over
+        now = time.monotonic()
+        ready = []
+        while self.heap and self.heap[0][0] <= now:
+            _, key = heapq.heappop(self.heap)
+            deadline, _, path = self.pending[key]
+            if deadline > now:
+                heapq.heappush(self.heap, (deadline, key))
+            else:
+                del self.pending[key]
+                ready.append(path)
+        return ready
+
+    def run(self):
+        while True:
+            with self.cond:
+                while not self.closed:
+                    ready = self.due()
+                    if ready:
+                        break
+                    self.cond.wait(self.heap[0][0] - time.monotonic() if self.heap else None)
+                else:
+                    return
+            # Fire outside the lock, the callback may block on a full ingest queue
+            for path in ready:
+                self.fire(path)
+
+    def close(self):
+        # Pending paths fire right away, so an edit made just before shutdown
+        # is still ingested
+        with self.cond:
+            self.closed = True
+            ready = [path for _, _, path in self.pending.values()]
+            self.pending.clear()
+            self.heap.clear()
+            self.cond.notify()
+        self.thread.join()
+        for path in ready:
+            self.fire(path)
@@ -0,0 +1,83 @@
+import re
+import time
+import hashlib
+import numpy as np
+from types import SimpleNamespace
+from models import EMBEDDING_DIM
+
+# A stand-in for the OpenAI client, for benchmarks and offline runs:
+# LLM(..., llm_client=FakeOpenAI()) keeps batching, caching, rate limiting
+# and metrics on their real code paths and only replaces the network.
+
+WORD_PATTERN = re.compile(r'\w+')
+
+class FakeEmbeddings:
+    """Deterministic bag-of-words embeddings.
+
+    Every word maps to a fixed random direction seeded by its hash, and a
+    text embeds to the normalised sum of its words, so texts that share
+    words land near each other like they would with a real model.
+    """
+
+    def __init__(self, dim: int = EMBEDDING_DIM, latency: float = 0.0):
+        self.dim = dim
+        self.latency = latency
+        self.words = {}
+
+    def word_vector(self, word: str) -> np.ndarray:
+        vector = self.words.get(word)
+        if vector is None:
+            seed = int.from_bytes(hashlib.blake2b(word.encode(), digest_size=8).digest(), 'little')
+            vector = self.words[word] = np.random.default_rng(seed).standard_normal(self.dim, dtype=np.float32)
+        return vector
+
+    def vector(self, text: str) -> list[float]:
+        total = np.zeros(self.dim, dtype=np.float32)
+        for word in WORD_PATTERN.findall(text.lower()):
+            total += self.word_vector(word)
+        norm = np.linalg.norm(total)
+        if norm == 0:
+            total[0], norm = 1.0, 1.0
+        return (total / norm).tolist()
+
+    def create(self, model: str, input: list[str]):
+        if self.latency:
+            time.sleep(self.latency)
+        data = [SimpleNamespace(index=i, embedding=self.vector(text)) for i, text in enumerate(input)]
+        tokens = sum(len(text) // 4 + 1 for text in input)
+        return SimpleNamespace(data=data, usage=SimpleNamespace(total_tokens=tokens))
+
+class FakeCompletions:
+    """Answers with a fixed-size digest of the prompt, streamed word by word."""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+
+    def create(self, model: str, messages: list[dict], stream: bool = False, stream_options: dict = None):
+        if self.latency:
+            time.sleep(self.latency)
+        prompt = '\n'.join(message['content'] for message in messages)
+        digest = hashlib.sha256(prompt.encode()).hexdigest()[:12]
+        content = f'Fake response {digest} to {len(prompt)} characters of prompt.'
+        usage = SimpleNamespace(prompt_tokens=len(prompt) // 4 + 1, completion_tokens=len(content) // 4 + 1)
+        if not stream:
+            message = SimpleNamespace(content=content)
+            return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=usage)
+        return self.stream(content, usage, stream_options)
+
+    @staticmethod
+    def stream(content: str, usage, stream_options: dict = None):
+        for word in re.findall(r'\S+\s*', content):
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=word))], usage=None)
+        if stream_options and stream_options.get('include_usage'):
+            yield SimpleNamespace(choices=[], usage=usage)
+
+class FakeImages:
+    def generate(self, prompt: str, n: int = 1, size: str = None):
+        return SimpleNamespace(url=f'https://example.invalid/{hashlib.sha256(prompt.encode()).hexdigest()[:12]}.png')
+
+class FakeOpenAI:
+    def __init__(self, latency: float = 0.0, dim: int = EMBEDDING_DIM):
+        self.embeddings = FakeEmbeddings(dim, latency)
+        self.chat = SimpleNamespace(completions=FakeCompletions(latency))
+        self.images = FakeImages()
@@ -0,0 +1,130 @@
+import threading
+import numpy as np
+from collections import deque
+from typing import Iterable, List, Union
+
+class LinkGraph:
+    """Wiki-link graph held as CSR adjacency arrays keyed by note id.
+
+    Edges are stored as two parallel id arrays. Edits update those arrays
+    and mark the graph dirty; the CSR offsets are rebuilt lazily on the next
+    query, so a burst of edits costs a single rebuild.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.names = {}
+        self.paths = {}
+        self.src = np.empty(0, dtype=np.int64)
+        self.dst = np.empty(0, dtype=np.int64)
+        self.dirty = True
+        self.loaded = False
+
+    def load(self, notes: Iterable[tuple], links: Iterable[tuple]):
+        """notes: (id, name, path) rows, links: (from_id, to_id) rows."""
+        names, paths = {}, {}
+        for note_id, name, path in notes:
+            names[note_id] = name
+            paths[note_id] = path
+        edges = np.array(list(links), dtype=np.int64).reshape(-1, 2)
+        with self.lock:
+            self.names, self.paths = names, paths
+            self.src, self.dst = edges[:, 0].copy(), edges[:, 1].copy()
+            self.dirty = True
+            self.loaded = True
+
+    def add_node(self, note_id: int, name: str, path: str):
+        with self.lock:
+            self.names[note_id] = name
+            self.paths[note_id] = path
+
+    def remove_node(self, note_id: int):
+        with self.lock:
+            self.names.pop(note_id, None)
+            self.paths.pop(note_id, None)
+            keep = (self.src != note_id) & (self.dst != note_id)
+            self.src, self.dst = self.src[keep], self.dst[keep]
+            self.dirty = True
+
+    def apply(self, edges_added: List[tuple], edges_removed: List[tuple]):
+        with self.lock:
+            if edges_removed:
+                removed = np.array(edges_removed, dtype=np.int64)
+                # Pack each (src, dst) pair into one value to test membership
+                keys = self.src * (1 << 32) + self.dst
+                gone = np.isin(keys, removed[:, 0] * (1 << 32) + removed[:, 1])
+                self.src, self.dst = self.src[~gone], self.dst[~gone]
+            if edges_added:
+                added = np.array(edges_added, dtype=np.int64)
+                self.src = np.concatenate([self.src, added[:, 0]])
+                self.dst = np.concatenate([self.dst, added[:, 1]])
+            self.dirty = True
+
+    def rebuild(self):
+        # Dense indices over all known ids, then CSR offsets for both directions
+        self.ids = np.array(sorted(self.names), dtype=np.int64)
+        known = np.isin(self.src, self.ids) & np.isin(self.dst, self.ids)
+        src = np.searchsorted(self.ids, self.src[known])
+        dst = np.searchsorted(self.ids, self.dst[known])
+        self.out_offsets, self.out_targets = self.csr(src, dst)
+        self.in_offsets, self.in_targets = self.csr(dst, src)
+        self.dirty = False
+
+    def csr(self, rows: np.ndarray, cols: np.ndarray) -> tuple:
+        order = np.argsort(rows, kind='stable')
+        counts = np.bincount(rows, minlength=len(self.ids))
+        offsets = np.zeros(len(self.ids) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        return offsets, cols[order]
+
+    def index_of(self, note_id: int) -> Union[int, None]:
+        i = int(np.searchsorted(self.ids, note_id))
+        return i if i < len(self.ids) and self.ids[i] == note_id else None
+
+    def find(self, name: str) -> List[int]:
+        if not name.endswith('.md'):
+            name += '.md'
+        with self.lock:
+            return [note_id for note_id, n in self.names.items() if n == name]
+
+    def backlinks(self, note_id: int) -> List[int]:
+        with self.lock:
+            if self.dirty:
+                self.rebuild()
+            i = self.index_of(note_id)
+            if i is None:
+                return []
+            return self.ids[self.in_targets[self.in_offsets[i]:self.in_offsets[i + 1]]].tolist()
+
+    def neighbors(self, note_id: int, depth: int = 1) -> List[tuple]:
+        """Notes within depth links in either direction, as (id, distance)."""
+        with self.lock:
+            if self.dirty:
+                self.rebuild()
+            start = self.index_of(note_id)
+            if start is None:
+                return []
+
+            seen = {start: 0}
+            frontier = deque([start])
+            while frontier:
+                i = frontier.popleft()
+                if seen[i] == depth:
+                    continue
+                adjacent = np.concatenate([
+                    self.out_targets[self.out_offsets[i]:self.out_offsets[i + 1]],
+                    self.in_targets[self.in_offsets[i]:self.in_offsets[i + 1]],
+                ])
+                for j in adjacent.tolist():
+                    if j not in seen:
+                        seen[j] = seen[i] + 1
+                        frontier.append(j)
+            del seen[start]
+            return sorted(((int(self.ids[i]), d) for i, d in seen.items()), key=lambda x: x[1])
+
+    def orphans(self) -> List[int]:
+        with self.lock:
+            if self.dirty:
+                self.rebuild()
+            degree = np.diff(self.out_offsets) + np.diff(self.in_offsets)
+            return self.ids[degree == 0].tolist()
@@ -0,0 +1,245 @@
+import os
+import re
+import sys
+import time
+import yaml
+from itertools import islice
+from pathlib import Path
+from queue import Queue
+from typing import Iterable, Iterator, Union
+from concurrent.futures import ProcessPoolExecutor
+from sqlalchemy import insert, text
+from models import NoteChunk, NoteEmbedding, DEFAULT_VAULT, DEFAULT_VAULT_ID, NAME_LENGTH
+from cache import content_hash
+from chunking import chunk_rows, embed_new_chunks
+from database_client import DbClient
+
+# [[target]], [[target|alias]] and [[target#heading]] all link to target
+LINK_PATTERN = re.compile(r'\[\[([^\]|#]+)(?:[|#][^\]]*)?\]\]')
+
+def extract_links(content: str) -> list[str]:
+    return [target.strip() for target in LINK_PATTERN.findall(content)]
+
+# LLM output written next to a note by crit and crit_diff
+SIDECAR_SUFFIXES = ('.llm.md', '.llm_diff.md')
+
+def is_note_file(filename: str) -> bool:
+    return filename.endswith('.md') and not filename.endswith(SIDECAR_SUFFIXES)
+
+def walk_notes(root: str) -> Iterator[str]:
+    for dirpath, dirnames, filenames in os.walk(root):
+        # Skip hidden folders such as .obsidian and .git
+        dirnames[:] = [d for d in dirnames if not d.startswith('.')]
+        for filename in filenames:
+            if is_note_file(filename):
+                yield os.path.join(dirpath, filename)
+
+def parse_note(path: str) -> Union[dict, None]:
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            content = f.read()
+        stat_info = os.stat(path)
+    except (OSError, UnicodeDecodeError):
+        return None
+
+    return {
+        'path': path,
+        'name': Path(path).name,
+        'content': content,
+        'content_hash': content_hash(content),
+        'mtime': stat_info.st_mtime,
+        'size': stat_info.st_size,
+        'links': extract_links(content),
+        'chunks': chunk_rows(content),
+    }
+
+NOTE_COLUMNS = ('path', 'name', 'content', 'content_hash', 'mtime', 'size')
+
+def batched(iterable: Iterable, n: int) -> Iterator[list]:
+    it = iter(iterable)
+    while batch := list(islice(it, n)):
+        yield batch
+
+def config_vault_roots(config: dict) -> dict:
+    # vaults: [{name, root}, ...]; a plain dir.root is the default vault
+    if 'vaults' in config:
+        return {vault['name']: vault['root'] for vault in config['vaults']}
+    return {DEFAULT_VAULT: config['dir']['root']}
+
+def vault_for(db_client: DbClient, vault_roots: dict, root: str) -> int:
+    # The configured vault containing root, else the default vault
+    path = Path(root).resolve()
+    for name, vault_root in vault_roots.items():
+        if path.is_relative_to(Path(vault_root).resolve()):
+            return db_client.ensure_vault(name, vault_root)
+    return db_client.ensure_vault(DEFAULT_VAULT)
+
+class Importer:
+    """Streams a vault into the database.
+
+    Files are read and parsed in a process pool one batch ahead of the
+    loader, so memory stays bounded by two batches regardless of vault size.
+    Links are staged in a temp table and resolved in one statement at the end.
+    """
+
+    def __init__(self, db_client: DbClient, llm, message_queue: Queue = None,
+                 processes: int = None, batch_size: int = 256, vault_id: int = DEFAULT_VAULT_ID):
+        self.db_client = db_client
+        self.vault_id = vault_id
+        self.llm = llm
+        self.message_queue = message_queue
+        self.processes = processes
+        self.batch_size = batch_size
+        self.imported = 0
+        self.skipped = 0
+
+    def report(self, message: str):
+        if self.message_queue is not None:
+            self.message_queue.put(message)
+        else:
+            print(message)
+
+    def run(self, root: str):
+        start = time.time()
+        with self.db_client.engine.connect() as conn:
+            conn.execute(text('CREATE TEMP TABLE IF NOT EXISTS import_links (from_path text, target text)'))
+            conn.execute(text('CREATE TEMP TABLE IF NOT EXISTS import_new_notes (path text)'))
+            conn.commit()
+
+            with ProcessPoolExecutor(self.processes) as executor:
+                pending = None
+                for paths in batched(walk_notes(root), self.batch_size):
+                    # executor.map submits the whole batch immediately, so the
+                    # next batch is parsed while the current one is loaded
+                    parsed = executor.map(parse_note, paths, chunksize=16)
+                    if pending is not None:
+                        self.load(conn, pending)
+                    pending = parsed
+                if pending is not None:
+                    self.load(conn, pending)
+
+            linked = self.resolve_links(conn)
+
+        elapsed = time.time() - start
+        self.report(f'Imported {self.imported} notes ({self.skipped} unchanged) and '
+                    f'{linked} links in {elapsed:.1f}s')
+
+    def load(self, conn, parsed: Iterable[Union[dict, None]]):
+        notes = [note for note in parsed if note is not None]
+        if not notes:
+            return
+
+        paths = [note['path'] for note in notes]
+        stored = self.db_client.get_content_hashes(paths)
+        self.db_client.move_to_vault(paths, self.vault_id)
+        models = self.db_client.write_models(self.llm.embed_model)
+        known = {model: self.db_client.get_chunk_hashes(paths, model) for model in models}
+        changed = [note for note in notes
+                   if stored.get(note['path']) != note['content_hash']
+                   or any(note['path'] not in known[model] for model in models)]
+        self.skipped += len(notes) - len(changed)
+        if not changed:
+            return
+
+        chunks = {note['path']: note['chunks'] for note in changed}
+        embeddings = self.db_client.registered_embeddings(
+            {model: embed_new_chunks(self.llm, chunks, known[model], model) for model in models}
+        )
+
+        # Changed notes are upserted in one statement; existing ones then
+        # have their chunks and links brought up to date one by one
+        existing = [note for note in changed if note['path'] in stored]
+        self.db_client.upsert_notes({**{key: note[key] for key in NOTE_COLUMNS}, 'vault_id': self.vault_id}
+                                    for note in existing)
+        for note in existing:
+            self.db_client.sync_chunks(note['path'], note['chunks'], embeddings)
+            self.db_client.sync_links(note['path'], [f'{target}.md' for target in note['links']])
+
+        # A new note's chunks are all freshly embedded, so they and their
+        # embeddings (one per distinct hash and model) are bulk inserted
+        new_notes = [note for note in changed if note['path'] not in stored]
+        if new_notes:
+            rows = [{**{key: note[key] for key in NOTE_COLUMNS}, 'vault_id': self.vault_id} for note in new_notes]
+            ids = self.db_client.upsert_notes(rows)
+            conn.execute(text('INSERT INTO import_new_notes (path) VALUES (:path)'),
+                         [{'path': note['path']} for note in new_notes])
+            new_chunks = [{**chunk, 'note_id': ids[note['path']], 'vault_id': self.vault_id}
+                          for note in new_notes for chunk in note['chunks']]
+            if new_chunks:
+                conn.execute(insert(NoteChunk), new_chunks)
+                vectors = {(row['note_id'], model, row['content_hash']): embeddings[model][row['content_hash']]
+                           for model in embeddings for row in new_chunks}
+                if vectors:
+                    conn.execute(insert(NoteEmbedding), [
+                        {'note_id': note_id, 'model': model, 'content_hash': h, 'vault_id': self.vault_id,
+                         'embedding': vector}
+                        for (note_id, model, h), vector in vectors.items()
+                    ])
+        link_rows = [{'from_path': note['path'], 'target': f'{target}.md'}
+                     for note in changed for target in note['links']]
+        if link_rows:
+            conn.execute(text('INSERT INTO import_links (from_path, target) VALUES (:from_path, :target)'),
+                         link_rows)
+        conn.commit()
+
+        self.imported += len(changed)
+        self.report(f'Imported {self.imported} notes...')
+
+    def resolve_links(self, conn) -> int:
+        # Targets are kept for notes created after the import, see link_incoming
+        conn.execute(text(
+            'INSERT INTO note_link_targets (from_note_id, target) '
+            'SELECT DISTINCT src.id, l.target FROM import_links l '
+            'JOIN notes src ON src.path = l.from_path '
+            f'WHERE length(l.target) <= {NAME_LENGTH} '
+            'ON CONFLICT DO NOTHING'
+        ))
+        result = conn.execute(text(
+            'INSERT INTO note_links (from_note_id, to_note_id) '
+            'SELECT DISTINCT src.id, dst.id FROM import_links l '
+            'JOIN notes src ON src.path = l.from_path '
+            'JOIN notes dst ON dst.name = l.target AND dst.vault_id = src.vault_id '
+            'WHERE src.id <> dst.id '
+            'ON CONFLICT DO NOTHING'
+        ))
+        # Notes already stored may name a note this import created, as in
+        # DbClient.link_incoming
+        incoming = conn.execute(text(
+            'INSERT INTO note_links (from_note_id, to_note_id) '
+            'SELECT t.from_note_id, dst.id FROM import_new_notes n '
+            'JOIN notes dst ON dst.path = n.path '
+            'JOIN note_link_targets t ON t.target = dst.name '
+            'JOIN notes src ON src.id = t.from_note_id AND src.vault_id = dst.vault_id '
+            'WHERE src.id <> dst.id '
+            'ON CONFLICT DO NOTHING'
+        ))
+        conn.execute(text('DROP TABLE import_links'))
+        conn.execute(text('DROP TABLE import_new_notes'))
+        conn.commit()
+        return result.rowcount + incoming.rowcount
+
+if __name__ == '__main__':
+    from main import build_llm
+
+    with open('config.yaml', 'r') as f:
+        config = yaml.safe_load(f)
+
+    vault_roots = config_vault_roots(config)
+    root_dir = sys.argv[1] if len(sys.argv) > 1 else next(iter(vault_roots.values()))
+    user = config['postgres']['user']
+    password = config['postgres']['password']
+    host = config['postgres']['host']
+    database = config['postgres']['database']
+    # Same models, limits and index quantization as the CLI
+    openai_config = config.get('openai', {})
+    chat_model = openai_config.get('chat_model', 'gpt-4o-mini')
+    embed_model = openai_config.get('embed_model', 'text-embedding-3-small')
+    cache_config = config.get('cache', {})
+    quantization = config.get('storage', {}).get('quantization')
+
+    db_client = DbClient(host, database, user, password, quantization)
+    llm = build_llm(chat_model, embed_model, db_client, cache_config, openai_config)
+    Importer(db_client, llm, vault_id=vault_for(db_client, vault_roots, root_dir)).run(root_dir)
+    llm.embed_cache.close()
+    llm.response_cache.close()
+    db_client.close()
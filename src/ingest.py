@@ -0,0 +1,81 @@
+import queue
+import threading
+import time
+from pathlib import Path
+from typing import Callable
+from metrics import REGISTRY
+
+_STOP = object()
+
+class IngestPool:
+    """Bounded work queue drained by a pool of ingestion workers.
+
+    Paths are sharded across workers by hash, so every event for one note is
+    handled by the same worker in submission order. submit() blocks once a
+    worker's queue is full, pushing backpressure onto the caller.
+    """
+
+    def __init__(self, ingest: Callable[[list[Path]], None], message_queue: queue.Queue,
+                 workers: int = 2, max_queued: int = 256, batch_window: float = 0.5,
+                 max_batch: int = 64):
+        self.ingest = ingest
+        self.message_queue = message_queue
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.queues = [queue.Queue(maxsize=max(1, max_queued // workers)) for _ in range(workers)]
+        self.threads = []
+        for i, q in enumerate(self.queues):
+            thread = threading.Thread(target=self.run_worker, args=(q,), name=f'ingest-{i}')
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+    def submit(self, path: Path):
+        q = self.queues[hash(str(path)) % len(self.queues)]
+        q.put(path)
+
+    def qsize(self) -> int:
+        return sum(q.qsize() for q in self.queues)
+
+    def next_batch(self, q: queue.Queue) -> tuple[list[Path], bool]:
+        first = q.get()
+        if first is _STOP:
+            return [], True
+
+        # Keep collecting for batch_window seconds so bursts embed together.
+        # A dict keeps submission order and collapses repeated paths.
+        batch = {str(first): first}
+        start = time.monotonic()
+        deadline = start + self.batch_window
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.monotonic()
+            try:
+                item = q.get(timeout=timeout) if timeout > 0 else q.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return list(batch.values()), True
+            batch.pop(str(item), None)
+            batch[str(item)] = item
+        REGISTRY.observe('ingest_batch_wait_seconds', time.monotonic() - start)
+        return list(batch.values()), False
+
+    def run_worker(self, q: queue.Queue):
+        stopping = False
+        while not stopping:
+            paths, stopping = self.next_batch(q)
+            if not paths:
+                continue
+            REGISTRY.observe('ingest_batch_notes', len(paths))
+            try:
+                with REGISTRY.timer('ingest_seconds'):
+                    self.ingest(paths)
+            except Exception as e:
+                self.message_queue.put(f"Error ingesting {len(paths)} notes: {e}")
+
+    def close(self, timeout: float = None):
+        # The stop marker queues behind pending work, so workers drain first
+        for q in self.queues:
+            q.put(_STOP)
+        for thread in self.threads:
+            thread.join(timeout)
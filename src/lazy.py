@@ -0,0 +1,34 @@
+import threading
+from typing import Callable
+
+class Deferred:
+    """Stands in for an object that is built on first use.
+
+    Attribute access blocks until the factory has run, either on that first
+    access or earlier in the background via start(), so slow imports and
+    connection setup stay off the startup path. Factories import their own
+    modules for the same reason.
+    """
+
+    def __init__(self, factory: Callable[[], object]):
+        self._factory = factory
+        self._lock = threading.Lock()
+        self._value = None
+        self.resolved = False
+
+    def resolve(self):
+        if not self.resolved:
+            with self._lock:
+                if not self.resolved:
+                    self._value = self._factory()
+                    self.resolved = True
+        return self._value
+
+    def start(self):
+        thread = threading.Thread(target=self.resolve)
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def __getattr__(self, name):
+        return getattr(self.resolve(), name)
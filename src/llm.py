@@ -1,32 +1,194 @@
+import time
+import threading
 from queue import Queue
-from openai import OpenAI
+from itertools import repeat
+from typing import Iterator
+from concurrent.futures import ThreadPoolExecutor
+from ratelimit import RateLimiter
+from metrics import REGISTRY
 from database_client import DbClient
+from cache import EmbeddingCache, ResponseCache, content_hash
+
+# Limits of the embeddings endpoint: at most 2048 inputs and ~300k tokens
+# per request. The default token budget stays well below the hard cap.
+MAX_BATCH_INPUTS = 2048
+DEFAULT_BATCH_TOKENS = 100_000
+
+# Token allowance reserved for a chat completion's output
+COMPLETION_TOKENS = 1024
+
+def estimate_tokens(text: str) -> int:
+    # Roughly 4 characters per token for english text
+    return len(text) // 4 + 1
 
 class LLM:
-    def __init__(self, chat_model: str, embed_model: str, db_client: DbClient):
+    def __init__(self, chat_model: str, embed_model: str, db_client: DbClient,
+                 batch_tokens: int = DEFAULT_BATCH_TOKENS, embed_cache: EmbeddingCache = None,
+                 response_cache: ResponseCache = None, rate_limiter: RateLimiter = None,
+                 llm_client=None):
         self.chat_model = chat_model
         self.embed_model = embed_model
         self.db_client = db_client
-        self.llm_client = OpenAI()
+        self.batch_tokens = batch_tokens
+        self.embed_cache = embed_cache
+        self.response_cache = response_cache
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self._llm_client = llm_client
+        self.client_lock = threading.Lock()
+
+    @property
+    def llm_client(self):
+        # One client for every thread so HTTP connections are pooled and
+        # reused. Retries are done by the rate limiter, not the SDK. The
+        # openai package is slow to import, so both wait until first use.
+        if self._llm_client is None:
+            with self.client_lock:
+                if self._llm_client is None:
+                    from openai import OpenAI
+                    self._llm_client = OpenAI(max_retries=0)
+        return self._llm_client
+
+    @staticmethod
+    def chat_tokens(system_prompt: str, user_prompt: str) -> int:
+        return estimate_tokens(system_prompt) + estimate_tokens(user_prompt) + COMPLETION_TOKENS
 
-    def chat(self, system_prompt: str, user_prompt: str) -> str:
-        completion = self.llm_client.chat.completions.create(
+    def chat(self, system_prompt: str, user_prompt: str, use_cache: bool = True) -> str:
+        use_cache = use_cache and self.response_cache is not None
+        if use_cache:
+            cached = self.response_cache.get(self.chat_model, system_prompt, user_prompt)
+            if cached is not None:
+                REGISTRY.incr('chat_cache_hits')
+                return cached
+
+        with REGISTRY.timer('chat_seconds'):
+            completion = self.rate_limiter.call(
+                self.llm_client.chat.completions.create,
+                self.chat_tokens(system_prompt, user_prompt),
+                model = self.chat_model,
+                messages = [
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_prompt}
+                ]
+            )
+        self.record_usage(completion.usage)
+
+        result = str(completion.choices[0].message.content)
+        if use_cache:
+            self.response_cache.put(self.chat_model, system_prompt, user_prompt, result)
+        return result
+
+    def chat_stream(self, system_prompt: str, user_prompt: str, use_cache: bool = True) -> Iterator[str]:
+        """Like chat(), but yields the response piece by piece as it arrives."""
+        use_cache = use_cache and self.response_cache is not None
+        if use_cache:
+            cached = self.response_cache.get(self.chat_model, system_prompt, user_prompt)
+            if cached is not None:
+                REGISTRY.incr('chat_cache_hits')
+                yield cached
+                return
+
+        # Only opening the stream is retried, a broken stream is not resumed
+        start = time.perf_counter()
+        stream = self.rate_limiter.call(
+            self.llm_client.chat.completions.create,
+            self.chat_tokens(system_prompt, user_prompt),
             model = self.chat_model,
             messages = [
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": user_prompt}
-            ]
+            ],
+            stream = True,
+            stream_options = {"include_usage": True}
         )
 
-        return str(completion.choices[0].message.content)
+        parts = []
+        for chunk in stream:
+            # With include_usage the last chunk carries usage and no choices
+            if chunk.usage is not None:
+                self.record_usage(chunk.usage)
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                if not parts:
+                    REGISTRY.observe('chat_first_token_seconds', time.perf_counter() - start)
+                parts.append(delta)
+                yield delta
+        REGISTRY.observe('chat_seconds', time.perf_counter() - start)
+
+        # Only complete responses are cached, an interrupted stream is not
+        if use_cache:
+            self.response_cache.put(self.chat_model, system_prompt, user_prompt, ''.join(parts))
+
+    @staticmethod
+    def record_usage(usage):
+        if usage is not None:
+            REGISTRY.incr('chat_prompt_tokens', usage.prompt_tokens)
+            REGISTRY.incr('chat_completion_tokens', usage.completion_tokens)
 
     def embed(self, input: str) -> list[float]:
-        print(input)
-        response = self.llm_client.embeddings.create(
-            model=self.embed_model,
-            input=input
-        )
-        return response.data[0].embedding
+        return self.embed_many([input])[0]
+
+    def batch_inputs(self, inputs: list[str]) -> Iterator[list[str]]:
+        batch, batch_tokens = [], 0
+        for text in inputs:
+            tokens = estimate_tokens(text)
+            if batch and (batch_tokens + tokens > self.batch_tokens or len(batch) >= MAX_BATCH_INPUTS):
+                yield batch
+                batch, batch_tokens = [], 0
+            batch.append(text)
+            batch_tokens += tokens
+        if batch:
+            yield batch
+
+    def embed_many(self, inputs: list[str], model: str = None) -> list[list[float]]:
+        # model defaults to embed_model; another one is used while a
+        # model change is being backfilled
+        model = model or self.embed_model
+        hashes = [content_hash(text) for text in inputs]
+        found = self.embed_cache.get_many(model, hashes) if self.embed_cache else {}
+        REGISTRY.incr('embed_inputs', len(inputs))
+        REGISTRY.incr('embed_cache_hits', len(found))
+
+        # Only send inputs that are not cached, and each distinct text once
+        missing = {}
+        for h, text in zip(hashes, inputs):
+            if h not in found:
+                missing.setdefault(h, text)
+
+        if missing:
+            embeddings = self.request_embeddings(list(missing.values()), model)
+            new = dict(zip(missing.keys(), embeddings))
+            if self.embed_cache:
+                self.embed_cache.put_many(model, new)
+            found.update(new)
+
+        return [found[h] for h in hashes]
+
+    def request_embeddings(self, inputs: list[str], model: str) -> list[list[float]]:
+        batches = list(self.batch_inputs(inputs))
+        if len(batches) == 1:
+            return self.request_batch(batches[0], model)
+
+        # Batches run concurrently up to the limiter's cap, results keep input order
+        with ThreadPoolExecutor(self.rate_limiter.concurrency) as executor:
+            results = executor.map(self.request_batch, batches, repeat(model))
+            return [embedding for batch in results for embedding in batch]
+
+    def request_batch(self, batch: list[str], model: str) -> list[list[float]]:
+        tokens = sum(estimate_tokens(text) for text in batch)
+        with REGISTRY.timer('embed_request_seconds'):
+            response = self.rate_limiter.call(
+                self.llm_client.embeddings.create,
+                tokens,
+                model=model,
+                input=batch
+            )
+        REGISTRY.observe('embed_batch_inputs', len(batch))
+        REGISTRY.observe('embed_batch_tokens', response.usage.total_tokens if response.usage else tokens)
+        # The endpoint does not guarantee ordering, so sort by input index
+        data = sorted(response.data, key=lambda d: d.index)
+        return [d.embedding for d in data]
 
     def dream(self, input: str) -> str:
         response = self.llm_client.images.generate(
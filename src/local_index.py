@@ -0,0 +1,260 @@
+import json
+import threading
+import numpy as np
+from pathlib import Path
+from typing import Iterable, List, Union
+from database_client import NoteHit
+from models import EMBEDDING_DIM
+
+class LocalIndex:
+    """In-process vector search over a memory-mapped embedding matrix.
+
+    Rows are L2-normalized on write, so cosine similarity is a plain matrix
+    product. Vectors live in vectors.bin, row metadata in meta.json. The
+    matrix file is written through on every update, and so is meta.log, a
+    journal of metadata changes since meta.json was last saved. load()
+    replays it, so an unclean exit loses at most the change in flight.
+    """
+
+    def __init__(self, directory: str, dim: int = None, dtype: str = 'float32',
+                 block_rows: int = 65536):
+        # dim None opens whatever size is on disk, so no database is needed
+        # to start; build() changes it after a model switch
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.vectors_path = self.directory / 'vectors.bin'
+        self.meta_path = self.directory / 'meta.json'
+        self.journal_path = self.directory / 'meta.log'
+        self.dim = dim
+        self.dtype = np.dtype(dtype)
+        self.block_rows = block_rows
+        self.lock = threading.RLock()
+        self.ids, self.names, self.paths, self.hashes = [], [], [], []
+        self.rows = {}
+        self.matrix = None
+        self.generation = 0
+        self.journal, self.journaled = None, 0
+        self.load()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def load(self):
+        meta = None
+        if self.meta_path.exists() and self.vectors_path.exists():
+            try:
+                meta = json.loads(self.meta_path.read_text())
+            except ValueError:
+                meta = None
+        if self.dim is None:
+            self.dim = meta['dim'] if meta is not None else EMBEDDING_DIM
+        if (meta is None or meta['dim'] != self.dim or meta['dtype'] != self.dtype.name
+                or 'hashes' not in meta):
+            self.open_matrix(1024)
+            self.save()
+            return
+
+        self.ids, self.names, self.paths, self.hashes = meta['ids'], meta['names'], meta['paths'], meta['hashes']
+        self.rows = {path: row for row, path in enumerate(self.paths)}
+        self.generation = meta['generation']
+        self.replay()
+        capacity = self.vectors_path.stat().st_size // (self.dim * self.dtype.itemsize)
+        self.open_matrix(max(capacity, len(self.ids)))
+        self.save()
+
+    def replay(self):
+        # Entries of another generation were already saved into meta.json
+        if not self.journal_path.exists():
+            return
+        with open(self.journal_path) as f:
+            lines = f.read().splitlines()
+        try:
+            if not lines or json.loads(lines[0]) != {'generation': self.generation}:
+                return
+        except ValueError:
+            return
+        for line in lines[1:]:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # Cut short by the exit, so nothing follows it
+                break
+            if len(entry) == 1:
+                self.drop_row(entry[0])
+            else:
+                self.set_row(*entry)
+
+    def open_matrix(self, capacity: int):
+        if self.matrix is not None:
+            self.matrix.flush()
+        size = capacity * self.dim * self.dtype.itemsize
+        with open(self.vectors_path, 'ab') as f:
+            if f.tell() < size:
+                f.truncate(size)
+        self.matrix = np.memmap(self.vectors_path, dtype=self.dtype, mode='r+',
+                                shape=(capacity, self.dim))
+
+    def save(self):
+        """Write meta.json and start an empty journal for the next generation."""
+        with self.lock:
+            self.matrix.flush()
+            if self.journal is not None:
+                self.journal.close()
+                self.journal = None
+            self.generation += 1
+            meta = {'dim': self.dim, 'dtype': self.dtype.name, 'generation': self.generation,
+                    'ids': self.ids, 'names': self.names, 'paths': self.paths, 'hashes': self.hashes}
+            tmp = self.meta_path.with_suffix('.tmp')
+            tmp.write_text(json.dumps(meta))
+            tmp.replace(self.meta_path)
+            tmp = self.journal_path.with_suffix('.tmp')
+            tmp.write_text(json.dumps({'generation': self.generation}) + '\n')
+            tmp.replace(self.journal_path)
+            self.journaled = 0
+
+    def log(self, entry: list):
+        # Flushed per change, so it survives the process; compacted into
+        # meta.json once it outgrows the index
+        if self.journal is None:
+            self.journal = open(self.journal_path, 'a')
+        self.journal.write(json.dumps(entry) + '\n')
+        self.journal.flush()
+        self.journaled += 1
+        if self.journaled > max(1024, len(self.ids)):
+            self.save()
+
+    @staticmethod
+    def normalize(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        return vectors / np.where(norms == 0, 1, norms)
+
+    def build(self, rows: Iterable[tuple], dim: int = None):
+        """Replace the index with (id, name, path, content hash, embedding) rows.
+
+        A dim other than the current one, after the embed model changed,
+        starts a new matrix file.
+        """
+        with self.lock:
+            if dim is not None and dim != self.dim:
+                self.dim = dim
+                self.matrix = None
+                self.vectors_path.unlink(missing_ok=True)
+                self.open_matrix(1024)
+            # Saved empty first, so a build cut short replays as a partial index
+            self.ids, self.names, self.paths, self.hashes, self.rows = [], [], [], [], {}
+            self.save()
+            for note_id, name, path, note_hash, embedding in rows:
+                self.upsert(note_id, name, path, embedding, note_hash)
+            self.save()
+
+    def set_row(self, note_id: int, name: str, path: str, note_hash: str = None) -> int:
+        row = self.rows.get(path)
+        if row is None:
+            row = len(self.ids)
+            self.ids.append(note_id)
+            self.names.append(name)
+            self.paths.append(path)
+            self.hashes.append(note_hash)
+            self.rows[path] = row
+        else:
+            self.ids[row], self.names[row], self.hashes[row] = note_id, name, note_hash
+        return row
+
+    def drop_row(self, path: str) -> Union[int, None]:
+        # Moves the last row's metadata into the gap, returns the gap
+        row = self.rows.pop(path, None)
+        if row is None:
+            return None
+        last = len(self.ids) - 1
+        if row != last:
+            self.ids[row], self.names[row] = self.ids[last], self.names[last]
+            self.paths[row], self.hashes[row] = self.paths[last], self.hashes[last]
+            self.rows[self.paths[row]] = row
+        for column in (self.ids, self.names, self.paths, self.hashes):
+            column.pop()
+        return row
+
+    def upsert(self, note_id: int, name: str, path: str, embedding: List[float], note_hash: str = None):
+        """Add or replace a note's row; note_hash is its content hash, checked by stale()."""
+        vector = self.normalize(np.asarray(embedding, dtype=np.float32))
+        if vector.shape[-1] != self.dim:
+            # Written between a model switch and the rebuild that follows it
+            return
+        with self.lock:
+            if path not in self.rows and len(self.ids) >= self.matrix.shape[0]:
+                self.open_matrix(self.matrix.shape[0] * 2)
+            row = self.set_row(note_id, name, path, note_hash)
+            self.matrix[row] = vector
+            self.log([note_id, name, path, note_hash])
+
+    def remove(self, path: str):
+        with self.lock:
+            last = len(self.ids) - 1
+            row = self.drop_row(path)
+            if row is None:
+                return
+            # Move the last row into the gap to keep the matrix dense
+            if row != last:
+                self.matrix[row] = self.matrix[last]
+            self.log([path])
+
+    def stale(self, stored: Iterable[tuple]) -> tuple:
+        """Compare the index with the (id, path, content hash) of every note it should hold.
+
+        Returns (paths to remove, ids of notes to load again), covering notes
+        changed while the index was not running, e.g. by importer.py.
+        """
+        with self.lock:
+            indexed = {path: (self.ids[row], self.hashes[row]) for path, row in self.rows.items()}
+        reload = []
+        for note_id, path, note_hash in stored:
+            if indexed.pop(path, None) != (note_id, note_hash):
+                reload.append(note_id)
+        return list(indexed), reload
+
+    def find_by_name(self, name: str) -> Union[int, None]:
+        if not name.endswith('.md'):
+            name += '.md'
+        with self.lock:
+            try:
+                row = self.names.index(name)
+            except ValueError:
+                return None
+            # A name in several vaults is left to the database to disambiguate
+            return None if name in self.names[row + 1:] else row
+
+    def search_many(self, queries: np.ndarray, n: int = 5,
+                    exclude_rows: List[int] = None) -> List[List[NoteHit]]:
+        queries = self.normalize(np.atleast_2d(np.asarray(queries, dtype=np.float32)))
+        with self.lock:
+            count = len(self.ids)
+            if count == 0:
+                return [[] for _ in queries]
+
+            # Score in blocks so float16 storage is upcast a block at a time
+            scores = np.empty((len(queries), count), dtype=np.float32)
+            for start in range(0, count, self.block_rows):
+                block = np.asarray(self.matrix[start:min(start + self.block_rows, count)], dtype=np.float32)
+                scores[:, start:start + len(block)] = queries @ block.T
+
+            results = []
+            for i, row_scores in enumerate(scores):
+                if exclude_rows is not None and exclude_rows[i] is not None:
+                    row_scores[exclude_rows[i]] = -np.inf
+                k = min(n, count)
+                top = np.argpartition(-row_scores, k - 1)[:k]
+                top = top[np.argsort(-row_scores[top])]
+                results.append([NoteHit(self.ids[r], self.names[r], self.paths[r], float(row_scores[r]))
+                                for r in top if np.isfinite(row_scores[r])])
+            return results
+
+    def search_similar_to_name(self, name: str, n: int = 5) -> Union[List[NoteHit], None]:
+        with self.lock:
+            row = self.find_by_name(name)
+            if row is None:
+                return None
+            query = np.asarray(self.matrix[row], dtype=np.float32)
+            return self.search_many(query, n, exclude_rows=[row])[0]
+
+    def close(self):
+        self.save()
@@ -1,41 +1,191 @@
 import yaml
 import queue
 import threading
-from llm import LLM
 from cli import NoteCLI
-from database_client import DbClient
-from watcher import Watcher, NoteHandler
+from catalog import NoteCatalog
+from metrics import REGISTRY
+from lazy import Deferred
 
+# Only what the prompt needs is imported up front. openai, sqlalchemy,
+# pgvector, numpy and watchdog are imported by the builders below, which run
+# in the background or on first use; bench.py tracks the import cost.
 
-def run_watcher(event_handler: NoteHandler, root_dir: str):
+def build_llm(chat_model, embed_model, db_client, cache_config, openai_config):
+    from llm import LLM
+    from cache import EmbeddingCache, ResponseCache
+    from ratelimit import RateLimiter
+
+    embed_cache = EmbeddingCache(cache_config.get('embeddings', '.cache/embeddings.sqlite'),
+                                 cache_config.get('max_embeddings', 100_000))
+    response_cache = ResponseCache(cache_config.get('responses', '.cache/responses.sqlite'),
+                                   cache_config.get('max_response_bytes', 50 * 1024 * 1024))
+    rate_limiter = RateLimiter(openai_config.get('concurrency', 4),
+                               openai_config.get('requests_per_minute', 3000),
+                               openai_config.get('tokens_per_minute', 1_000_000),
+                               openai_config.get('max_retries', 6))
+    return LLM(chat_model, embed_model, db_client, embed_cache=embed_cache,
+               response_cache=response_cache, rate_limiter=rate_limiter)
+
+def build_local_index(db_client, search_config, message_queue):
+    from local_index import LocalIndex
+
+    # Opened from disk alone, so link works while Postgres is slow or down;
+    # the refresh below checks it against the active model
+    local_index = LocalIndex(search_config.get('index_dir', '.cache/index'),
+                             dtype=search_config.get('dtype', 'float32'))
+    build_thread = threading.Thread(target=refresh_local_index, args=(local_index, db_client, message_queue))
+    build_thread.daemon = True
+    build_thread.start()
+    return local_index
+
+def refresh_local_index(local_index, db_client, message_queue=None):
+    try:
+        sync_local_index(local_index, db_client)
+    except Exception as e:
+        # The index on disk keeps answering until the next start
+        if message_queue is not None:
+            message_queue.put(f"Couldn't refresh the local index: {e}")
+
+def sync_local_index(local_index, db_client):
+    # Rebuilt when empty or sized for another model, otherwise checked
+    # against the notes written while it was not running (importer.py, or
+    # changes lost to an unclean exit)
+    active = db_client.active_model()
+    if active is None:
+        return
+    if len(local_index) == 0 or local_index.dim != active[1]:
+        local_index.build(db_client.iter_note_embeddings(), active[1])
+        return
+    removed, reload = local_index.stale(db_client.get_embedded_notes())
+    for path in removed:
+        local_index.remove(path)
+    if reload:
+        for note_id, name, path, note_hash, embedding in db_client.iter_note_embeddings(reload):
+            local_index.upsert(note_id, name, path, embedding, note_hash)
+    local_index.save()
+
+def build_graph(db_client):
+    from graph import LinkGraph
+
+    graph = LinkGraph()
+    graph_thread = threading.Thread(target=lambda: graph.load(db_client.get_note_index(),
+                                                              db_client.get_all_links()))
+    graph_thread.daemon = True
+    graph_thread.start()
+    return graph
+
+def start_watcher(name, root_dir, services, db_client, *args):
+    from watcher import Watcher, NoteHandler
+
+    # Scheduling recursive watches walks the whole vault, so this runs off
+    # the startup path, and the reconcile pass follows on the same thread.
+    # Each vault gets its own observer, debouncer and ingest pool.
+    vault_id = db_client.ensure_vault(name, root_dir)
+    event_handler = NoteHandler(db_client, *args, vault_id=vault_id)
     watcher = Watcher(event_handler, root_dir)
-    watcher.run()
+    services.append((watcher, event_handler))
+    watcher_thread = threading.Thread(target=watcher.run)
+    watcher_thread.daemon = True
+    watcher_thread.start()
+    event_handler.reconcile(root_dir)
+
+def start_backfill(cli, db_client, embed_model):
+    # A changed embed_model is backfilled while the previous model keeps
+    # serving searches, then switched to; see reindex.Reindexer. Nothing
+    # is dropped, so editing the config back switches back.
+    try:
+        active = db_client.active_model()
+    except Exception as e:
+        cli.message_queue.put(f"Couldn't check the embed model: {e}")
+        return
+    if active is not None and active[0] != embed_model:
+        cli.message_queue.put(f'Embedding notes with {embed_model}, searches use {active[0]} until done')
+        cli.run_reindex()
+
 
 if __name__ == '__main__':
     with open('config.yaml', 'r') as f:
         config = yaml.safe_load(f)
 
-    root_dir = config['dir']['root']
+    # vaults: [{name, root}, ...]; a plain dir.root is the default vault
+    # (models.DEFAULT_VAULT, not imported here to keep startup light)
+    if 'vaults' in config:
+        vault_roots = {vault['name']: vault['root'] for vault in config['vaults']}
+    else:
+        vault_roots = {'default': config['dir']['root']}
     user = config['postgres']['user']
     password = config['postgres']['password']
     host = config['postgres']['host']
     database = config['postgres']['database']
-    chat_model = 'gpt-4o-mini'
-    embed_model = 'text-embedding-3-small'
+    openai_config = config.get('openai', {})
+    chat_model = openai_config.get('chat_model', 'gpt-4o-mini')
+    # Changing embed_model starts a background backfill, see start_backfill
+    embed_model = openai_config.get('embed_model', 'text-embedding-3-small')
+    watcher_config = config.get('watcher', {})
+    batch_window = watcher_config.get('batch_window', 0.5)
+    ingest_workers = watcher_config.get('workers', 2)
+    max_queued = watcher_config.get('max_queued', 256)
+    debounce = watcher_config.get('debounce', 0.25)
+    cache_config = config.get('cache', {})
+    uncached_commands = cache_config.get('skip_commands', [])
+    search_config = config.get('search', {})
+    quantization = config.get('storage', {}).get('quantization')
+    metrics_config = config.get('metrics', {})
 
     message_queue = queue.Queue()
+    REGISTRY.track('message_queue_depth', message_queue.qsize)
 
-    db_client = DbClient(host, database, user, password)
-    llm = LLM(chat_model, embed_model, db_client)
-    event_handler = NoteHandler(db_client, llm, message_queue)
+    # Optional Prometheus textfile, rewritten every interval seconds
+    metrics_stop = threading.Event()
+    prometheus_file = metrics_config.get('prometheus_file')
+    if prometheus_file:
+        metrics_thread = threading.Thread(target=REGISTRY.export_every,
+                                          args=(prometheus_file, metrics_config.get('interval', 15), metrics_stop))
+        metrics_thread.daemon = True
+        metrics_thread.start()
 
-    # Start the watcher in a separate thread
-    watcher_thread = threading.Thread(target=run_watcher, args=(event_handler, root_dir,))
-    watcher_thread.daemon = True
-    watcher_thread.start()
+    def build_db_client():
+        from database_client import DbClient
+        return DbClient(host, database, user, password, quantization)
+
+    # Postgres and the link graph are needed soon, so they warm up in the
+    # background; the LLM is built by the first command or ingest that uses it
+    db_client = Deferred(build_db_client).start()
+    llm = Deferred(lambda: build_llm(chat_model, embed_model, db_client, cache_config, openai_config))
+    catalog = NoteCatalog()
 
-    cli = NoteCLI(db_client, llm, message_queue)
-    cli.cmdloop("Welcome to the Note CLI. Type 'help' for commands.")
+    # Optional in-process vector search, built from Postgres on first use
+    local_index = None
+    if search_config.get('backend') == 'local':
+        local_index = Deferred(lambda: build_local_index(db_client, search_config, message_queue)).start()
 
+    graph = Deferred(lambda: build_graph(db_client)).start()
 
+    services = []
+    for name, root_dir in vault_roots.items():
+        setup_thread = threading.Thread(target=start_watcher, args=(
+            name, root_dir, services, db_client, llm, message_queue, catalog,
+            batch_window, ingest_workers, max_queued, local_index, graph, debounce
+        ))
+        setup_thread.daemon = True
+        setup_thread.start()
 
+    cli = NoteCLI(db_client, llm, message_queue, catalog, local_index, graph, uncached_commands, vault_roots)
+    backfill_thread = threading.Thread(target=start_backfill, args=(cli, db_client, embed_model))
+    backfill_thread.daemon = True
+    backfill_thread.start()
+    try:
+        cli.cmdloop("Welcome to the Note CLI. Type 'help' for commands.")
+    finally:
+        # Stop new events first, then let the workers finish queued notes
+        for watcher, event_handler in services:
+            watcher.stop()
+            event_handler.close()
+        if llm.resolved:
+            llm.embed_cache.close()
+            llm.response_cache.close()
+        if db_client.resolved:
+            db_client.close()
+        metrics_stop.set()
+        if prometheus_file:
+            metrics_thread.join()
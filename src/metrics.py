@@ -0,0 +1,144 @@
+import bisect
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable
+
+# Geometric bucket bounds from 10us to 1e6. Adjacent bounds differ by 25%,
+# so interpolated percentiles land within about 12% of the true value.
+BUCKET_FACTOR = 1.25
+BUCKET_BOUNDS = tuple(1e-5 * BUCKET_FACTOR ** i
+                      for i in range(int(math.log(1e11, BUCKET_FACTOR)) + 2))
+
+PROMETHEUS_PREFIX = 'neonota_'
+
+class Histogram:
+    """Fixed-bucket histogram, cheap enough to update on every call."""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_BOUNDS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(BUCKET_BOUNDS, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def percentile(self, q: float):
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                # Interpolate linearly inside the bucket, narrowed to what was seen
+                lower = max(BUCKET_BOUNDS[i - 1] if i > 0 else self.min, self.min)
+                upper = min(BUCKET_BOUNDS[i] if i < len(BUCKET_BOUNDS) else self.max, self.max)
+                return lower + (upper - lower) * (rank - seen) / n
+            seen += n
+        return self.max
+
+class Metrics:
+    """Thread-safe counters, gauges and histograms, keyed by name.
+
+    Gauges are callables read only when the metrics are reported, so
+    tracking a queue depth costs nothing per event.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.started = time.time()
+
+    def incr(self, name: str, value: float = 1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def track(self, name: str, fn: Callable[[], float]):
+        with self.lock:
+            self.gauges[name] = fn
+
+    def observe(self, name: str, value: float):
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def gauge_values(self) -> dict:
+        with self.lock:
+            gauges = dict(self.gauges)
+        values = {}
+        for name, value in gauges.items():
+            try:
+                values[name] = value()
+            except Exception:
+                continue
+        return values
+
+    def report(self) -> str:
+        lines = [f"{'histogram':<32} {'count':>8} {'p50':>10} {'p95':>10} {'p99':>10} {'max':>10}"]
+        with self.lock:
+            for name in sorted(self.histograms):
+                h = self.histograms[name]
+                p50, p95, p99 = (h.percentile(q) for q in (0.5, 0.95, 0.99))
+                lines.append(f'{name:<32} {h.count:>8} {p50:>10.4g} {p95:>10.4g} {p99:>10.4g} {h.max:>10.4g}')
+            counters = sorted(self.counters.items())
+        for name, value in counters:
+            lines.append(f'{name:<32} {value:>8g}')
+        for name, value in sorted(self.gauge_values().items()):
+            lines.append(f'{name:<32} {value:>8g}  (now)')
+        lines.append(f'uptime {time.time() - self.started:.0f}s')
+        return '\n'.join(lines)
+
+    def prometheus(self) -> str:
+        lines = []
+        with self.lock:
+            for name, value in sorted(self.counters.items()):
+                metric = f'{PROMETHEUS_PREFIX}{name}_total'
+                lines += [f'# TYPE {metric} counter', f'{metric} {value}']
+            for name, h in sorted(self.histograms.items()):
+                metric = PROMETHEUS_PREFIX + name
+                lines.append(f'# TYPE {metric} histogram')
+                cumulative = 0
+                for bound, n in zip(BUCKET_BOUNDS, h.counts):
+                    cumulative += n
+                    lines.append(f'{metric}_bucket{{le="{bound:.6g}"}} {cumulative}')
+                lines += [f'{metric}_bucket{{le="+Inf"}} {h.count}',
+                          f'{metric}_sum {h.sum}', f'{metric}_count {h.count}']
+        for name, value in sorted(self.gauge_values().items()):
+            metric = PROMETHEUS_PREFIX + name
+            lines += [f'# TYPE {metric} gauge', f'{metric} {value}']
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path: str):
+        # Written aside and renamed, so a scraper never reads a partial file
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(self.prometheus())
+        os.replace(tmp_path, path)
+
+    def export_every(self, path: str, interval: float, stop: threading.Event):
+        while not stop.wait(interval):
+            self.write_prometheus(path)
+        self.write_prometheus(path)
+
+# Shared by every component, like the logging module's root logger
+REGISTRY = Metrics()
@@ -0,0 +1,176 @@
+import re
+import yaml
+import hashlib
+from sqlalchemy import create_engine
+from sqlalchemy.sql import text
+from models import EMBEDDING_DIM, TEXT_SEARCH_CONFIG, DEFAULT_VAULT, DEFAULT_VAULT_ID, NAME_LENGTH
+
+# Chunks stored before the embed model was recorded came from this one
+LEGACY_EMBED_MODEL = 'text-embedding-3-small'
+
+# Idempotent schema changes for databases created by an older create_db.py.
+# New databases get these from Base.metadata.create_all already.
+MIGRATIONS = [
+    'ALTER TABLE notes ADD COLUMN IF NOT EXISTS mtime double precision',
+    'ALTER TABLE notes ADD COLUMN IF NOT EXISTS size bigint',
+    'ALTER TABLE notes ADD COLUMN IF NOT EXISTS content_hash varchar(64)',
+    'CREATE TABLE IF NOT EXISTS note_chunks ('
+    'id serial PRIMARY KEY, '
+    'note_id integer NOT NULL REFERENCES notes (id) ON DELETE CASCADE, '
+    'position integer NOT NULL, '
+    'content_hash varchar(64) NOT NULL, '
+    'content text, '
+    f'embedding vector({EMBEDDING_DIM}))',
+    'CREATE INDEX IF NOT EXISTS ix_note_chunks_note_id ON note_chunks (note_id)',
+    'ALTER TABLE notes ADD COLUMN IF NOT EXISTS content_tsv tsvector GENERATED ALWAYS AS '
+    f"(to_tsvector('{TEXT_SEARCH_CONFIG}', coalesce(content, ''))) STORED",
+    'CREATE INDEX IF NOT EXISTS notes_content_tsv_idx ON notes USING gin (content_tsv)',
+    # Upserts conflict on path, so duplicate rows left by the old
+    # SELECT-then-INSERT upsert are removed (keeping the newest) first
+    'CREATE TEMP TABLE duplicate_notes ON COMMIT DROP AS '
+    'SELECT id FROM (SELECT id, row_number() OVER (PARTITION BY path ORDER BY id DESC) AS n '
+    'FROM notes) ranked WHERE n > 1',
+    'DELETE FROM note_links WHERE from_note_id IN (SELECT id FROM duplicate_notes) '
+    'OR to_note_id IN (SELECT id FROM duplicate_notes)',
+    'DELETE FROM note_tags WHERE note_id IN (SELECT id FROM duplicate_notes)',
+    'DELETE FROM notes WHERE id IN (SELECT id FROM duplicate_notes)',
+    'CREATE UNIQUE INDEX IF NOT EXISTS notes_path_key ON notes (path)',
+    'ALTER TABLE notes ADD COLUMN IF NOT EXISTS embed_model varchar(64)',
+    # Existing notes become the default vault, which is the first row
+    'CREATE TABLE IF NOT EXISTS vaults ('
+    'id serial PRIMARY KEY, name varchar(64) NOT NULL UNIQUE, root varchar(255))',
+    f"INSERT INTO vaults (name) VALUES ('{DEFAULT_VAULT}') ON CONFLICT (name) DO NOTHING",
+    f'ALTER TABLE notes ADD COLUMN IF NOT EXISTS vault_id integer NOT NULL DEFAULT {DEFAULT_VAULT_ID} '
+    'REFERENCES vaults (id)',
+    'CREATE INDEX IF NOT EXISTS ix_notes_vault_id ON notes (vault_id)',
+    f'ALTER TABLE note_chunks ADD COLUMN IF NOT EXISTS vault_id integer NOT NULL DEFAULT {DEFAULT_VAULT_ID}',
+    # Chunk embeddings move to note_embeddings, keyed by model, and the
+    # derived note-level embedding is computed from them on read
+    'CREATE TABLE IF NOT EXISTS embedding_models ('
+    'model varchar(64) PRIMARY KEY, dim integer NOT NULL, active boolean NOT NULL DEFAULT false)',
+    'CREATE UNIQUE INDEX IF NOT EXISTS embedding_models_active_key ON embedding_models (active) WHERE active',
+    'CREATE TABLE IF NOT EXISTS note_embeddings ('
+    'note_id integer NOT NULL REFERENCES notes (id) ON DELETE CASCADE, '
+    'model varchar(64) NOT NULL REFERENCES embedding_models (model) ON DELETE CASCADE, '
+    'content_hash varchar(64) NOT NULL, '
+    f'vault_id integer NOT NULL DEFAULT {DEFAULT_VAULT_ID}, '
+    'embedding vector NOT NULL, '
+    'PRIMARY KEY (note_id, model, content_hash))',
+    'DO $$ BEGIN '
+    "IF EXISTS (SELECT 1 FROM information_schema.columns "
+    "WHERE table_name = 'note_chunks' AND column_name = 'embedding') THEN "
+    'INSERT INTO embedding_models (model, dim) '
+    f"SELECT DISTINCT coalesce(n.embed_model, '{LEGACY_EMBED_MODEL}'), {EMBEDDING_DIM} "
+    'FROM note_chunks c JOIN notes n ON n.id = c.note_id WHERE c.embedding IS NOT NULL '
+    'ON CONFLICT DO NOTHING; '
+    'INSERT INTO note_embeddings (note_id, model, content_hash, vault_id, embedding) '
+    f"SELECT c.note_id, coalesce(n.embed_model, '{LEGACY_EMBED_MODEL}'), c.content_hash, c.vault_id, c.embedding "
+    'FROM note_chunks c JOIN notes n ON n.id = c.note_id WHERE c.embedding IS NOT NULL '
+    'ON CONFLICT DO NOTHING; '
+    'ALTER TABLE note_chunks DROP COLUMN embedding; '
+    'END IF; END $$',
+    # The model most notes were embedded with keeps serving searches
+    'UPDATE embedding_models SET active = true WHERE model = ('
+    'SELECT model FROM note_embeddings GROUP BY model ORDER BY count(*) DESC LIMIT 1) '
+    'AND NOT EXISTS (SELECT 1 FROM embedding_models WHERE active)',
+    'ALTER TABLE notes DROP COLUMN IF EXISTS embedding',
+    'ALTER TABLE notes DROP COLUMN IF EXISTS embed_model',
+    # Link targets are filled from the stored content once, when the table
+    # is created; sync_links keeps them current afterwards
+    'DO $$ BEGIN '
+    "IF to_regclass('note_link_targets') IS NULL THEN "
+    'CREATE TABLE note_link_targets ('
+    'from_note_id integer NOT NULL REFERENCES notes (id) ON DELETE CASCADE, '
+    f'target varchar({NAME_LENGTH}) NOT NULL, '
+    'PRIMARY KEY (from_note_id, target)); '
+    'CREATE INDEX ix_note_link_targets_target ON note_link_targets (target); '
+    'INSERT INTO note_link_targets (from_note_id, target) '
+    "SELECT DISTINCT n.id, trim(m[1]) || '.md' "
+    "FROM notes n, regexp_matches(n.content, '\\[\\[([^]|#]+)(?:[|#][^]]*)?\\]\\]', 'g') m "
+    f"WHERE length(trim(m[1])) <= {NAME_LENGTH - len('.md')}; "
+    'END IF; END $$',
+]
+
+# The ANN index on note_embeddings for each storage.quantization mode, as
+# (name suffix, USING clause) for a model's dimension. Quantized modes index
+# an expression over the full vector, which stays in the table for exact
+# re-ranking, so switching modes only rebuilds the index. Every model and
+# vault gets its own partial index, so a model being backfilled or a large
+# vault does not slow down search in the others.
+EMBEDDING_INDEXES = {
+    None: ('', 'USING hnsw ((embedding::vector({dim})) vector_cosine_ops)'),
+    'halfvec': ('_half', 'USING hnsw ((embedding::halfvec({dim})) halfvec_cosine_ops)'),
+    'binary': ('_bit', 'USING hnsw ((binary_quantize(embedding)::bit({dim})) bit_hamming_ops)'),
+}
+
+# Largest dimension pgvector's hnsw can index for each mode
+INDEX_MAX_DIM = {None: 2000, 'halfvec': 4000, 'binary': 64000}
+
+def index_mode(mode: str, dim: int) -> str:
+    """The mode a model's index is actually built with.
+
+    Full-precision vectors over 2000 dimensions (text-embedding-3-large has
+    3072) are indexed as halfvec instead. Raises ValueError for a model no
+    mode can index.
+    """
+    if mode not in EMBEDDING_INDEXES:
+        raise ValueError(f"Unknown quantization mode: {mode}")
+    if mode is None and dim > INDEX_MAX_DIM[None]:
+        mode = 'halfvec'
+    if dim > INDEX_MAX_DIM[mode]:
+        raise ValueError(f"{dim}-dimensional embeddings exceed the {INDEX_MAX_DIM[mode]} "
+                         f"dimensions an hnsw index supports with quantization {mode}")
+    return mode
+
+def embedding_index_name(mode: str, model: str, vault_id: int) -> str:
+    # Model names may hold any character and index names are capped at 63
+    slug = re.sub(r'[^a-z0-9]+', '_', model.lower())[:24]
+    digest = hashlib.sha1(model.encode()).hexdigest()[:6]
+    return f'emb_{slug}_{digest}_v{int(vault_id)}{EMBEDDING_INDEXES[mode][0]}_idx'
+
+def create_embedding_index(conn, model: str, dim: int, vault_id: int, mode: str = None):
+    mode = index_mode(mode, dim)
+    using = EMBEDDING_INDEXES[mode][1].format(dim=int(dim))
+    quoted = "'" + model.replace("'", "''") + "'"
+    conn.execute(text(f'CREATE INDEX IF NOT EXISTS {embedding_index_name(mode, model, vault_id)} '
+                      f'ON note_embeddings {using} WITH (m = 16, ef_construction = 64) '
+                      f'WHERE model = {quoted} AND vault_id = {int(vault_id)}'))
+
+def drop_embedding_indexes(conn, model: str, vault_ids: list, modes=EMBEDDING_INDEXES):
+    for mode in modes:
+        for vault_id in vault_ids:
+            conn.execute(text(f'DROP INDEX IF EXISTS {embedding_index_name(mode, model, vault_id)}'))
+
+def set_quantization(conn, mode: str = None):
+    if mode not in EMBEDDING_INDEXES:
+        raise ValueError(f"Unknown quantization mode: {mode}")
+
+    vault_ids = conn.execute(text('SELECT id FROM vaults')).scalars().all()
+    for model, dim in conn.execute(text('SELECT model, dim FROM embedding_models')).all():
+        for vault_id in vault_ids:
+            create_embedding_index(conn, model, dim, vault_id, mode)
+        built = index_mode(mode, dim)
+        drop_embedding_indexes(conn, model, vault_ids, [other for other in EMBEDDING_INDEXES if other != built])
+
+def migrate(engine, quantization: str = None):
+    with engine.begin() as conn:
+        for statement in MIGRATIONS:
+            conn.execute(text(statement))
+        set_quantization(conn, quantization)
+
+if __name__ == '__main__':
+    with open('config.yaml', 'r') as f:
+        config = yaml.safe_load(f)
+
+    user = config['postgres']['user']
+    password = config['postgres']['password']
+    host = config['postgres']['host']
+    database = config['postgres']['database']
+    port = "5432"
+
+    quantization = config.get('storage', {}).get('quantization')
+
+    engine = create_engine(f"postgresql://{user}:{password}@{host}:{port}/{database}")
+    migrate(engine, quantization)
+    print(f"Applied {len(MIGRATIONS)} migrations to '{database}'.")
+    engine.dispose()
@@ -1,15 +1,32 @@
-from sqlalchemy import Column, Integer, String, Text, ForeignKey, Table
-from sqlalchemy.orm import declarative_base, relationship
+from sqlalchemy import Column, Integer, BigInteger, Float, String, Text, Boolean, ForeignKey, Table, Computed, Index
+from sqlalchemy.orm import declarative_base, relationship, deferred
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from pgvector.sqlalchemy import Vector
 
 Base = declarative_base()
 
+EMBEDDING_DIM = 1536
+TEXT_SEARCH_CONFIG = 'english'
+# Notes stored before vaults existed, and single-root configs, live here
+DEFAULT_VAULT = 'default'
+DEFAULT_VAULT_ID = 1
+# Longest note name, and so longest link target worth storing
+NAME_LENGTH = 255
+
 # Define the association table for note links
 note_links = Table('note_links', Base.metadata,
     Column('from_note_id', Integer, ForeignKey('notes.id'), primary_key=True),
     Column('to_note_id', Integer, ForeignKey('notes.id'), primary_key=True)
 )
 
+# Every name a note links to, resolved or not, so a note created later is
+# linked from the notes naming it without scanning their content
+note_link_targets = Table('note_link_targets', Base.metadata,
+    Column('from_note_id', Integer, ForeignKey('notes.id', ondelete='CASCADE'), primary_key=True),
+    Column('target', String(NAME_LENGTH), primary_key=True),
+    Index('ix_note_link_targets_target', 'target')
+)
+
 # Define the association table for note-tag relationship
 note_tags = Table('note_tags', Base.metadata,
     Column('note_id', Integer, ForeignKey('notes.id'), primary_key=True),
@@ -25,16 +42,36 @@ class Tag(Base):
     def __repr__(self):
         return f"<Tag(name='{self.name}')>"
 
+class Vault(Base):
+    __tablename__ = 'vaults'
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String(64), unique=True, nullable=False)
+    root = Column(String(255))
+
+    def __repr__(self):
+        return f"<Vault(name='{self.name}', root='{self.root}')>"
+
 # TODO: Add file extension field
 class Note(Base):
     __tablename__ = 'notes'
 
     id = Column(Integer, primary_key=True)
+    vault_id = Column(Integer, ForeignKey('vaults.id'), nullable=False,
+                      server_default=str(DEFAULT_VAULT_ID), index=True)
     path = Column(String(255))
-    name = Column(String(255))
+    name = Column(String(NAME_LENGTH))
     extension = Column(String(32))
-    content = Column(Text)
-    embedding = Column(Vector(1536))
+    # Heavy columns load only when accessed or explicitly undeferred
+    content = deferred(Column(Text))
+    # File state at the last ingest, used to reconcile the vault at startup
+    mtime = Column(Float)
+    size = Column(BigInteger)
+    content_hash = Column(String(64))
+    # Kept current by Postgres on every insert and update of content
+    content_tsv = deferred(Column(TSVECTOR, Computed(
+        f"to_tsvector('{TEXT_SEARCH_CONFIG}', coalesce(content, ''))", persisted=True
+    )))
 
     # Define the many-to-many relationship for note links
     linked_to = relationship('Note', 
@@ -46,8 +83,60 @@ class Note(Base):
     # Define the many-to-many relationship with Tags
     tags = relationship("Tag", secondary=note_tags, back_populates="notes")
 
+    __table_args__ = (
+        Index('notes_path_key', 'path', unique=True),
+        Index('notes_content_tsv_idx', 'content_tsv', postgresql_using='gin'),
+    )
+
     def __repr__(self):
         return f"<Note(name='{self.name}', tags={[tag.name for tag in self.tags]})>"
 
+class NoteChunk(Base):
+    __tablename__ = 'note_chunks'
+
+    id = Column(Integer, primary_key=True)
+    note_id = Column(Integer, ForeignKey('notes.id', ondelete='CASCADE'), nullable=False, index=True)
+    # Copy of the note's vault, so each vault can have a partial hnsw index
+    vault_id = Column(Integer, nullable=False, server_default=str(DEFAULT_VAULT_ID))
+    position = Column(Integer, nullable=False)
+    content_hash = Column(String(64), nullable=False)
+    content = deferred(Column(Text))
+
+    def __repr__(self):
+        return f"<NoteChunk(note_id={self.note_id}, position={self.position})>"
+
+class EmbeddingModel(Base):
+    __tablename__ = 'embedding_models'
+
+    model = Column(String(64), primary_key=True)
+    dim = Column(Integer, nullable=False)
+    # Searches use the one active model; the others are being backfilled
+    active = Column(Boolean, nullable=False, server_default='false')
+
+    __table_args__ = (
+        Index('embedding_models_active_key', 'active', unique=True, postgresql_where=active),
+    )
+
+    def __repr__(self):
+        return f"<EmbeddingModel(model='{self.model}', dim={self.dim}, active={self.active})>"
+
+class NoteEmbedding(Base):
+    """Chunk embeddings, one row per distinct chunk content of a note and model.
+
+    The vector column has no fixed size, so models of any dimension share the
+    table; the hnsw indexes are partial per model and vault and cast to the
+    model's dimension.
+    """
+    __tablename__ = 'note_embeddings'
+
+    note_id = Column(Integer, ForeignKey('notes.id', ondelete='CASCADE'), primary_key=True)
+    model = Column(String(64), ForeignKey('embedding_models.model', ondelete='CASCADE'), primary_key=True)
+    content_hash = Column(String(64), primary_key=True)
+    vault_id = Column(Integer, nullable=False, server_default=str(DEFAULT_VAULT_ID))
+    embedding = deferred(Column(Vector(), nullable=False))
+
+    def __repr__(self):
+        return f"<NoteEmbedding(note_id={self.note_id}, model='{self.model}')>"
+
 # Add back-reference to Note in Tag
 Tag.notes = relationship("Note", secondary=note_tags, back_populates="tags")
@@ -0,0 +1,70 @@
+import sys
+import time
+import yaml
+import numpy as np
+from sqlalchemy import func, select
+from sqlalchemy.sql import text
+from models import NoteEmbedding
+from database_client import DbClient
+from migrate import embedding_index_name, index_mode
+
+# Compares quantized search against exact search on the current database:
+# recall@n of the note results, query latency and the size of each index.
+# Usage: python quant_report.py [samples] [n]
+
+def percentile(values, q):
+    return float(np.percentile(values, q)) * 1000 if values else 0.0
+
+if __name__ == '__main__':
+    with open('config.yaml', 'r') as f:
+        config = yaml.safe_load(f)
+
+    samples = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    n = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    user = config['postgres']['user']
+    password = config['postgres']['password']
+    host = config['postgres']['host']
+    database = config['postgres']['database']
+    quantization = config.get('storage', {}).get('quantization')
+
+    db_client = DbClient(host, database, user, password, quantization)
+    active = db_client.active_model()
+    if active is None:
+        sys.exit('Nothing has been embedded yet')
+    model, dim = active
+    with db_client.session_scope() as session:
+        queries = session.scalars(
+            select(NoteEmbedding.embedding).where(NoteEmbedding.model == model)
+            .order_by(func.random()).limit(samples)
+        ).all()
+        sizes = {}
+        for vault_id in session.scalars(text('SELECT id FROM vaults')).all():
+            name = embedding_index_name(index_mode(quantization, dim), model, vault_id)
+            size = session.execute(
+                text('SELECT pg_relation_size(to_regclass(:name))'), {'name': name}
+            ).scalar()
+            if size is not None:
+                sizes[name] = size
+
+    recalls, exact_times, search_times = [], [], []
+    for query in queries:
+        start = time.perf_counter()
+        exact = db_client.search_similar(query, n, exact=True)
+        exact_times.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        found = db_client.search_similar(query, n)
+        search_times.append(time.perf_counter() - start)
+
+        expected = {hit.id for hit in exact}
+        if expected:
+            recalls.append(len(expected & {hit.id for hit in found}) / len(expected))
+
+    print(f"Quantization: {quantization or 'none'} (re-rank x{db_client.rerank_factor}), "
+          f"model {model}, {len(queries)} queries, n={n}")
+    print(f"Recall@{n}: {np.mean(recalls) if recalls else 0.0:.3f}")
+    print(f"Exact latency   p50 {percentile(exact_times, 50):.1f} ms  p95 {percentile(exact_times, 95):.1f} ms")
+    print(f"Indexed latency p50 {percentile(search_times, 50):.1f} ms  p95 {percentile(search_times, 95):.1f} ms")
+    for name, size in sizes.items():
+        print(f"{name}: {size / 1024 / 1024:.1f} MiB")
+    db_client.close()
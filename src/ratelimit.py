@@ -0,0 +1,86 @@
+import time
+import random
+import threading
+from typing import Callable
+from metrics import REGISTRY
+
+class TokenBucket:
+    """Refills continuously at rate_per_minute, holding at most one minute's worth."""
+
+    def __init__(self, rate_per_minute: float):
+        self.capacity = float(rate_per_minute)
+        self.rate = rate_per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, amount: float = 1.0):
+        # A request larger than the whole bucket waits for a full bucket
+        amount = min(amount, self.capacity)
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait = (amount - self.tokens) / self.rate
+            time.sleep(wait)
+
+def is_retryable(error: Exception) -> bool:
+    # Imported here, where the client has already loaded it, to keep startup fast
+    import openai
+    if isinstance(error, (openai.RateLimitError, openai.APIConnectionError, openai.APITimeoutError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+def retry_after(error: Exception):
+    response = getattr(error, 'response', None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get('retry-after'))
+    except (TypeError, ValueError):
+        return None
+
+class RateLimiter:
+    """Caps concurrent requests and keeps requests/tokens per minute in budget.
+
+    call() retries 429s, 5xx and connection errors with jittered exponential
+    backoff, honouring the server's Retry-After header when it sends one.
+    """
+
+    def __init__(self, concurrency: int = 4, requests_per_minute: float = 3000,
+                 tokens_per_minute: float = 1_000_000, max_retries: int = 6,
+                 base_delay: float = 0.5, max_delay: float = 30.0):
+        self.concurrency = concurrency
+        self.semaphore = threading.BoundedSemaphore(concurrency)
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retries = 0
+
+    def call(self, fn: Callable, tokens: int, *args, **kwargs):
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            self.requests.acquire()
+            self.tokens.acquire(tokens)
+            REGISTRY.observe('ratelimit_wait_seconds', time.perf_counter() - start)
+            try:
+                with self.semaphore:
+                    return fn(*args, **kwargs)
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    raise
+                delay = retry_after(e)
+                if delay is None:
+                    # Full jitter keeps concurrent workers from retrying in lockstep
+                    delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+                attempt += 1
+                self.retries += 1
+                REGISTRY.incr('openai_retries')
+                time.sleep(delay)
@@ -0,0 +1,79 @@
+import time
+from queue import Queue
+from database_client import DbClient
+
+class Reindexer:
+    """Moves searches over to the LLM's embed model without downtime.
+
+    Chunks with no embedding under the model are fetched in id order, a
+    batch at a time, and committed as soon as they are embedded, so an
+    interrupted run resumes with only the chunks still missing. Meanwhile
+    the active model keeps serving searches and new chunks are embedded
+    with both. Once the backfill is complete the model is made active in
+    one transaction. The old model is kept, and still written, so switching
+    back is another cheap run; the drop_model command deletes it.
+    """
+
+    def __init__(self, db_client: DbClient, llm, message_queue: Queue = None, batch_size: int = 256):
+        self.db_client = db_client
+        self.llm = llm
+        self.message_queue = message_queue
+        self.batch_size = batch_size
+        self.embedded = 0
+        self.switched = False
+
+    def report(self, message: str):
+        if self.message_queue is not None:
+            self.message_queue.put(message)
+        else:
+            print(message)
+
+    def backfill(self, model: str) -> int:
+        total = self.db_client.count_missing_embeddings(model)
+        if total == 0:
+            return 0
+
+        start = time.time()
+        last_id, done = 0, 0
+        while batch := self.db_client.get_missing_chunks(model, last_id, self.batch_size):
+            last_id = batch[-1][0]
+            texts = {}
+            for _, _, _, h, content in batch:
+                texts.setdefault(h, content)
+            vectors = dict(zip(texts, self.llm.embed_many(list(texts.values()), model)))
+            self.db_client.add_chunk_embeddings(model, [
+                {'note_id': note_id, 'vault_id': vault_id, 'content_hash': h, 'embedding': vectors[h]}
+                for _, note_id, vault_id, h, _ in batch
+            ])
+            done += len(batch)
+
+            rate = done / max(time.time() - start, 1e-6)
+            self.report(f'Embedded {done}/{total} chunks with {model} ({rate:.1f} chunks/s)')
+        return done
+
+    def run(self) -> int:
+        model = self.llm.embed_model
+        active = self.db_client.active_model()
+        self.embedded = self.backfill(model)
+        if active is None or active[0] == model:
+            if self.embedded == 0:
+                self.report(f'All chunks are embedded with {model}')
+            return self.embedded
+
+        # Ingests that started before the model was registered did not
+        # write it, so their chunks get one more pass
+        self.embedded += self.backfill(model)
+        missing = self.db_client.count_missing_embeddings(model)
+        if model not in self.db_client.get_models():
+            self.report(f'No chunks to embed with {model}, searches stay on {active[0]}')
+            return self.embedded
+        if missing:
+            self.report(f'{missing} chunks still lack {model} embeddings, searches stay on {active[0]}; '
+                        'run reindex again')
+            return self.embedded
+
+        self.db_client.switch_model(model)
+        self.switched = True
+        self.report(f'Searches now use {model}. {active[0]} is kept and still written, '
+                    f'drop it with drop_model {active[0]}')
+        return self.embedded
@@ -0,0 +1,122 @@
+import numpy as np
+from queue import Queue
+from typing import List
+from itertools import islice
+from models import EMBEDDING_DIM
+from database_client import DbClient
+
+TAG_SYSTEM_PROMPT = ('You assign tags to notes. Reply with at most {max_tags} short, lowercase, '
+                     'comma-separated tags and nothing else. Prefer these existing tags where '
+                     'they fit: {existing}')
+
+class TagSuggester:
+    """Proposes tags by k-nearest-neighbour voting over tagged notes.
+
+    Each of the k most similar tagged notes votes for its tags with its
+    cosine similarity. A tag is accepted when its share of the total vote
+    reaches min_confidence. Only notes where no tag does fall back to the
+    chat model. Notes tagged during a bulk run become voters for later ones.
+    """
+
+    def __init__(self, db_client: DbClient, llm, k: int = 10, min_confidence: float = 0.5,
+                 max_tags: int = 5):
+        self.db_client = db_client
+        self.llm = llm
+        self.k = k
+        self.min_confidence = min_confidence
+        self.max_tags = max_tags
+        self.knn_tagged = 0
+        self.llm_tagged = 0
+        self.load()
+
+    def load(self):
+        ids, vectors, tags = [], [], []
+        for note_id, embedding, names in self.db_client.get_tagged_embeddings():
+            ids.append(note_id)
+            vectors.append(embedding)
+            tags.append(list(names))
+        self.tagged_ids = ids
+        self.tagged_tags = tags
+        active = self.db_client.active_model()
+        self.dim = active[1] if active is not None else EMBEDDING_DIM
+        self.matrix = self.normalize(np.asarray(vectors, dtype=np.float32).reshape(len(vectors), self.dim))
+        self.tag_names = set(self.db_client.get_tag_names())
+
+    @staticmethod
+    def normalize(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        return vectors / np.where(norms == 0, 1, norms)
+
+    def vote(self, embeddings: np.ndarray) -> List[List[str]]:
+        if len(self.tagged_ids) == 0:
+            return [[] for _ in embeddings]
+
+        scores = self.normalize(embeddings) @ self.matrix.T
+        k = min(self.k, len(self.tagged_ids))
+        results = []
+        for row in scores:
+            top = np.argpartition(-row, k - 1)[:k]
+            votes = {}
+            for i in top:
+                weight = max(float(row[i]), 0.0)
+                for tag in self.tagged_tags[i]:
+                    votes[tag] = votes.get(tag, 0.0) + weight
+            total = sum(max(float(row[i]), 0.0) for i in top) or 1.0
+            accepted = sorted((tag for tag, v in votes.items() if v / total >= self.min_confidence),
+                              key=lambda tag: -votes[tag])
+            results.append(accepted[:self.max_tags])
+        return results
+
+    def ask_llm(self, content: str) -> List[str]:
+        system_prompt = TAG_SYSTEM_PROMPT.format(max_tags=self.max_tags,
+                                                 existing=', '.join(sorted(self.tag_names)) or 'none')
+        reply = self.llm.chat(system_prompt, content)
+        tags = [tag.strip().strip('#').lower()[:50] for tag in reply.split(',')]
+        return [tag for tag in tags if tag][:self.max_tags]
+
+    def suggest(self, note_ids: List[int], embeddings: List[List[float]]) -> dict:
+        """Returns note id -> (tags, source) where source is 'knn' or 'llm'."""
+        suggestions = {}
+        voted = self.vote(np.asarray(embeddings, dtype=np.float32).reshape(len(embeddings), self.dim))
+        fallback = [note_id for note_id, tags in zip(note_ids, voted) if not tags]
+        contents = self.db_client.get_contents(fallback) if fallback else {}
+        for note_id, tags in zip(note_ids, voted):
+            if tags:
+                suggestions[note_id] = (tags, 'knn')
+                self.knn_tagged += 1
+            elif contents.get(note_id):
+                suggestions[note_id] = (self.ask_llm(contents[note_id]), 'llm')
+                self.llm_tagged += 1
+        return suggestions
+
+    def remember(self, note_ids: List[int], embeddings: List[List[float]], suggestions: dict):
+        # Newly tagged notes vote for the notes that come after them
+        rows = [(note_id, embedding) for note_id, embedding in zip(note_ids, embeddings)
+                if suggestions.get(note_id, ([], None))[0]]
+        if not rows:
+            return
+        vectors = self.normalize(np.asarray([e for _, e in rows], dtype=np.float32))
+        self.matrix = np.vstack([self.matrix, vectors])
+        for note_id, _ in rows:
+            self.tagged_ids.append(note_id)
+            self.tagged_tags.append(suggestions[note_id][0])
+            self.tag_names.update(suggestions[note_id][0])
+
+    def tag_notes(self, note_ids: List[int], embeddings: List[List[float]]) -> dict:
+        suggestions = self.suggest(note_ids, embeddings)
+        self.db_client.add_note_tags([(note_id, tag) for note_id, (tags, _) in suggestions.items()
+                                      for tag in tags])
+        self.remember(note_ids, embeddings, suggestions)
+        return suggestions
+
+    def tag_vault(self, message_queue: Queue = None, batch_size: int = 256):
+        rows = iter(self.db_client.iter_untagged_embeddings())
+        tagged = 0
+        while batch := list(islice(rows, batch_size)):
+            note_ids = [note_id for note_id, _ in batch]
+            embeddings = [embedding for _, embedding in batch]
+            tagged += len(self.tag_notes(note_ids, embeddings))
+            if message_queue is not None:
+                message_queue.put(f'Tagged {tagged} notes '
+                                  f'({self.knn_tagged} by neighbours, {self.llm_tagged} by the LLM)')
+        return tagged
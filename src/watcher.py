@@ -1,91 +1,214 @@
-import time
+import os
 from queue import Queue
 from pathlib import Path
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler, FileSystemEvent 
 from llm import LLM
-from models import Note, Tag, note_tags, note_links
+from models import Note, Tag, note_tags, note_links, DEFAULT_VAULT_ID
 from database_client import DbClient
+from cache import content_hash
+from ingest import IngestPool
+from debounce import Debouncer
+from importer import walk_notes, extract_links, is_note_file
+from catalog import NoteCatalog
+from chunking import chunk_rows, embed_new_chunks
+from local_index import LocalIndex
+from graph import LinkGraph
+from metrics import REGISTRY
 
 class NoteHandler(FileSystemEventHandler):
-    def __init__(self, db_client: DbClient, llm_client: LLM, message_queue: Queue):
+    def __init__(self, db_client: DbClient, llm_client: LLM, message_queue: Queue,
+                 catalog: NoteCatalog, batch_window: float = 0.5, workers: int = 2,
+                 max_queued: int = 256, local_index: LocalIndex = None,
+                 graph: LinkGraph = None, debounce: float = 0.25,
+                 vault_id: int = DEFAULT_VAULT_ID):
         self.db_client = db_client
+        self.vault_id = vault_id
+        self.catalog = catalog
+        self.local_index = local_index
+        self.graph = graph
         self.llm_client = llm_client
         self.message_queue = message_queue
-        self.last_modified = {}
-        self.debounce_seconds = 1
+        # File reads, embedding and db writes run on the ingest workers, the
+        # observer thread only enqueues paths. Workers collect notes for
+        # batch_window seconds and embed them together in one request.
+        self.pool = IngestPool(self.ingest, message_queue, workers, max_queued, batch_window)
+        # Editors save in bursts; each path is handed to the pool once it
+        # has been quiet for debounce seconds, so only final content is embedded
+        self.debouncer = Debouncer(self.handle_note, debounce)
+        # Every vault has its own handler, pool and debouncer
+        REGISTRY.track(f'ingest_queue_depth_v{vault_id}', self.pool.qsize)
+        REGISTRY.track(f'debounce_pending_v{vault_id}', lambda: len(self.debouncer))
         self.src_type = {
             '.md': 'Markdown',
             '': 'Folder'
         }
-        self.existing_names = self.db_client.get_all_names()
-        self.existing_files = self.db_client.get_all_filepaths()
-
-    @staticmethod
-    def get_file_info(path):
-        stat_info = path.stat()
-
-        return {
-            'creation_time': stat_info.st_ctime,
-            'last_accessed': stat_info.st_atime,
-            'file_size': stat_info.st_size
-        }
 
     def is_valid_md_file(self, path: Path) -> bool:
-        return path.is_file() and path.name.endswith('.md') and not path.name.endswith('~')
+        return path.is_file() and is_note_file(path.name)
 
-    def is_bouncing(self, event_type: str, path: Path) -> bool:
-        key = f'{event_type}_{path.name}'
-        if key in self.last_modified:
-            if time.time() - self.last_modified[key] < self.debounce_seconds:
-                return True
+    def is_existing_note(self, path: Path) -> bool:
+        return self.catalog.has_path(str(path))
+
+    def handle_note(self, path: Path):
+        # Called once per burst of events, after the path has gone quiet
+        if path.exists():
+            state = 'existing' if self.is_existing_note(path) else 'new'
+            self.message_queue.put(f"Handling {state} note: {path}")
+        self.submit(path)
+
+    def submit(self, path: Path):
+        self.pool.submit(path)
+
+    def close(self):
+        self.debouncer.close()
+        self.pool.close()
+        if self.local_index is not None:
+            self.local_index.close()
+
+    def reconcile(self, root_dir: str):
+        """Re-ingest notes that changed while the watcher was not running."""
+        stored = self.db_client.get_file_states(self.vault_id)
+        self.catalog.load(stored.keys())
+
+        # An unmounted drive or a mistyped root looks like an empty vault,
+        # and deleting its notes would also lose their tags
+        if not Path(root_dir).is_dir():
+            self.message_queue.put(f"Vault root {root_dir} is not a directory, skipping reconcile")
+            return
 
-        self.last_modified[key] = time.time()
-        return False
+        changed = walked = 0
+        for path in walk_notes(root_dir):
+            walked += 1
+            try:
+                stat_info = os.stat(path)
+            except OSError:
+                continue
+            state = stored.pop(path, None)
+            # Only files whose mtime or size moved are read and hashed, and
+            # ingest() still skips the embed when the content is unchanged
+            if state != (stat_info.st_mtime, stat_info.st_size):
+                self.submit(Path(path))
+                changed += 1
+
+        if walked == 0 and stored:
+            self.message_queue.put(f"Found no notes under {root_dir} but {len(stored)} are stored, "
+                                   f"not deleting them")
+            return
 
-    def is_existing_note(self, path: Path) -> bool:
-        return str(path) in self.existing_files
+        # Whatever is left in stored no longer exists on disk
+        self.remove_notes(list(stored.keys()))
+        self.message_queue.put(f"Reconciled vault: {changed} changed, {len(stored)} deleted")
+
+    def ingest(self, paths: list[Path]):
+        notes = []
+        deleted = []
+        for path in paths:
+            if not path.exists():
+                deleted.append(str(path))
+                continue
+            try:
+                with open(path, 'r') as f:
+                    content = f.read()
+                stat_info = path.stat()
+            except OSError as e:
+                self.message_queue.put(f"Couldn't read {path}: {e}")
+                continue
+            # TODO: Strip file extension from name and add it to extension column
+            notes.append(Note(path=str(path), name=path.name, content=content,
+                              content_hash=content_hash(content),
+                              mtime=stat_info.st_mtime, size=stat_info.st_size))
+
+        if deleted:
+            self.remove_notes(deleted)
+
+        if not notes:
+            return
 
-    def handle_existing_note(self, path: Path, event_type: str):
-        if time.time() - self.get_file_info(path)['creation_time'] < self.debounce_seconds:
+        # Skip notes whose content is byte-identical to what is stored, only
+        # refreshing their file state so the next reconcile ignores them.
+        # Notes stored before chunking existed have no chunks and go through,
+        # as do notes not yet embedded by every model being written.
+        paths = [note.path for note in notes]
+        stored = self.db_client.get_content_hashes(paths)
+        # A note whose folder now belongs to another vault is skipped as
+        # unchanged below, so its vault is moved over here first
+        self.db_client.move_to_vault(paths, self.vault_id)
+        models = self.db_client.write_models(self.llm_client.embed_model)
+        known = {model: self.db_client.get_chunk_hashes(paths, model) for model in models}
+        unchanged = [note for note in notes
+                     if stored.get(note.path) == note.content_hash
+                     and all(note.path in known[model] for model in models)]
+        self.db_client.update_file_states(
+            [{'path': note.path, 'mtime': note.mtime, 'size': note.size} for note in unchanged]
+        )
+        notes = [note for note in notes if note not in unchanged]
+        if not notes:
             return
-        note = self.db_client.get_note_by_path(str(path))
-        if note is None:
-            note = Note(path=str(path))
-        self.message_queue.put(f"Handling existing note: {path}")
-        self.message_queue.put(f"Event type: {event_type}\n")
-        with open(path, 'r') as f:
-            content = f.read()
-        embedding = self.llm_client.embed(content)
-        # TODO: Strip file extension from name and add it to extension column
-        note.name = path.name
-        note.content = content
-        note.embedding = embedding
-        self.db_client.upsert_note(note)
-
-
-    def handle_new_note(self, path: Path, event_type: str):
-        self.message_queue.put(f"Handling new note: {path}")
-        self.message_queue.put(f"Event type: {event_type}\n")
-
-        with open(path, 'r') as f:
-            content = f.read()
-
-        embedding = self.llm_client.embed(content)
-        note = Note(path=str(path), name=path.name, content=content, embedding=embedding)
-        # TODO: Strip file extension from name and add it to extension column
-        self.db_client.upsert_note(note)
-        self.existing_files.append(str(path))
+
+        # Only chunks that changed since the last ingest are embedded
+        chunks = {note.path: chunk_rows(note.content) for note in notes}
+        embeddings = {model: embed_new_chunks(self.llm_client, chunks, known[model], model) for model in models}
+        self.db_client.upsert_notes({'vault_id': self.vault_id, 'path': note.path, 'name': note.name,
+                                     'content': note.content, 'content_hash': note.content_hash,
+                                     'mtime': note.mtime, 'size': note.size} for note in notes)
+        for note in notes:
+            updated = self.db_client.sync_chunks(note.path, chunks[note.path], embeddings)
+            self.catalog.add(note.path)
+            if self.local_index is not None and updated is not None:
+                note_id, embedding = updated
+                self.local_index.upsert(note_id, note.name, note.path, embedding, note.content_hash)
+            self.update_links(note)
+
+        # New notes may already be named by notes written before them
+        incoming = self.db_client.link_incoming([note.path for note in notes if note.path not in stored])
+        if self.graph is not None and incoming:
+            self.graph.apply([tuple(edge) for edge in incoming], [])
+
+        embedded = sum(len(vectors) for vectors in embeddings.values())
+        if embedded > 1:
+            self.message_queue.put(f"Embedded {embedded} chunks from {len(notes)} notes in one batch")
+
+    def update_links(self, note: Note):
+        targets = [f'{target}.md' for target in extract_links(note.content)]
+        note_id, added, removed = self.db_client.sync_links(note.path, targets)
+        if self.graph is not None:
+            self.graph.add_node(note_id, note.name, note.path)
+            self.graph.apply([(note_id, t) for t in added], [(note_id, t) for t in removed])
+
+    def remove_notes(self, paths: list[str]):
+        note_ids = self.db_client.delete_notes_by_path(paths)
+        for path in paths:
+            self.catalog.remove(path)
+            if self.local_index is not None:
+                self.local_index.remove(path)
+        if self.graph is not None:
+            for note_id in note_ids:
+                self.graph.remove_node(note_id)
 
     def on_any_event(self, event: FileSystemEvent) -> None:
+        REGISTRY.incr('watcher_events')
         path = Path(event.src_path)
-        if not self.is_valid_md_file(path) or self.is_bouncing(event.event_type, path):
+
+        # Deleted and moved-away notes go through the debouncer as well, so
+        # they stay ordered with other events for the same path. ingest()
+        # tells removals from edits by whether the file still exists.
+        if event.event_type in ('deleted', 'moved') and self.is_existing_note(path):
+            self.message_queue.put(f"Removing note: {path}")
+            self.debouncer.touch(path)
+
+        event_type = event.event_type
+        if event_type == 'moved':
+            # Treat the destination of a move like a newly created file
+            path = Path(event.dest_path)
+            event_type = 'created'
+
+        if event_type not in ('created', 'modified') or not self.is_valid_md_file(path):
             return
 
-        if self.is_existing_note(path) and event.event_type == 'modified':
-            self.handle_existing_note(path, event.event_type)
-        elif not self.is_existing_note(path) and event.event_type == 'created':
-            self.handle_new_note(path, event.event_type)
+        # ingest() upserts by path, so a note the reconcile pass has not
+        # reached yet is handled like a new one
+        self.debouncer.touch(path)
 
 class Watcher:
     def __init__(self, event_handler: FileSystemEventHandler, root_dir: str):
@@ -99,5 +222,9 @@ class Watcher:
             while self.observer.is_alive():
                 self.observer.join(1)
         finally:
-            self.observer.stop()
+            self.stop()
+
+    def stop(self):
+        self.observer.stop()
+        if self.observer.is_alive():
             self.observer.join()
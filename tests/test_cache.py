@@ -0,0 +1,48 @@
+import time
+import pytest
+from cache import EmbeddingCache, content_hash
+
+
+@pytest.fixture
+def embeddings(tmp_path):
+    cache = EmbeddingCache(tmp_path / 'embeddings.sqlite', max_entries=10)
+    yield cache
+    cache.close()
+
+
+def test_embeddings_are_keyed_by_model(embeddings):
+    embeddings.put_many('small', {'h1': [1.0, 2.0]})
+    assert embeddings.get_many('small', ['h1', 'h2']) == {'h1': [1.0, 2.0]}
+    assert embeddings.get_many('large', ['h1']) == {}
+    assert (embeddings.hits, embeddings.misses) == (1, 2)
+
+
+def test_embeddings_persist(tmp_path):
+    cache = EmbeddingCache(tmp_path / 'embeddings.sqlite')
+    cache.put_many('small', {'h1': [0.5]})
+    cache.close()
+    cache = EmbeddingCache(tmp_path / 'embeddings.sqlite')
+    assert cache.get_many('small', ['h1']) == {'h1': [0.5]}
+    assert cache.size == 1
+    cache.close()
+
+
+def test_least_recently_used_embeddings_are_evicted(embeddings):
+    embeddings.put_many('m', {f'h{i}': [float(i)] for i in range(10)})
+    time.sleep(0.01)
+    embeddings.get_many('m', ['h0'])
+    embeddings.put_many('m', {'new': [1.0]})
+    assert embeddings.size <= 9
+    assert set(embeddings.get_many('m', ['h0', 'new'])) == {'h0', 'new'}
+    assert embeddings.get_many('m', ['h1']) == {}
+
+
+def test_many_hashes_stay_under_the_parameter_limit(embeddings):
+    embeddings.max_entries = 2000
+    items = {f'h{i}': [float(i)] for i in range(1200)}
+    embeddings.put_many('m', items)
+    assert len(embeddings.get_many('m', list(items))) == 1200
+
+
+def test_content_hash_is_sha256_hex():
+    assert content_hash('') == 'e3b0c44298fc1c149afbf4c8996fb92427ae41e4649b934ca495991b7852b855'
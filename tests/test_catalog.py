@@ -0,0 +1,38 @@
+from catalog import NoteCatalog
+
+
+def catalog():
+    c = NoteCatalog()
+    c.load(['/v/alpha.md', '/v/beta.md', '/w/alpha.md'])
+    return c
+
+
+def test_completion_by_prefix():
+    c = catalog()
+    assert c.complete_name('al') == ['alpha']
+    assert c.complete_path('/v/') == ['/v/alpha.md', '/v/beta.md']
+    assert c.complete_name('z') == []
+
+
+def test_add_and_remove_keep_lists_sorted():
+    c = catalog()
+    c.add('/v/aardvark.md')
+    c.add('/v/aardvark.md')
+    assert c.complete_name('a') == ['aardvark', 'alpha']
+    c.remove('/w/alpha.md')
+    assert c.complete_name('al') == ['alpha']
+    c.remove('/v/alpha.md')
+    assert c.complete_name('al') == []
+    c.remove('/missing.md')
+    assert len(c) == 2
+
+
+def test_match_names():
+    assert catalog().match_names('^b') == ['beta']
+
+
+def test_load_keeps_paths_added_before_it():
+    c = NoteCatalog()
+    c.add('/v/new.md')
+    c.load(['/v/old.md'])
+    assert c.has_path('/v/new.md') and c.has_path('/v/old.md')
@@ -0,0 +1,53 @@
+from cache import content_hash
+from chunking import split_chunks, chunk_rows, embed_new_chunks
+
+
+def test_short_note_is_one_chunk():
+    assert split_chunks('just a line') == ['just a line']
+
+
+def test_splits_on_headings():
+    assert split_chunks('intro\n# One\nfirst\n## Two\nsecond') == ['intro', '# One\nfirst', '## Two\nsecond']
+
+
+def test_packs_paragraphs_up_to_the_limit():
+    content = '\n\n'.join(['a' * 40, 'b' * 40, 'c' * 40])
+    assert split_chunks(content, max_chars=90) == ['a' * 40 + '\n\n' + 'b' * 40, 'c' * 40]
+
+
+def test_hard_split_keeps_order():
+    content = 'short para one\n\n' + 'x' * 9000 + '\n\ntail'
+    assert split_chunks(content) == ['short para one', 'x' * 4000, 'x' * 4000, 'x' * 1000 + '\n\ntail']
+
+
+def test_chunk_rows_hash_each_chunk():
+    rows = chunk_rows('# A\none\n# B\ntwo')
+    assert [row['position'] for row in rows] == [0, 1]
+    assert rows[1]['content_hash'] == content_hash('# B\ntwo')
+
+
+class RecordingLLM:
+    embed_model = 'm'
+
+    def __init__(self):
+        self.inputs = []
+
+    def embed_many(self, inputs, model=None):
+        self.inputs.append((list(inputs), model))
+        return [[float(len(text))] for text in inputs]
+
+
+def test_embed_new_chunks_skips_known_hashes():
+    chunks = {'a.md': chunk_rows('# A\none\n# B\ntwo'), 'b.md': chunk_rows('# B\ntwo\n# C\nthree')}
+    llm = RecordingLLM()
+    embeddings = embed_new_chunks(llm, chunks, {'a.md': {content_hash('# A\none')}}, model='m')
+    # A hash shared by two notes is embedded once
+    assert set(embeddings) == {content_hash('# B\ntwo'), content_hash('# C\nthree')}
+    assert llm.inputs == [(['# B\ntwo', '# C\nthree'], 'm')]
+
+
+def test_embed_new_chunks_with_nothing_new_makes_no_request():
+    chunks = {'a.md': chunk_rows('one')}
+    llm = RecordingLLM()
+    assert embed_new_chunks(llm, chunks, {'a.md': {content_hash('one')}}) == {}
+    assert llm.inputs == []
@@ -0,0 +1,113 @@
+import numpy as np
+import pytest
+from cli import NoteCLI
+from local_index import LocalIndex
+from models import Note
+
+
+class DownDb:
+    """Every call fails, as with Postgres unreachable."""
+
+    def __getattr__(self, name):
+        def fail(*args, **kwargs):
+            raise ConnectionError('database is down')
+        return fail
+
+
+class NotesDb:
+    def __init__(self, notes, vaults):
+        self.notes = notes
+        self.vaults = vaults
+
+    def get_vaults(self):
+        return self.vaults
+
+    def get_notes_by_name(self, name, vault_ids=None):
+        name = name if name.endswith('.md') else f'{name}.md'
+        return [note for note in self.notes
+                if note.name == name and (vault_ids is None or note.vault_id in vault_ids)]
+
+
+def cli(db_client, **kwargs):
+    return NoteCLI(db_client, None, None, None, **kwargs)
+
+
+def test_link_uses_the_local_index_without_postgres(tmp_path, capsys):
+    index = LocalIndex(tmp_path, dim=2)
+    index.build([(1, 'a.md', '/v/a.md', 'ha', [1.0, 0.0]), (2, 'b.md', '/v/b.md', 'hb', [0.9, 0.1])])
+    cli(DownDb(), local_index=index).do_link('a 1')
+    assert capsys.readouterr().out.startswith('b.md')
+
+
+def notes_cli():
+    notes = [Note(id=1, vault_id=1, name='index.md', path='/v/projects/index.md'),
+             Note(id=2, vault_id=1, name='index.md', path='/v/archive/index.md'),
+             Note(id=3, vault_id=2, name='index.md', path='/w/index.md'),
+             Note(id=4, vault_id=1, name='solo.md', path='/v/solo.md')]
+    return cli(NotesDb(notes, {'default': 1, 'work': 2}), vault_roots={'default': '/v', 'work': '/w'})
+
+
+def test_duplicates_are_reported_by_path(capsys):
+    notes = notes_cli()
+    assert notes.resolve_note(*notes.scoped_name('default:index')) is None
+    out = capsys.readouterr().out
+    assert 'default:projects/index' in out and 'default:archive/index' in out
+
+
+@pytest.mark.parametrize('name, note_id', [
+    ('solo', 4),
+    ('work:index', 3),
+    ('default:projects/index', 1),
+    ('archive/index', 2),
+    ('/v/archive/index.md', 2),
+])
+def test_qualified_names_pick_one_note(name, note_id):
+    notes = notes_cli()
+    assert notes.resolve_note(*notes.scoped_name(name)).id == note_id
+
+
+def test_folder_that_does_not_match(capsys):
+    notes = notes_cli()
+    assert notes.resolve_note(*notes.scoped_name('drafts/index')) is None
+    assert 'not found' in capsys.readouterr().out
+
+
+def test_vault_scope_applies_to_plain_names():
+    notes = notes_cli()
+    notes.vault_ids = [2]
+    assert notes.resolve_note(*notes.scoped_name('index')).id == 3
+
+
+class StreamingLlm:
+    def __init__(self, parts, error=None):
+        self.parts = parts
+        self.error = error
+
+    def chat_stream(self, system_prompt, content, use_cache=True):
+        yield from self.parts
+        if self.error is not None:
+            raise self.error
+
+
+def test_failed_stream_keeps_the_previous_response(tmp_path, capsys):
+    sidecar = tmp_path / 'note.llm.md'
+    sidecar.write_text('earlier critique')
+    llm = StreamingLlm(['partial '], error=ConnectionError('connection reset'))
+    assert not NoteCLI(None, llm, None, None).stream_to_file('system', 'note', sidecar)
+    assert sidecar.read_text() == 'earlier critique'
+    assert list(tmp_path.iterdir()) == [sidecar]
+    assert "Couldn't get a response: connection reset" in capsys.readouterr().out
+
+
+def test_completed_stream_replaces_the_response(tmp_path):
+    sidecar = tmp_path / 'note.llm.md'
+    sidecar.write_text('earlier critique')
+    llm = StreamingLlm(['new ', 'critique'])
+    assert NoteCLI(None, llm, None, None).stream_to_file('system', 'note', sidecar)
+    assert sidecar.read_text() == 'new critique'
+    assert list(tmp_path.iterdir()) == [sidecar]
+
+
+def test_ask_reports_errors(capsys):
+    NoteCLI(None, StreamingLlm([], error=ConnectionError('no network')), None, None).do_ask('why')
+    assert "Couldn't get a response: no network" in capsys.readouterr().out
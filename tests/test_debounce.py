@@ -0,0 +1,59 @@
+import threading
+import time
+from pathlib import Path
+from debounce import Debouncer
+
+
+class Fired:
+    def __init__(self):
+        self.paths = []
+        self.event = threading.Event()
+
+    def __call__(self, path):
+        self.paths.append((path, time.monotonic()))
+        self.event.set()
+
+
+def test_burst_fires_once_after_the_last_event():
+    fired = Fired()
+    debouncer = Debouncer(fired, delay=0.05, max_wait=5.0)
+    for _ in range(5):
+        debouncer.touch(Path('a.md'))
+        last = time.monotonic()
+        time.sleep(0.01)
+    assert fired.event.wait(1)
+    time.sleep(0.1)
+    debouncer.close()
+    assert [path for path, _ in fired.paths] == [Path('a.md')]
+    assert fired.paths[0][1] - last >= 0.04
+    assert len(debouncer) == 0
+
+
+def test_paths_fire_independently():
+    fired = Fired()
+    debouncer = Debouncer(fired, delay=0.02)
+    debouncer.touch(Path('a.md'))
+    debouncer.touch(Path('b.md'))
+    time.sleep(0.2)
+    debouncer.close()
+    assert sorted(path for path, _ in fired.paths) == [Path('a.md'), Path('b.md')]
+
+
+def test_steady_writes_fire_after_max_wait():
+    fired = Fired()
+    debouncer = Debouncer(fired, delay=0.05, max_wait=0.15)
+    start = time.monotonic()
+    while not fired.event.is_set() and time.monotonic() - start < 1:
+        debouncer.touch(Path('a.md'))
+        time.sleep(0.01)
+    debouncer.close()
+    assert fired.event.is_set()
+    assert fired.paths[0][1] - start < 0.5
+
+
+def test_close_fires_pending_paths():
+    fired = Fired()
+    debouncer = Debouncer(fired, delay=60)
+    debouncer.touch(Path('a.md'))
+    debouncer.close()
+    assert [path for path, _ in fired.paths] == [Path('a.md')]
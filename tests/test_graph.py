@@ -0,0 +1,40 @@
+from graph import LinkGraph
+
+
+def graph():
+    g = LinkGraph()
+    g.load([(1, 'a.md', '/a.md'), (2, 'b.md', '/b.md'), (3, 'c.md', '/c.md'), (4, 'd.md', '/d.md')],
+           [(1, 2), (2, 3), (3, 2)])
+    return g
+
+
+def test_backlinks_and_neighbors():
+    g = graph()
+    assert sorted(g.backlinks(2)) == [1, 3]
+    assert g.neighbors(1) == [(2, 1)]
+    assert g.neighbors(1, depth=2) == [(2, 1), (3, 2)]
+    assert g.orphans() == [4]
+
+
+def test_edits_apply_on_the_next_query():
+    g = graph()
+    g.add_node(5, 'e.md', '/e.md')
+    g.apply([(5, 4)], [(1, 2)])
+    assert g.backlinks(2) == [3]
+    assert g.backlinks(4) == [5]
+    assert g.orphans() == [1]
+
+
+def test_removed_node_takes_its_edges():
+    g = graph()
+    g.remove_node(2)
+    assert g.backlinks(3) == []
+    assert g.neighbors(2) == []
+    assert sorted(g.orphans()) == [1, 3, 4]
+
+
+def test_find_returns_every_note_with_the_name():
+    g = graph()
+    g.add_node(6, 'a.md', '/other/a.md')
+    assert sorted(g.find('a')) == [1, 6]
+    assert g.find('missing') == []
@@ -0,0 +1,65 @@
+import queue
+import threading
+import time
+from pathlib import Path
+from ingest import IngestPool
+
+
+class Recorder:
+    def __init__(self, fail_on=None):
+        self.batches = []
+        self.lock = threading.Lock()
+        self.fail_on = fail_on
+
+    def __call__(self, paths):
+        with self.lock:
+            self.batches.append((threading.current_thread().name, list(paths)))
+        if self.fail_on in paths:
+            raise RuntimeError('boom')
+
+
+def test_burst_is_batched_and_deduplicated():
+    ingest = Recorder()
+    pool = IngestPool(ingest, queue.Queue(), workers=1, batch_window=0.2)
+    for name in ['a.md', 'b.md', 'a.md', 'c.md']:
+        pool.submit(Path(name))
+    pool.close()
+    # A repeated path moves to its latest position
+    assert ingest.batches == [('ingest-0', [Path('b.md'), Path('a.md'), Path('c.md')])]
+
+
+def test_a_path_always_goes_to_the_same_worker():
+    ingest = Recorder()
+    pool = IngestPool(ingest, queue.Queue(), workers=4, batch_window=0.01)
+    for _ in range(3):
+        for i in range(20):
+            pool.submit(Path(f'{i}.md'))
+        time.sleep(0.05)
+    pool.close()
+    workers = {}
+    for worker, paths in ingest.batches:
+        for path in paths:
+            workers.setdefault(path, set()).add(worker)
+    assert len(workers) == 20
+    assert all(len(names) == 1 for names in workers.values())
+
+
+def test_max_batch_caps_a_batch():
+    ingest = Recorder()
+    pool = IngestPool(ingest, queue.Queue(), workers=1, batch_window=0.2, max_batch=3)
+    for i in range(7):
+        pool.submit(Path(f'{i}.md'))
+    pool.close()
+    assert [len(paths) for _, paths in ingest.batches] == [3, 3, 1]
+
+
+def test_errors_are_reported_and_the_worker_keeps_going():
+    messages = queue.Queue()
+    ingest = Recorder(fail_on=Path('bad.md'))
+    pool = IngestPool(ingest, messages, workers=1, batch_window=0)
+    pool.submit(Path('bad.md'))
+    time.sleep(0.05)
+    pool.submit(Path('good.md'))
+    pool.close()
+    assert [paths for _, paths in ingest.batches] == [[Path('bad.md')], [Path('good.md')]]
+    assert 'boom' in messages.get_nowait()
@@ -0,0 +1,58 @@
+import random
+import threading
+import time
+from fake_llm import FakeOpenAI
+from llm import LLM
+from ratelimit import RateLimiter
+
+
+class ShuffledEmbeddings:
+    """FakeOpenAI embeddings answering batches in random time and order."""
+
+    def __init__(self, dim: int = 8):
+        self.fake = FakeOpenAI(dim=dim).embeddings
+        self.lock = threading.Lock()
+        self.in_flight = self.peak = 0
+        self.batches = []
+
+    def create(self, model, input):
+        with self.lock:
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+            self.batches.append(list(input))
+        try:
+            time.sleep(random.uniform(0, 0.02))
+            response = self.fake.create(model, input)
+            random.shuffle(response.data)
+            return response
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+
+def llm(embeddings, concurrency: int = 4, batch_tokens: int = 30):
+    client = FakeOpenAI(dim=8)
+    client.embeddings = embeddings
+    return LLM('chat', 'embed', None, batch_tokens=batch_tokens,
+               rate_limiter=RateLimiter(concurrency=concurrency), llm_client=client)
+
+
+def test_concurrent_batches_keep_input_order():
+    embeddings = ShuffledEmbeddings()
+    texts = [f'note {i} about topic {i % 7}' for i in range(60)]
+    result = llm(embeddings).request_embeddings(texts, 'embed')
+    assert len(embeddings.batches) > 4
+    assert result == [embeddings.fake.vector(text) for text in texts]
+
+
+def test_concurrency_is_capped():
+    embeddings = ShuffledEmbeddings()
+    llm(embeddings, concurrency=2).request_embeddings([f'text {i}' for i in range(40)], 'embed')
+    assert 1 <= embeddings.peak <= 2
+
+
+def test_embed_many_sends_each_distinct_text_once():
+    embeddings = ShuffledEmbeddings()
+    result = llm(embeddings, batch_tokens=10_000).embed_many(['a', 'b', 'a'], 'other')
+    assert embeddings.batches == [['a', 'b']]
+    assert result[0] == result[2] == embeddings.fake.vector('a')
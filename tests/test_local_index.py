@@ -0,0 +1,144 @@
+import numpy as np
+from local_index import LocalIndex
+
+
+def vector(*values, dim=4):
+    v = np.zeros(dim, dtype=np.float32)
+    v[:len(values)] = values
+    return v
+
+
+def rows():
+    return [(1, 'a.md', '/v/a.md', 'ha', vector(1)),
+            (2, 'b.md', '/v/b.md', 'hb', vector(0, 1)),
+            (3, 'c.md', '/v/c.md', 'hc', vector(0, 0, 1))]
+
+
+def test_search_ranks_by_cosine(tmp_path):
+    index = LocalIndex(tmp_path, dim=4)
+    index.build(rows())
+    hits = index.search_many(vector(1, 0.1), n=2)[0]
+    assert [hit.id for hit in hits] == [1, 2]
+    # The note itself is left out
+    assert {hit.id for hit in index.search_similar_to_name('a', n=5)} == {2, 3}
+
+
+def test_changes_survive_an_unclean_exit(tmp_path):
+    index = LocalIndex(tmp_path, dim=4)
+    index.build(rows())
+    index.upsert(4, 'd.md', '/v/d.md', vector(1, 1), 'hd')
+    index.remove('/v/a.md')
+    index.upsert(2, 'b.md', '/v/b.md', vector(0, 1, 1), 'hb2')
+    index.matrix.flush()
+    # No close(): only meta.log knows about the changes above
+
+    reopened = LocalIndex(tmp_path, dim=4)
+    assert sorted(zip(reopened.ids, reopened.paths, reopened.hashes)) == \
+        [(2, '/v/b.md', 'hb2'), (3, '/v/c.md', 'hc'), (4, '/v/d.md', 'hd')]
+    # Row metadata still lines up with the vectors
+    assert reopened.search_many(vector(1, 1), n=1)[0][0].id == 4
+    assert reopened.search_many(vector(0, 0, 1), n=1)[0][0].id == 3
+
+
+def test_torn_journal_line_is_ignored(tmp_path):
+    index = LocalIndex(tmp_path, dim=4)
+    index.build(rows())
+    index.remove('/v/c.md')
+    index.matrix.flush()
+    with open(tmp_path / 'meta.log', 'a') as f:
+        f.write('[5, "e.md", "/v/e')
+
+    reopened = LocalIndex(tmp_path, dim=4)
+    assert sorted(reopened.ids) == [1, 2]
+
+
+def test_saved_journal_is_not_replayed_twice(tmp_path):
+    index = LocalIndex(tmp_path, dim=4)
+    index.build(rows())
+    index.remove('/v/a.md')
+    index.close()
+    assert sorted(LocalIndex(tmp_path, dim=4).ids) == [2, 3]
+    assert sorted(LocalIndex(tmp_path, dim=4).ids) == [2, 3]
+
+
+def test_stale_compares_with_stored_notes(tmp_path):
+    index = LocalIndex(tmp_path, dim=4)
+    index.build(rows())
+    removed, reload = index.stale([(1, '/v/a.md', 'ha'), (2, '/v/b.md', 'changed'), (5, '/v/e.md', 'he')])
+    assert removed == ['/v/c.md']
+    assert sorted(reload) == [2, 5]
+
+
+def test_other_dim_starts_empty(tmp_path):
+    index = LocalIndex(tmp_path, dim=4)
+    index.build(rows())
+    index.close()
+    assert len(LocalIndex(tmp_path, dim=8)) == 0
+
+    index = LocalIndex(tmp_path, dim=4)
+    index.build([(1, 'a.md', '/v/a.md', 'ha', vector(1, dim=8))], dim=8)
+    assert index.dim == 8 and len(index) == 1
+    # A vector of the old size, written before a rebuild, is skipped
+    index.upsert(2, 'b.md', '/v/b.md', vector(1), 'hb')
+    assert len(index) == 1
+
+
+def test_duplicate_names_are_not_resolved_locally(tmp_path):
+    index = LocalIndex(tmp_path, dim=4)
+    index.build(rows() + [(4, 'a.md', '/w/a.md', 'ha', vector(1, 1))])
+    assert index.find_by_name('a') is None
+    assert index.find_by_name('b') is not None
+
+
+class StoredNotes:
+    def __init__(self, rows, dim=4):
+        self.rows = rows
+        self.dim = dim
+
+    def active_model(self):
+        return 'model', self.dim
+
+    def iter_note_embeddings(self, note_ids=None):
+        return [row for row in self.rows if note_ids is None or row[0] in note_ids]
+
+    def get_embedded_notes(self):
+        return [(note_id, path, note_hash) for note_id, _, path, note_hash, _ in self.rows]
+
+
+def test_refresh_loads_notes_written_while_stopped(tmp_path):
+    from main import sync_local_index
+
+    index = LocalIndex(tmp_path, dim=4)
+    sync_local_index(index, StoredNotes(rows()))
+    assert sorted(index.ids) == [1, 2, 3]
+
+    # importer.py adds d, changes b and deletes c with the index closed
+    stored = [row for row in rows() if row[0] != 3]
+    stored[1] = (2, 'b.md', '/v/b.md', 'hb2', vector(1, 1))
+    stored.append((4, 'd.md', '/v/d.md', 'hd', vector(0, 0, 0, 1)))
+    sync_local_index(index, StoredNotes(stored))
+    assert sorted(zip(index.ids, index.hashes)) == [(1, 'ha'), (2, 'hb2'), (4, 'hd')]
+    assert index.search_many(vector(0, 0, 0, 1), n=1)[0][0].id == 4
+
+
+def test_opens_from_disk_at_the_saved_dim(tmp_path):
+    index = LocalIndex(tmp_path, dim=4)
+    index.build(rows())
+    index.close()
+    reopened = LocalIndex(tmp_path)
+    assert reopened.dim == 4 and len(reopened) == 3
+
+
+def test_refresh_rebuilds_for_another_model_and_reports_errors(tmp_path):
+    import queue
+    from main import refresh_local_index
+
+    index = LocalIndex(tmp_path, dim=4)
+    index.build(rows())
+    refresh_local_index(index, StoredNotes([(1, 'a.md', '/v/a.md', 'ha', vector(1, dim=8))], dim=8))
+    assert index.dim == 8 and index.ids == [1]
+
+    messages = queue.Queue()
+    refresh_local_index(index, object(), messages)
+    assert "Couldn't refresh" in messages.get_nowait()
+    assert index.ids == [1]
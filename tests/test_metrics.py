@@ -0,0 +1,36 @@
+import pytest
+from metrics import Metrics, Histogram
+
+
+def test_percentiles_are_close():
+    h = Histogram()
+    for i in range(1, 1001):
+        h.observe(i / 1000)
+    assert h.percentile(0.5) == pytest.approx(0.5, rel=0.15)
+    assert h.percentile(0.99) == pytest.approx(0.99, rel=0.15)
+    assert h.percentile(1.0) <= h.max == 1.0
+    assert Histogram().percentile(0.5) is None
+
+
+def test_report_and_prometheus():
+    metrics = Metrics()
+    metrics.incr('events', 2)
+    metrics.track('depth', lambda: 3)
+    metrics.track('broken', lambda: 1 / 0)
+    with metrics.timer('work'):
+        pass
+    report = metrics.report()
+    assert 'events' in report and 'work' in report and 'depth' in report
+    text = metrics.prometheus()
+    assert 'neonota_events_total 2' in text
+    assert 'neonota_depth 3' in text
+    assert 'neonota_work_count 1' in text
+    assert 'broken' not in text
+
+
+def test_write_prometheus(tmp_path):
+    metrics = Metrics()
+    metrics.incr('events')
+    path = tmp_path / 'metrics.prom'
+    metrics.write_prometheus(str(path))
+    assert 'neonota_events_total 1' in path.read_text()
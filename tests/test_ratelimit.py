@@ -0,0 +1,104 @@
+import time
+import openai
+import pytest
+import ratelimit
+from types import SimpleNamespace
+from ratelimit import RateLimiter, TokenBucket
+
+# Only the attributes the SDK's errors and retry_after() read
+REQUEST = SimpleNamespace(method='POST', url='https://api.openai.com/v1/embeddings')
+
+
+def status_error(cls, status: int, retry_after: str = None):
+    headers = {'retry-after': retry_after} if retry_after is not None else {}
+    response = SimpleNamespace(status_code=status, headers=headers, request=REQUEST)
+    return cls(f'status {status}', response=response, body=None)
+
+
+class Endpoint:
+    """Fails with the given errors in turn, then answers."""
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    def __call__(self, **kwargs):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return 'ok'
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    # Backoff sleeps are recorded instead of slept
+    recorded = []
+    monkeypatch.setattr(ratelimit.time, 'sleep', recorded.append)
+    return recorded
+
+
+def test_retries_429_with_retry_after(sleeps):
+    endpoint = Endpoint(status_error(openai.RateLimitError, 429, '2.5'))
+    limiter = RateLimiter(max_retries=3)
+    assert limiter.call(endpoint, 10, input=['a']) == 'ok'
+    assert endpoint.calls == 2
+    assert sleeps == [2.5]
+    assert limiter.retries == 1
+
+
+def test_retries_5xx_with_backoff(sleeps):
+    endpoint = Endpoint(status_error(openai.InternalServerError, 500),
+                        status_error(openai.InternalServerError, 503))
+    limiter = RateLimiter(base_delay=1.0, max_delay=30.0)
+    assert limiter.call(endpoint, 10) == 'ok'
+    assert endpoint.calls == 3
+    # Full jitter within the exponential cap of each attempt
+    assert 0 <= sleeps[0] <= 1.0 and 0 <= sleeps[1] <= 2.0
+
+
+def test_retries_connection_errors(sleeps):
+    endpoint = Endpoint(openai.APIConnectionError(request=REQUEST))
+    assert RateLimiter().call(endpoint, 10) == 'ok'
+    assert endpoint.calls == 2
+
+
+@pytest.mark.parametrize('cls, status', [(openai.BadRequestError, 400),
+                                         (openai.AuthenticationError, 401),
+                                         (openai.NotFoundError, 404)])
+def test_client_errors_are_not_retried(sleeps, cls, status):
+    endpoint = Endpoint(status_error(cls, status, '1'))
+    with pytest.raises(cls):
+        RateLimiter().call(endpoint, 10)
+    assert endpoint.calls == 1
+    assert sleeps == []
+
+
+def test_gives_up_after_max_retries(sleeps):
+    endpoint = Endpoint(*[status_error(openai.RateLimitError, 429, '0') for _ in range(5)])
+    with pytest.raises(openai.RateLimitError):
+        RateLimiter(max_retries=2).call(endpoint, 10)
+    assert endpoint.calls == 3
+
+
+def test_bucket_waits_for_refill():
+    bucket = TokenBucket(6000)  # 100 per second
+    bucket.acquire(6000)
+    start = time.monotonic()
+    bucket.acquire(10)
+    assert time.monotonic() - start >= 0.08
+
+
+def test_bucket_caps_requests_larger_than_capacity():
+    bucket = TokenBucket(6000)
+    start = time.monotonic()
+    bucket.acquire(1_000_000)
+    assert time.monotonic() - start < 0.05
+    assert bucket.tokens < 1
+
+
+def test_limiter_waits_on_the_token_budget():
+    limiter = RateLimiter(tokens_per_minute=6000)
+    limiter.call(Endpoint(), 6000)
+    start = time.monotonic()
+    limiter.call(Endpoint(), 20)
+    assert time.monotonic() - start >= 0.15
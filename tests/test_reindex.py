@@ -0,0 +1,92 @@
+import queue
+from cli import NoteCLI
+from reindex import Reindexer
+
+
+class MemoryDb:
+    """Chunks and per-model embeddings, with the DbClient calls Reindexer makes."""
+
+    def __init__(self, chunks, models):
+        # chunks: id -> content; models: name -> (dim, active)
+        self.chunks = chunks
+        self.models = dict(models)
+        self.embeddings = {model: {} for model in models}
+        self.dropped = []
+
+    def active_model(self):
+        return next(((m, dim) for m, (dim, active) in self.models.items() if active), None)
+
+    def get_models(self):
+        return self.models
+
+    def count_missing_embeddings(self, model):
+        return sum(1 for chunk_id in self.chunks if chunk_id not in self.embeddings.get(model, {}))
+
+    def get_missing_chunks(self, model, after_id, limit):
+        missing = [chunk_id for chunk_id in sorted(self.chunks)
+                   if chunk_id > after_id and chunk_id not in self.embeddings.get(model, {})]
+        return [(chunk_id, chunk_id, 1, f'h{chunk_id}', self.chunks[chunk_id]) for chunk_id in missing[:limit]]
+
+    def add_chunk_embeddings(self, model, rows):
+        if model not in self.models:
+            self.models[model] = (len(rows[0]['embedding']), False)
+        stored = self.embeddings.setdefault(model, {})
+        for row in rows:
+            stored[int(row['content_hash'][1:])] = row['embedding']
+
+    def switch_model(self, model):
+        self.models = {m: (dim, m == model) for m, (dim, _) in self.models.items()}
+
+    def drop_model(self, model):
+        self.dropped.append(model)
+
+
+class Embedder:
+    def __init__(self, embed_model, fail=None):
+        self.embed_model = embed_model
+        self.fail = fail
+
+    def embed_many(self, inputs, model=None):
+        if self.fail is not None:
+            raise self.fail
+        return [[float(len(text)), 1.0] for text in inputs]
+
+
+def test_switch_keeps_the_old_model():
+    db = MemoryDb({1: 'a', 2: 'bb', 3: 'ccc'}, {'old': (2, True)})
+    db.embeddings['old'] = {1: [1.0, 1.0], 2: [2.0, 1.0], 3: [3.0, 1.0]}
+    messages = queue.Queue()
+    reindexer = Reindexer(db, Embedder('new'), messages, batch_size=2)
+    assert reindexer.run() == 3
+    assert reindexer.switched
+    assert db.active_model() == ('new', 2)
+    assert 'old' in db.models and db.dropped == []
+
+    # Switching back has nothing left to embed
+    back = Reindexer(db, Embedder('old'), messages)
+    assert back.run() == 0 and back.switched
+    assert db.active_model() == ('old', 2)
+
+
+def test_active_model_is_only_backfilled():
+    db = MemoryDb({1: 'a'}, {'old': (2, True)})
+    reindexer = Reindexer(db, Embedder('old'), queue.Queue())
+    assert reindexer.run() == 1
+    assert not reindexer.switched
+
+
+def test_background_reindex_reports_errors():
+    db = MemoryDb({1: 'a'}, {'old': (2, True)})
+    messages = queue.Queue()
+    cli = NoteCLI(db, Embedder('typo', fail=RuntimeError('model typo does not exist')), messages, None)
+    cli.run_reindex()
+    reported = [messages.get_nowait() for _ in range(messages.qsize())]
+    assert reported == ['Reindex stopped: model typo does not exist']
+    assert db.active_model() == ('old', 2)
+
+
+def test_drop_model_command(capsys):
+    db = MemoryDb({}, {'old': (2, False), 'new': (2, True)})
+    NoteCLI(db, None, queue.Queue(), None).do_drop_model('old')
+    assert db.dropped == ['old']
+    assert 'Dropped old' in capsys.readouterr().out
@@ -0,0 +1,23 @@
+import time
+from cache import ResponseCache
+
+
+def test_responses_are_keyed_by_prompts(tmp_path):
+    cache = ResponseCache(tmp_path / 'responses.sqlite')
+    cache.put('chat', 'system', 'user', 'answer')
+    assert cache.get('chat', 'system', 'user') == 'answer'
+    assert cache.get('chat', 'other system', 'user') is None
+    cache.put('chat', 'system', 'user', 'longer answer')
+    assert cache.size == len('longer answer')
+    cache.close()
+
+
+def test_responses_are_evicted_by_size(tmp_path):
+    cache = ResponseCache(tmp_path / 'responses.sqlite', max_bytes=100)
+    for i in range(5):
+        cache.put('chat', 'system', f'user {i}', 'x' * 30)
+        time.sleep(0.01)
+    assert cache.size <= 90
+    assert cache.get('chat', 'system', 'user 4') == 'x' * 30
+    assert cache.get('chat', 'system', 'user 0') is None
+    cache.close()
@@ -0,0 +1,102 @@
+"""Compiled SQL of vector search, checked against the indexes migrate builds.
+
+No database is needed: statements are compiled for the postgres dialect
+and compared with the DDL create_embedding_index emits.
+"""
+import re
+import pytest
+from sqlalchemy import cast, literal
+from sqlalchemy.dialects import postgresql
+from pgvector.sqlalchemy import Vector
+from database_client import DbClient, HNSW_EF_SEARCH_DEFAULT
+from migrate import create_embedding_index, index_mode
+from models import NoteEmbedding
+
+OPERATORS = {'vector_cosine_ops': '<=>', 'halfvec_cosine_ops': '<=>', 'bit_hamming_ops': '<~>'}
+
+
+class Recorder:
+    """Stands in for a connection or session, keeping the SQL it is given."""
+
+    def __init__(self):
+        self.statements = []
+
+    def execute(self, stmt, params=None):
+        self.statements.append(str(stmt.compile(dialect=postgresql.dialect(),
+                                                compile_kwargs={'literal_binds': True})))
+
+
+def client(quantization=None, dim=8):
+    db_client = DbClient('localhost', 'notes', 'user', 'password', quantization)
+    db_client.vaults = {'default': 1, 'work': 2}
+    db_client.models = {"it's": (dim, True)}
+    return db_client
+
+
+def normalize(sql: str) -> str:
+    # CAST(x AS TYPE(n)) -> x::type(n), as the index DDL spells it
+    sql = sql.replace('note_embeddings.', '')
+    while True:
+        replaced = re.sub(r'CAST\(((?:[^()]|\([^()]*\))+?) AS (\w+)\((\d+)\)\)',
+                          lambda m: f'{m[1]}::{m[2].lower()}({m[3]})', sql)
+        if replaced == sql:
+            return sql
+        sql = replaced
+
+
+def index_ddl(quantization, dim, model, vault_id) -> tuple:
+    conn = Recorder()
+    create_embedding_index(conn, model, dim, vault_id, quantization)
+    ddl, = conn.statements
+    expression, opclass = re.search(r'USING hnsw \(\((.+)\) (\w+)\)', ddl).groups()
+    predicate = ddl.split(' WHERE ', 1)[1]
+    return expression, OPERATORS[opclass], predicate
+
+
+@pytest.mark.parametrize('quantization, dim', [(None, 8), ('halfvec', 8), ('binary', 8), (None, 3072)])
+def test_candidate_order_matches_index(quantization, dim):
+    db_client = client(quantization, dim)
+    query = cast(literal([0.0] * dim, Vector(dim)), Vector(dim))
+    candidate = db_client.candidate_distance(NoteEmbedding.embedding, query, dim)
+    stmt = db_client.chunk_candidates([NoteEmbedding.note_id], candidate, 10, "it's", [2])
+    sql = normalize(str(stmt.compile(dialect=postgresql.dialect(),
+                                     compile_kwargs={'render_postcompile': True})))
+
+    expression, operator, predicate = index_ddl(quantization, dim, "it's", 2)
+    order_by = sql.split('ORDER BY ', 1)[1]
+    assert order_by.startswith(f'{expression} {operator} ')
+    # Model and vault are literals, so the partial index predicate is implied
+    where = sql.split('WHERE ', 1)[1].split(' ORDER BY', 1)[0]
+    assert where == predicate
+
+
+def test_candidate_scan_per_vault():
+    db_client = client()
+    query = cast(literal([0.0] * 8, Vector(8)), Vector(8))
+    candidate = db_client.candidate_distance(NoteEmbedding.embedding, query, 8)
+    sql = str(db_client.chunk_candidates([NoteEmbedding.note_id], candidate, 10, "it's", None)
+              .compile(dialect=postgresql.dialect(), compile_kwargs={'render_postcompile': True}))
+    assert 'UNION ALL' in sql
+    assert 'vault_id = 1' in sql and 'vault_id = 2' in sql
+
+
+def test_oversized_model_is_rejected():
+    with pytest.raises(ValueError):
+        index_mode('halfvec', 4096)
+    assert index_mode(None, 3072) == 'halfvec'
+
+
+@pytest.mark.parametrize('ef_search, n, expected', [
+    (None, 10, None),
+    (None, HNSW_EF_SEARCH_DEFAULT + 1, HNSW_EF_SEARCH_DEFAULT + 1),
+    (10, 5, 10),
+    (10, 20, 20),
+    (200, 20, 200),
+])
+def test_set_ef_search(ef_search, n, expected):
+    session = Recorder()
+    client().set_ef_search(session, ef_search, n)
+    if expected is None:
+        assert session.statements == []
+    else:
+        assert session.statements == [f"SELECT set_config('hnsw.ef_search', '{expected}', true) AS set_config_1"]
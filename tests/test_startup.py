@@ -0,0 +1,31 @@
+import subprocess
+import sys
+from pathlib import Path
+from lazy import Deferred
+
+SRC = Path(__file__).resolve().parent.parent / 'src'
+
+
+def test_main_defers_heavy_imports():
+    # The prompt appears after main's imports; these load in the background
+    heavy = ['sqlalchemy', 'openai', 'numpy', 'pgvector', 'watchdog']
+    result = subprocess.run([sys.executable, '-c', f'import sys, main; print([m for m in {heavy!r} if m in sys.modules])'],
+                            cwd=SRC, capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == '[]'
+
+
+def test_deferred_builds_once_on_first_use():
+    calls = []
+
+    class Service:
+        name = 'service'
+
+    def build():
+        calls.append(1)
+        return Service()
+
+    deferred = Deferred(build)
+    assert not deferred.resolved and calls == []
+    assert deferred.name == 'service'
+    assert deferred.name == 'service'
+    assert deferred.resolved and calls == [1]
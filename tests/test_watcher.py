@@ -0,0 +1,66 @@
+import os
+import queue
+import pytest
+from catalog import NoteCatalog
+from watcher import NoteHandler
+
+
+class StubDb:
+    def __init__(self, states):
+        self.states = states
+        self.deleted = []
+
+    def get_file_states(self, vault_id):
+        return dict(self.states)
+
+    def delete_notes_by_path(self, paths):
+        self.deleted.extend(paths)
+        return []
+
+
+@pytest.fixture
+def handler_for():
+    handlers = []
+
+    def make(states):
+        handler = NoteHandler(StubDb(states), None, queue.Queue(), NoteCatalog(), batch_window=0)
+        handler.submitted = []
+        handler.submit = handler.submitted.append
+        handlers.append(handler)
+        return handler
+    yield make
+    for handler in handlers:
+        handler.debouncer.close()
+        handler.pool.close()
+
+
+def messages(handler):
+    return [handler.message_queue.get_nowait() for _ in range(handler.message_queue.qsize())]
+
+
+def test_missing_root_deletes_nothing(handler_for, tmp_path):
+    handler = handler_for({str(tmp_path / 'gone' / 'a.md'): (1.0, 10)})
+    handler.reconcile(str(tmp_path / 'gone'))
+    assert handler.db_client.deleted == []
+    assert 'not a directory' in messages(handler)[0]
+    # Stored notes still complete at the prompt
+    assert handler.catalog.has_path(str(tmp_path / 'gone' / 'a.md'))
+
+
+def test_empty_root_with_stored_notes_deletes_nothing(handler_for, tmp_path):
+    handler = handler_for({str(tmp_path / 'a.md'): (1.0, 10), str(tmp_path / 'b.md'): (1.0, 10)})
+    handler.reconcile(str(tmp_path))
+    assert handler.db_client.deleted == []
+    assert 'not deleting' in messages(handler)[0]
+
+
+def test_changed_and_deleted_notes(handler_for, tmp_path):
+    kept, edited, new = tmp_path / 'kept.md', tmp_path / 'edited.md', tmp_path / 'new.md'
+    for path in (kept, edited, new):
+        path.write_text(path.name)
+    stat = os.stat(kept)
+    handler = handler_for({str(kept): (stat.st_mtime, stat.st_size), str(edited): (0.0, 0),
+                           str(tmp_path / 'gone.md'): (1.0, 10)})
+    handler.reconcile(str(tmp_path))
+    assert sorted(map(str, handler.submitted)) == [str(edited), str(new)]
+    assert handler.db_client.deleted == [str(tmp_path / 'gone.md')]